@@ -39,6 +39,11 @@ DB_NAME = os.getenv("DB_NAME")
 DB_TYPE = os.getenv("DB_TYPE", "sqlite") # Выбор СУБД ('mysql' или 'sqlite' или 'postgresql'). Значение по умолчанию - sqlite
 DB_PORT = os.getenv("DB_PORT")
 SQLITE_FILE = os.getenv("SQLITE_FILE", "fin_test_bot.db")
+# Профиль движка БД ('dev', 'prod' или 'bench', см. app/database/database.py). dev - с логированием SQL-запросов
+DB_PROFILE = os.getenv("DB_PROFILE", "prod")
+# Кэш готовых отчетов: предельный размер файлов на диске (МБ) и час ночной подготовки стандартных периодов
+REPORT_CACHE_MAX_MB = int(os.getenv("REPORT_CACHE_MAX_MB", "500"))
+REPORT_PREBUILD_HOUR = int(os.getenv("REPORT_PREBUILD_HOUR", "3"))
 # Получение id админов из .env файла, при отсутствии переменной, вернет пустой список
 ADMIN_IDS = [int(admin_id) for admin_id in os.getenv("ADMIN_IDS", "").split(",") if admin_id]
 MANAGER_TELEGRAM_ID = os.getenv("MANAGER_TELEGRAM_ID")
@@ -1,33 +1,145 @@
 ## -*- coding: utf-8 -*-
 
 import asyncio
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncConnection, AsyncEngine, AsyncSession
 from sqlalchemy.orm import sessionmaker
-from app.config import DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_TYPE, DB_PORT, SQLITE_FILE
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.util import await_only
+from app.config import DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_TYPE, DB_PORT, SQLITE_FILE, DB_PROFILE
 from app.database.models import Base
-from typing import AsyncGenerator
+from app.database.migrations import run_migrations
+from typing import AsyncGenerator, Optional
 
-# Перенесенное создание движка, чтобы его можно было использовать повторно
-def create_async_engine_from_config():
+# Профили движка БД (выбираются переменной DB_PROFILE в app/config.py):
+# dev - логирование SQL-запросов для отладки, prod - для работы бота, bench - для бенчмарков.
+ENGINE_PROFILES = {
+    "dev": {
+        "echo": True,  # логирование запросов для дебага
+        "pool_size": 5, "max_overflow": 5, "pool_timeout": 30, "pool_recycle": 1800, "pool_pre_ping": True,
+        "statement_timeout": 60,  # сек, 0 - без ограничения
+        "connect_retries": 1, "connect_backoff": 0.5,
+        "sqlite_pragmas": {"journal_mode": "WAL", "synchronous": "NORMAL", "busy_timeout": 5000, "mmap_size": 0},
+    },
+    "prod": {
+        "echo": False,
+        "pool_size": 10, "max_overflow": 20, "pool_timeout": 30, "pool_recycle": 1800, "pool_pre_ping": True,
+        "statement_timeout": 30,
+        "connect_retries": 5, "connect_backoff": 0.5,
+        "sqlite_pragmas": {"journal_mode": "WAL", "synchronous": "NORMAL", "busy_timeout": 10000,
+                           "mmap_size": 256 * 1024 * 1024},
+    },
+    "bench": {
+        "echo": False,
+        "pool_size": 20, "max_overflow": 0, "pool_timeout": 60, "pool_recycle": -1, "pool_pre_ping": False,
+        "statement_timeout": 0,
+        "connect_retries": 0, "connect_backoff": 0,
+        "sqlite_pragmas": {"journal_mode": "WAL", "synchronous": "NORMAL", "busy_timeout": 30000,
+                           "mmap_size": 1024 * 1024 * 1024},
+    },
+}
+
+
+def _database_url() -> str:
     if DB_TYPE == "mysql":
-        engine = create_async_engine(
-            f'mysql+asyncmy://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}',
-            echo=True,  # Включим логирование запросов для дебага
-        )
+        return f'mysql+asyncmy://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}'
     elif DB_TYPE == "sqlite":
-        engine = create_async_engine(
-            f'sqlite+aiosqlite:///{SQLITE_FILE}',
-            echo=True, # Включим логирование запросов для дебага
-        )
+        return f'sqlite+aiosqlite:///{SQLITE_FILE}'
     elif DB_TYPE == "postgresql":
-        engine = create_async_engine(
-            f'postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}',
-            echo=True,  # Включим логирование запросов для дебага
+        return f'postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+    raise ValueError("Некорректное значение DB_TYPE. Используйте 'mysql' или 'sqlite'.")
+
+
+def _set_sqlite_pragmas(engine, pragmas: dict):
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def _enable_sqlite_savepoints(engine):
+    """
+    Транзакции SQLite начинает SQLAlchemy, а не драйвер: pysqlite сам открывает транзакцию только
+    перед изменением данных и ломает SAVEPOINT (begin_nested), которыми пользуется UnitOfWork.joined.
+    """
+    @event.listens_for(engine.sync_engine, "connect")
+    def disable_driver_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def begin_transaction(conn):
+        conn.exec_driver_sql("BEGIN")
+
+
+def _retry_connect(engine, retries: int, backoff: float):
+    """Повтор подключения с экспоненциальной задержкой при временных ошибках соединения."""
+    @event.listens_for(engine.sync_engine, "do_connect")
+    def connect_with_retry(dialect, connection_record, cargs, cparams):
+        dbapi = dialect.loaded_dbapi
+        transient_errors = (OSError,) + tuple(getattr(dbapi, name) for name in ("OperationalError", "InterfaceError")
+                                              if hasattr(dbapi, name))
+        delay = backoff
+        for attempt in range(retries + 1):
+            try:
+                return dialect.connect(*cargs, **cparams)
+            except transient_errors as e:
+                if attempt == retries:
+                    raise
+                logging.warning(f"Ошибка подключения к БД ({e}), повтор через {delay:.1f} сек.")
+                await_only(asyncio.sleep(delay))  # не блокирует цикл событий
+                delay *= 2
+
+
+def create_engine_for_profile(url: str, profile: str):
+    """Создает асинхронный движок по URL с настройками профиля из ENGINE_PROFILES."""
+    try:
+        settings = ENGINE_PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Некорректное значение DB_PROFILE. Используйте одно из: {', '.join(ENGINE_PROFILES)}.")
+    dialect = make_url(url).get_backend_name()
+    database = make_url(url).database
+    kwargs = {"echo": settings["echo"]}
+    connect_args = {}
+
+    # SQLite в памяти живет, пока открыто соединение, поэтому пул соединений для нее не настраивается
+    if not (dialect == "sqlite" and database in (None, "", ":memory:")):
+        kwargs.update(
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=settings["pool_size"],
+            max_overflow=settings["max_overflow"],
+            pool_timeout=settings["pool_timeout"],
+            pool_recycle=settings["pool_recycle"],
+            pool_pre_ping=settings["pool_pre_ping"],
         )
-    else:
-        raise ValueError("Некорректное значение DB_TYPE. Используйте 'mysql' или 'sqlite'.")
+
+    timeout_ms = settings["statement_timeout"] * 1000
+    if timeout_ms and dialect == "postgresql":
+        connect_args["server_settings"] = {"statement_timeout": str(timeout_ms)}
+    elif timeout_ms and dialect == "mysql":
+        connect_args["init_command"] = f"SET SESSION MAX_EXECUTION_TIME={timeout_ms}"
+    if connect_args:
+        kwargs["connect_args"] = connect_args
+
+    engine = create_async_engine(url, **kwargs)
+    if dialect == "sqlite":
+        # Для SQLite ограничение времени - ожидание блокировки (busy_timeout)
+        _set_sqlite_pragmas(engine, settings["sqlite_pragmas"])
+        _enable_sqlite_savepoints(engine)
+    if settings["connect_retries"]:
+        _retry_connect(engine, settings["connect_retries"], settings["connect_backoff"])
     return engine
 
+
+# Перенесенное создание движка, чтобы его можно было использовать повторно
+def create_async_engine_from_config(profile: str = DB_PROFILE):
+    return create_engine_for_profile(_database_url(), profile)
+
 # Создание движка
 engine = create_async_engine_from_config()
 
@@ -47,10 +159,74 @@ async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
            await session.close()
 
 
+class LazySession:
+    """
+    Соединение с БД на время обработки одного апдейта, которое берется из пула при первом обращении.
+
+    На апдейт приходится не больше одного обращения к пулу, а апдейты без запросов к БД не берут
+    соединение совсем. Соединением пользуется только задача, создавшая LazySession: задачи, запущенные
+    из обработчика (create_task, gather), наследуют контекст, но одно соединение нельзя использовать
+    конкурентно (см. usable). Сессию и транзакцию поверх соединения добавляет UnitOfWork.
+    """
+
+    def __init__(self, bind: AsyncEngine = None):
+        self.bind = bind if bind is not None else engine
+        self._connection: Optional[AsyncConnection] = None
+        self._owner = asyncio.current_task()
+        self._closed = False
+
+    @property
+    def acquired(self) -> bool:
+        """Было ли взято соединение из пула."""
+        return self._connection is not None
+
+    def usable(self) -> bool:
+        """Можно ли работать с соединением в текущей задаче."""
+        return not self._closed and asyncio.current_task() is self._owner
+
+    async def connection(self) -> AsyncConnection:
+        if self._closed:
+            raise RuntimeError(f"{type(self).__name__} уже закрыта")
+        if self._connection is None:
+            self._connection = await self.bind.connect()
+        return self._connection
+
+    async def close(self) -> None:
+        """Возвращает соединение в пул (незафиксированная транзакция откатывается)."""
+        self._closed = True
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            await connection.close()
+
+
+_current_lazy_session: ContextVar[Optional[LazySession]] = ContextVar("lazy_session", default=None)
+
+
+def current_lazy_session() -> Optional[LazySession]:
+    """LazySession текущего апдейта, если ее можно использовать в текущей задаче."""
+    lazy = _current_lazy_session.get()
+    if lazy is not None and lazy.usable():
+        return lazy
+    return None
+
+
+@asynccontextmanager
+async def lazy_session(lazy: LazySession = None) -> AsyncGenerator[LazySession, None]:
+    """Делает lazy (по умолчанию новую LazySession) текущей внутри блока и закрывает ее на выходе."""
+    lazy = lazy if lazy is not None else LazySession()
+    token = _current_lazy_session.set(lazy)
+    try:
+        yield lazy
+    finally:
+        _current_lazy_session.reset(token)
+        await lazy.close()
+
 
 async def create_tables():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    # Индексы и ограничения для уже существующих таблиц (create_all их не добавляет)
+    await run_migrations(engine)
 
 async def init_db():
     await create_tables()
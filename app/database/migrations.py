@@ -0,0 +1,104 @@
+## -*- coding: utf-8 -*-
+
+"""
+Версионные миграции схемы БД.
+
+create_all создает только отсутствующие таблицы и не меняет существующие, поэтому изменения
+схемы для уже развернутых баз описываются здесь. Номер последней примененной миграции хранится
+в таблице schema_version; при запуске бота (create_tables) применяются все более новые миграции,
+каждая в своей транзакции. Миграции должны быть идемпотентными: на новой базе create_all уже
+создал все, что описано в моделях.
+"""
+
+import logging
+from datetime import datetime
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import Column, DateTime, Integer, String, Table, delete, func, insert, inspect, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.database.models import Base, AnswerOption, User, UserAnswerOptions, UserProfile, UserScore
+
+schema_version = Table(
+    'schema_version', Base.metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(255), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]  # выполняется в транзакции через run_sync
+
+
+def _model_index(model, name: str):
+    """Индекс, объявленный в модели (тот же, что создает create_all на новой базе)."""
+    return next(index for index in model.__table__.indexes if index.name == name)
+
+
+def _add_hot_path_indexes(conn: Connection) -> None:
+    """Индексы на столбцы, по которым фильтруют отчеты и поиск ответов пользователя."""
+    for model, name in [
+        (UserAnswerOptions, 'ix_user_answer_options_user_id'),
+        (UserAnswerOptions, 'ix_user_answer_options_created_at'),
+        (UserProfile, 'ix_user_profiles_user_id'),
+        (AnswerOption, 'ix_answer_options_question_id'),
+        (User, 'ix_users_created_at'),
+    ]:
+        _model_index(model, name).create(conn, checkfirst=True)
+
+
+def _unique_user_score(conn: Connection) -> None:
+    """Один балл на пользователя: удаляем дубликаты (оставляем последнюю запись) и добавляем уникальный индекс."""
+    table = UserScore.__table__
+    keep = select(func.max(table.c.id).label('id')).group_by(table.c.user_id).subquery()
+    # Вложенная производная таблица: MySQL не разрешает подзапрос к изменяемой таблице напрямую
+    result = conn.execute(delete(table).where(table.c.id.not_in(select(keep.c.id))))
+    if result.rowcount:
+        logging.warning(f"Удалено дублирующихся записей user_score: {result.rowcount}")
+    _model_index(UserScore, 'uq_user_score_user_id').create(conn, checkfirst=True)
+
+
+def _add_profile_updated_at(conn: Connection) -> None:
+    """Время изменения профиля: по нему кэш отчетов по профилям узнает об изменении данных."""
+    if 'updated_at' not in {column['name'] for column in inspect(conn).get_columns('user_profiles')}:
+        column_type = DateTime().compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE user_profiles ADD COLUMN updated_at {column_type}"))
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "Индексы для отчетов и поиска ответов", _add_hot_path_indexes),
+    Migration(2, "Уникальный user_score.user_id", _unique_user_score),
+    Migration(3, "Столбец user_profiles.updated_at", _add_profile_updated_at),
+]
+
+
+def _current_version(conn: Connection) -> int:
+    return conn.scalar(select(func.max(schema_version.c.version))) or 0
+
+
+async def run_migrations(engine: AsyncEngine, migrations: List[Migration] = None) -> int:
+    """
+    Применяет миграции новее текущей версии схемы.
+
+    Returns:
+        Версия схемы после применения миграций.
+    """
+    migrations = sorted(migrations if migrations is not None else MIGRATIONS, key=lambda m: m.version)
+    async with engine.begin() as conn:
+        await conn.run_sync(schema_version.create, checkfirst=True)
+        version = await conn.run_sync(_current_version)
+
+    for migration in migrations:
+        if migration.version <= version:
+            continue
+        async with engine.begin() as conn:
+            await conn.run_sync(migration.upgrade)
+            await conn.execute(insert(schema_version).values(
+                version=migration.version, description=migration.description, applied_at=datetime.now()))
+        version = migration.version
+        logging.info(f"Применена миграция {migration.version}: {migration.description}")
+    return version
@@ -1,7 +1,8 @@
 ## -*- coding: utf-8 -*-
 
 import enum
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, ForeignKey, Enum, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
@@ -14,7 +15,7 @@ class User(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     telegram_id = Column(Integer, unique=True, nullable=False)
-    created_at = Column(DateTime, default=func.now())
+    created_at = Column(DateTime, default=func.now(), index=True)
 
     profile = relationship("UserProfile", back_populates="user", uselist=False)
     user_answer_options = relationship('UserAnswerOptions', back_populates='user')
@@ -24,12 +25,14 @@ class UserProfile(Base):
     __tablename__ = 'user_profiles'
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
     full_name = Column(String, nullable=True)
     email = Column(String, nullable=True)
     phone_number = Column(String, nullable=True)
     city = Column(String, nullable=True)
     status_in_germany = Column(String, nullable=True)
+    # Время изменения с микросекундами (func.now() в SQLite - с точностью до секунды), см. report_cache
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, nullable=True)
     user = relationship("User", back_populates="profile")
 
 
@@ -54,10 +57,10 @@ class UserAnswerOptions(Base):
     __tablename__ = 'user_answer_options'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
     question_id = Column(Integer, ForeignKey('questions.id'), nullable=False)
     answer_option_id = Column(Integer, ForeignKey('answer_options.id'), nullable=False)
-    created_at = Column(DateTime, default=func.now())
+    created_at = Column(DateTime, default=func.now(), index=True)
 
     user = relationship('User', back_populates='user_answer_options')
     question = relationship('Question', back_populates='user_answer_options')
@@ -68,7 +71,7 @@ class AnswerOption(Base):
     __tablename__ = 'answer_options'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    question_id = Column(Integer, ForeignKey('questions.id'), nullable=False)
+    question_id = Column(Integer, ForeignKey('questions.id'), nullable=False, index=True)
     option_text = Column(Text, nullable=False)
 
     question = relationship('Question', back_populates='options')
@@ -77,6 +80,52 @@ class AnswerOption(Base):
 
 class UserScore(Base):
     __tablename__ = 'user_score'
+    __table_args__ = (Index('uq_user_score_user_id', 'user_id', unique=True),)
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     score = Column(Integer, nullable=True)
+
+
+class JobStatus(enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class Job(Base):
+    """Фоновая задача (отчет, загрузка файла, пересчет баллов), см. app/utils/jobs.py."""
+    __tablename__ = 'jobs'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String(50), nullable=False)
+    params = Column(Text, nullable=False, default='{}')  # JSON
+    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.QUEUED, index=True)
+    chat_id = Column(Integer, nullable=True)  # чат, куда сообщается о ходе и результате
+    progress = Column(Text, nullable=True)  # последнее сообщение о ходе выполнения
+    result = Column(Text, nullable=True)  # путь к файлу результата
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class ReportCache(Base):
+    """Готовый файл отчета за период, см. app/utils/report_cache.py."""
+    __tablename__ = 'report_cache'
+    __table_args__ = (Index('uq_report_cache_range', 'report_type', 'report_format', 'start_date', 'end_date',
+                            unique=True),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    report_type = Column(String(20), nullable=False)
+    report_format = Column(String(10), nullable=False, default='xlsx')
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=False)
+    watermark = Column(String(255), nullable=False)  # состояние данных периода, по которым построен файл
+    file_path = Column(Text, nullable=False)
+    file_size = Column(Integer, nullable=False, default=0)
+    telegram_file_id = Column(Text, nullable=True)  # file_id отправленного документа
+    created_at = Column(DateTime, default=func.now())
+    last_used_at = Column(DateTime, default=func.now(), index=True)
@@ -1,20 +1,27 @@
 ## -*- coding: utf-8 -*-
 
 import os
-import pandas as pd
-from openpyxl import Workbook
-from openpyxl.utils.dataframe import dataframe_to_rows
 from datetime import datetime, timedelta
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, update, insert, func, bindparam, exists
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import selectinload, joinedload
+import asyncio
+import json
 import logging
+from collections import deque
+from concurrent.futures import Executor
 from contextlib import asynccontextmanager
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from app.database.database import get_async_session, async_session_maker
-from app.database.models import User, UserProfile, Question, AnswerOption, QuestionType, UserAnswerOptions, UserScore
-from app.utils.encripter import encrypt_message, decrypt_message
+from app.database.unit_of_work import current_unit_of_work, AnswerRepository, ProfileRepository, ScoreRepository
+from app.database.models import (User, UserProfile, Question, AnswerOption, QuestionType, UserAnswerOptions, UserScore,
+                                 Job, JobStatus, ReportCache)
+from app.utils.encripter import DECRYPT_WORKERS, decrypt_columns_async, get_decrypt_executor
+from app.utils.report_writer import REPORT_CHUNK_SIZE, REPORT_FORMATS, REPORTS_DIR, open_report_writer
 from app.config import ENCRIPTION_KEY
 
 logging.basicConfig(level=logging.INFO)
@@ -31,6 +38,12 @@ TABLES_TO_CLEAN = {
 
 @asynccontextmanager
 async def session_manager():
+    # Внутри апдейта (DBSessionMiddleware) - сессия единицы работы апдейта
+    uow = current_unit_of_work()
+    if uow is not None:
+        async with uow.joined() as session:
+            yield session
+        return
     async for session in get_async_session():
         yield session
 
@@ -39,6 +52,12 @@ async def session_manager():
 @asynccontextmanager
 async def session_scope():
     """Provide a transactional scope around a series of operations."""
+    uow = current_unit_of_work()
+    if uow is not None:
+        async with uow.joined() as session:
+            yield session
+            await session.commit()
+        return
     session = async_session_maker()
     try:
         yield session
@@ -98,6 +117,58 @@ async def add_user(tg_id) -> bool:
             await session.rollback()
             return False
 
+
+async def get_user_id_by_telegram_id(tg_id: int) -> Optional[int]:
+    """Возвращает users.id по telegram_id или None, если пользователь не зарегистрирован."""
+    async with session_manager() as session:
+        try:
+            return await session.scalar(select(User.id).where(User.telegram_id == tg_id))
+        except SQLAlchemyError as e:
+            logging.error(f"Error getting user id: {e}")
+            return None
+
+
+def _insert_user_ignore_conflict(dialect: str, tg_id: int):
+    """
+    INSERT пользователя, который не падает, если telegram_id уже занят.
+
+    SQLite и PostgreSQL: ON CONFLICT DO NOTHING RETURNING id - id возвращается только для новой строки.
+    MySQL: ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id) - id существующей строки попадает в lastrowid,
+    поэтому там хватает одного запроса в обоих случаях.
+    """
+    if dialect == "mysql":
+        stmt = mysql_insert(User).values(telegram_id=tg_id)
+        return stmt.on_duplicate_key_update(id=func.last_insert_id(User.id))
+    dialect_insert = postgresql_insert if dialect == "postgresql" else sqlite_insert
+    return (dialect_insert(User).values(telegram_id=tg_id)
+            .on_conflict_do_nothing(index_elements=[User.telegram_id])
+            .returning(User.id))
+
+
+async def get_or_create_user_id(tg_id: int) -> Optional[int]:
+    """
+    Регистрирует пользователя, если его еще нет, и возвращает его users.id.
+
+    Новый пользователь - один запрос INSERT ... RETURNING. Для уже зарегистрированного
+    пользователя (SQLite/PostgreSQL) конфликт не возвращает строку, и id читается вторым запросом.
+    Одновременные вызовы с одним telegram_id не приводят к ошибке уникальности.
+    """
+    async with session_scope() as session:
+        try:
+            conn = await session.connection()
+            result = await conn.execute(_insert_user_ignore_conflict(conn.dialect.name, tg_id))
+            if result.returns_rows:
+                user_id = result.scalar()
+            else:
+                user_id = result.lastrowid
+            if user_id is None:
+                user_id = await session.scalar(select(User.id).where(User.telegram_id == tg_id))
+            return user_id
+        except SQLAlchemyError as e:
+            logging.error(f"Error setting user: {e}")
+            await session.rollback()
+            return None
+
 async def add_new_user_profile(
     tg_id: int,
     full_name: str = None,
@@ -118,46 +189,7 @@ async def add_new_user_profile(
     """
     async with session_manager() as session:
         try:
-            user = await session.scalar(select(User).where(User.telegram_id == tg_id))
-
-            if not user:
-                user = User(telegram_id=tg_id)
-                session.add(user)
-                await session.flush()  # Flush to get the user.id
-                user = await session.scalar(select(User).where(User.telegram_id == tg_id)) #Re-fetch user to ensure it's in the session
-                if not user:
-                    logging.error(f"Failed to retrieve user after creation.")
-                    await session.rollback()
-                    return False
-
-            # Проверяем наличие существующего профиля
-            existing_profile = await session.scalar(select(UserProfile).where(UserProfile.user_id == user.id))
-
-
-            # шифруем данные пользователя перед занесением в БД
-            encrypted_email = await encrypt_message(email, ENCRIPTION_KEY)
-            encrypted_phone_number = await encrypt_message(phone_number, ENCRIPTION_KEY)
-            encrypted_full_name = await encrypt_message(full_name, ENCRIPTION_KEY)
-
-            if existing_profile:
-                # Обновляем существующий профиль
-                existing_profile.full_name = encrypted_full_name
-                existing_profile.email = encrypted_email
-                existing_profile.phone_number = encrypted_phone_number
-                existing_profile.city = city
-                existing_profile.status_in_germany = status_in_germany
-            else:
-                # Создаем новый профиль
-                user_profile = UserProfile(
-                    user_id=user.id,
-                    full_name=encrypted_full_name,
-                    email=encrypted_email,
-                    phone_number=encrypted_phone_number,
-                    city=city,
-                    status_in_germany=status_in_germany,
-                )
-                session.add(user_profile)
-
+            await ProfileRepository(session).upsert(tg_id, full_name, email, phone_number, city, status_in_germany)
             await session.commit()
             return True
 
@@ -169,24 +201,28 @@ async def add_new_user_profile(
 
 # Асинхронная функция для загрузки вопросов из БД
 async def load_questions():
-    """Загрузка всех вопросов из БД с вариантами ответов"""
+    """Загрузка всех вопросов из БД с вариантами ответов (одним запросом)"""
     async with session_manager() as session:
             try:
-                questions_result = await session.execute(select(Question))
-                questions = questions_result.scalars().all()
+                result = await session.execute(
+                    select(Question.id, Question.question_text, Question.type, AnswerOption.id, AnswerOption.option_text)
+                    .outerjoin(AnswerOption, AnswerOption.question_id == Question.id)
+                    .order_by(Question.id, AnswerOption.id)
+                )
 
                 all_questions = []
-                for question in questions:
-                        options_result = await session.execute(
-                            select(AnswerOption).where(AnswerOption.question_id == question.id)
-                        )
-                        options = options_result.scalars().all()
+                for question_id, question_text, question_type, option_id, option_text in result:
+                    if not all_questions or all_questions[-1]["id"] != question_id:
                         all_questions.append({
-                            "id": question.id,  # Добавлено
-                            "question": question.question_text,
-                            "options": [option.option_text for option in options],
-                            "type": question.type,
+                            "id": question_id,  # Добавлено
+                            "question": question_text,
+                            "options": [],
+                            "option_ids": [],
+                            "type": question_type,
                         })
+                    if option_id is not None:
+                        all_questions[-1]["options"].append(option_text)
+                        all_questions[-1]["option_ids"].append(option_id)
                 return all_questions
             except SQLAlchemyError as e:
                 logging.error(f"Error load questions: {e}")
@@ -233,42 +269,113 @@ async def save_answer(user_id: int, question_id: int, selected_options: List[str
 
 
 
+async def _insert_questions_with_options(session, questions_data: List[Dict[str, Any]]) -> int:
+    """
+    Вставляет вопросы и их варианты ответов двумя пакетными INSERT в текущей транзакции.
+
+    PostgreSQL возвращает id вопросов из пакетного INSERT ... RETURNING в порядке строк.
+    SQLite (пакетный RETURNING без гарантии порядка) и MySQL (RETURNING нет) - одним SELECT
+    новых строк по возрастанию id: в транзакции импорта вопросы больше никто не добавляет.
+    Возвращает количество добавленных вопросов.
+    """
+    if not questions_data:
+        return 0
+    questions_table, options_table = Question.__table__, AnswerOption.__table__
+    question_rows = [{"question_text": q_data["question"],
+                      "type": QuestionType(q_data.get("question_type", "single_choice"))}
+                     for q_data in questions_data]
+
+    conn = await session.connection()
+    if conn.dialect.name == "postgresql":
+        result = await conn.execute(
+            insert(questions_table).returning(questions_table.c.id, sort_by_parameter_order=True), question_rows
+        )
+        question_ids = list(result.scalars().all())
+    else:
+        last_id = await conn.scalar(select(func.max(questions_table.c.id))) or 0
+        await conn.execute(insert(questions_table), question_rows)
+        question_ids = list((await conn.scalars(
+            select(questions_table.c.id).where(questions_table.c.id > last_id).order_by(questions_table.c.id)
+        )).all())
+
+    option_rows = [{"question_id": question_id, "option_text": option_text}
+                   for question_id, q_data in zip(question_ids, questions_data)
+                   for option_text in q_data["options"]]
+    if option_rows:
+        await conn.execute(insert(options_table), option_rows)
+    return len(question_ids)
+
+
 async def add_questions_with_options(questions_data: List[Dict[str, Any]]) -> None:
-    """Добавляет вопросы и варианты ответов в базу данных."""
-    async with session_manager() as session:
-        try:
-            for q_data in questions_data:
-                question_text = q_data["question"]
-                question_type = q_data.get("question_type", "single_choice")  # Default to single_choice if not provided. Use "type" instead of "question_type"
-                question_type = QuestionType(question_type)
-                question = Question(question_text=question_text, type=question_type)
-                session.add(question)
-                await session.flush()  # Flush to get id for the question
-
-                for option_data in q_data["options"]:
-                    option = AnswerOption(question_id=question.id, option_text=option_data)
-                    session.add(option)
+    """Добавляет вопросы и варианты ответов в базу данных одной транзакцией."""
+    try:
+        async with session_scope() as session:
+            count = await _insert_questions_with_options(session, questions_data)
+        logging.info(f"Added {count} questions with options.")
+    except SQLAlchemyError as e:
+        logging.error(f"Error adding question and options: {e}")
 
-                await session.commit()
-                logging.info(f"Question '{question_text}' and its options added successfully.")
 
-        except SQLAlchemyError as e:
-            logging.error(f"Error adding question and options: {e}")
-            await session.rollback()
+async def replace_questions_with_options(questions_data: List[Dict[str, Any]]) -> None:
+    """
+    Заменяет все вопросы и варианты ответов новыми в одной транзакции: при ошибке
+    в базе остаются прежние вопросы. Ошибка БД пробрасывается вызывающему коду.
 
+    Новые строки добавляются до удаления прежних, поэтому их id не пересекаются со старыми.
+    Ответы пользователей переносятся на новые id по паре (текст вопроса, текст варианта),
+    ответы на варианты, которых нет в новой матрице, удаляются.
+    """
+    answers_table = UserAnswerOptions.__table__
+    async with session_scope() as session:
+        old_question_id, old_option_id = (await session.execute(
+            select(select(func.max(Question.id)).scalar_subquery(), select(func.max(AnswerOption.id)).scalar_subquery())
+        )).one()
+        old_question_id, old_option_id = old_question_id or 0, old_option_id or 0
+        old_options = (await session.execute(
+            select(AnswerOption.id, Question.question_text, AnswerOption.option_text)
+            .join(Question, AnswerOption.question_id == Question.id)
+        )).all()
+
+        count = await _insert_questions_with_options(session, questions_data)
+
+        new_options = {}
+        rows = await session.execute(
+            select(AnswerOption.id, AnswerOption.question_id, Question.question_text, AnswerOption.option_text)
+            .join(Question, AnswerOption.question_id == Question.id)
+            .where(AnswerOption.id > old_option_id)
+            .order_by(AnswerOption.id)
+        )
+        for option_id, question_id, question_text, option_text in rows:
+            new_options.setdefault((question_text, option_text), (question_id, option_id))
+        remap = [{"old_option_id": option_id, "new_question_id": new_options[(question_text, option_text)][0],
+                  "new_option_id": new_options[(question_text, option_text)][1]}
+                 for option_id, question_text, option_text in old_options
+                 if (question_text, option_text) in new_options]
+
+        conn = await session.connection()
+        if remap:
+            await conn.execute(
+                update(answers_table)
+                .where(answers_table.c.answer_option_id == bindparam("old_option_id"))
+                .values(question_id=bindparam("new_question_id"), answer_option_id=bindparam("new_option_id")),
+                remap,
+            )
+        dropped = (await conn.execute(
+            delete(answers_table).where(answers_table.c.answer_option_id <= old_option_id)
+        )).rowcount
+        await session.execute(delete(AnswerOption).where(AnswerOption.id <= old_option_id))
+        await session.execute(delete(Question).where(Question.id <= old_question_id))
+    logging.info(f"Questions replaced: {count} questions with options, "
+                 f"removed answers to deleted options: {dropped}.")
 
 
 async def is_tables_empty() -> bool:
-    """Проверяет, пусты ли таблицы questions и answer_options."""
+    """Проверяет, пусты ли таблицы questions и answer_options (один запрос с двумя EXISTS)."""
     async with session_manager() as session:
         try:
-            questions_result = await session.execute(select(Question))
-            questions = questions_result.scalars().all()
-
-            options_result = await session.execute(select(AnswerOption))
-            options = options_result.scalars().all()
-
-            return not bool(questions) and not bool(options)  # True if BOTH are empty
+            has_rows = await session.execute(select(exists(select(Question.id)), exists(select(AnswerOption.id))))
+            has_questions, has_options = has_rows.one()
+            return not has_questions and not has_options  # True if BOTH are empty
         except SQLAlchemyError as e:
             logging.error(f"Error checking if tables are empty: {e}")
             return True  # treat as empty to add questions in case of error
@@ -349,87 +456,159 @@ async def clear_user_answer_options(telegram_id: int) -> None:
             await session.rollback()  # Correct the rollback statement
 
 
-async def get_user_answers(telegram_id: int) -> List[str]:
+USER_ANSWERS_BATCH_SIZE = 500  # telegram_id в одном IN (...)
+
+
+def _user_answers_query():
+    """(telegram_id, question_id, option_id, option_text) выбранных вариантов в порядке вопросов."""
+    return (
+        select(User.telegram_id, UserAnswerOptions.question_id, AnswerOption.id, AnswerOption.option_text)
+        .join(UserAnswerOptions, UserAnswerOptions.user_id == User.id)
+        .join(AnswerOption, UserAnswerOptions.answer_option_id == AnswerOption.id)
+        .order_by(User.telegram_id, UserAnswerOptions.question_id, UserAnswerOptions.id)
+    )
+
+
+async def get_user_answers(telegram_id: int) -> List[tuple]:
     """
-    Получает все ответы пользователя из базы данных на основе telegram_id.
+    Получает все ответы пользователя одним запросом (users JOIN user_answer_options JOIN answer_options).
 
     Args:
         telegram_id: Telegram ID пользователя.
 
     Returns:
-        Список выбранных ответов пользователя.
-        Если ответов нет, возвращает пустой список.
+        Список кортежей (question_id, option_id, option_text) в порядке вопросов.
+        Если пользователь не найден или ответов нет, возвращает пустой список.
     """
     async with session_manager() as session:
         try:
-            # Находим пользователя по telegram_id
-            user = await session.scalar(select(User).where(User.telegram_id == telegram_id))
-
-            if not user:
-                return []  # Пользователь не найден, возвращаем пустой список
+            result = await session.execute(_user_answers_query().where(User.telegram_id == telegram_id))
+            return [(question_id, option_id, option_text) for _, question_id, option_id, option_text in result]
+        except SQLAlchemyError as e:
+            logging.error(f"Error getting user answers: {e}")
+            await session.rollback()
+            return []
 
-            # Получаем все ответы пользователя
-            answers = await session.scalars(select(UserAnswerOptions).where(UserAnswerOptions.user_id == user.id))
-            answers = answers.all()
 
-            # Преобразуем результаты в список словарей для удобства использования
-            result = []
-            for answer in answers:
-                # Получаем текст варианта ответа
-                answer_option = await session.scalar(select(AnswerOption).where(AnswerOption.id == answer.answer_option_id))
-                answer_text = answer_option.option_text if answer_option else None
-                result.append(answer_text)
+async def get_users_answers(telegram_ids: List[int], batch_size: int = USER_ANSWERS_BATCH_SIZE) -> Dict[int, List[tuple]]:
+    """
+    Пакетный вариант get_user_answers для отчетов и пересчета баллов:
+    один запрос на каждые batch_size пользователей.
 
-            return result
+    Returns:
+        Словарь telegram_id -> [(question_id, option_id, option_text)]. Пользователи без ответов не попадают в словарь.
+    """
+    answers: Dict[int, List[tuple]] = {}
+    telegram_ids = list(dict.fromkeys(telegram_ids))
+    async with session_manager() as session:
+        try:
+            for i in range(0, len(telegram_ids), batch_size):
+                result = await session.execute(
+                    _user_answers_query().where(User.telegram_id.in_(telegram_ids[i:i + batch_size]))
+                )
+                for telegram_id, question_id, option_id, option_text in result:
+                    answers.setdefault(telegram_id, []).append((question_id, option_id, option_text))
+            return answers
         except SQLAlchemyError as e:
-            logging.error(f"Error getting user answers: {e}")
+            logging.error(f"Error getting users answers: {e}")
             await session.rollback()
-            return []
+            return {}
 
 
-async def generate_user_profile_report(start_date: str, end_date: str) -> str | None:
-    """Генерирует отчет с данными профилей пользователей за указанный период."""
+async def get_user_answer_ids(telegram_id: int) -> List[int]:
+    """
+    Получает идентификаторы выбранных пользователем вариантов ответа (AnswerOption.id).
 
-    try:
-        reports_dir = "reports"
-        os.makedirs(reports_dir, exist_ok=True)
+    Args:
+        telegram_id: Telegram ID пользователя.
+
+    Returns:
+        Список идентификаторов в порядке сохранения. Если ответов нет, пустой список.
+    """
+    async with session_manager() as session:
+        try:
+            return await AnswerRepository(session).option_ids(telegram_id)
+        except SQLAlchemyError as e:
+            logging.error(f"Error getting user answer ids: {e}")
+            return []
 
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "User Profiles"
 
-        # Заголовки столбцов
-        headers = ["User ID", "Telegram ID", "Full Name", "Email", "Phone Number", "City", "Status in Germany",
-                   "Registration Date"]
-        ws.append(headers)
-        # Преобразуем строки в объекты datetime
-        start_date = datetime.strptime(start_date, '%d.%m.%Y')
-        end_date = datetime.strptime(end_date, '%d.%m.%Y') + timedelta(days=1)  # Включаем последний день
+async def load_answer_option_keys() -> List[tuple]:
+    """
+    Загружает варианты ответа для привязки к строкам матрицы.
 
-        async with session_manager() as session:
-            # Запрос данных из базы данных, явно загружаем профили пользователей
+    Returns:
+        Список кортежей (AnswerOption.id, текст вопроса, текст варианта ответа).
+    """
+    async with session_manager() as session:
+        try:
             result = await session.execute(
-                select(User)
-                .filter(User.created_at >= start_date, User.created_at <= end_date)
-                .options(selectinload(User.profile))  # Явно загружаем профиль пользователя
+                select(AnswerOption.id, Question.question_text, AnswerOption.option_text)
+                .join(Question, AnswerOption.question_id == Question.id)
+                .order_by(AnswerOption.id)
             )
-            users = result.scalars().all()
-
-            for user in users:
-                # Получаем данные профиля для каждого пользователя
-                profile_data = {
-                    "User ID": user.id,
-                    "Telegram ID": user.telegram_id,
-                    "Full Name": await decrypt_message(user.profile.full_name, ENCRIPTION_KEY) if user.profile else "",
-                    "Email": await decrypt_message(user.profile.email, ENCRIPTION_KEY) if user.profile else "",
-                    "Phone Number": await decrypt_message(user.profile.phone_number, ENCRIPTION_KEY) if user.profile else "",
-                    "City": user.profile.city if user.profile else "",
-                    "Status in Germany": user.profile.status_in_germany if user.profile else "",
-                    "Registration Date": user.created_at.strftime("%Y-%m-%d %H:%M:%S")
-                }
-
-                row = [profile_data[header] for header in headers]
-                ws.append(row)
+            return [tuple(row) for row in result.all()]
+        except SQLAlchemyError as e:
+            logging.error(f"Error loading answer options: {e}")
+            return []
+
+
+PROFILE_REPORT_HEADERS = ["User ID", "Telegram ID", "Full Name", "Email", "Phone Number", "City", "Status in Germany",
+                          "Registration Date"]
+PROFILE_REPORT_TYPES = ["int", "int", "str", "str", "str", "str", "str", "datetime"]  # типы столбцов для Parquet
+PROFILE_REPORT_PAGE_SIZE = 2000  # пользователей в порции чтения и расшифровки
+_PROFILE_ENCRYPTED_COLUMNS = (2, 3, 4)  # Full Name, Email, Phone Number
+
+
+def _profile_report_row(row) -> list:
+    row[5] = row[5] or ""
+    row[6] = row[6] or ""
+    row[7] = row[7].replace(microsecond=0)
+    return row
+
+
+async def generate_user_profile_report(start_date: str, end_date: str, page_size: int = PROFILE_REPORT_PAGE_SIZE,
+                                       executor: Executor = None, report_format: str = "xlsx") -> str | None:
+    """
+    Генерирует отчет с данными профилей пользователей за указанный период.
+
+    Пользователи с профилями читаются порциями по page_size (session.stream). Зашифрованные поля
+    порции расшифровываются одним вызовом decrypt_columns в пуле расшифровки (один Fernet на процесс),
+    одновременно в работе до DECRYPT_WORKERS порций: пока они расшифровываются, из БД читается
+    следующая. Расшифрованные порции в исходном порядке пишутся в файл формата report_format
+    ("xlsx", "csv", "csv.gz" или "parquet", см. open_report_writer).
+
+    Returns:
+        Путь к файлу или None при ошибке.
+    """
+    pending = deque()
+    try:
+        start_date_dt, end_date_dt = _report_date_range(start_date, end_date)
+        filepath = _report_filepath(
+            f"user_profiles_{start_date_dt.strftime('%Y%m%d')}_{end_date_dt.strftime('%Y%m%d')}", report_format)
+        executor = executor or get_decrypt_executor()
+
+        stmt = (
+            select(User.id, User.telegram_id, UserProfile.full_name, UserProfile.email, UserProfile.phone_number,
+                   UserProfile.city, UserProfile.status_in_germany, User.created_at)
+            .outerjoin(UserProfile, UserProfile.user_id == User.id)
+            .where(User.created_at >= start_date_dt, User.created_at <= end_date_dt)
+            .order_by(User.id)
+            .execution_options(yield_per=page_size)
+        )
+
+        async with session_manager() as session:
+            async with open_report_writer(report_format, filepath, PROFILE_REPORT_HEADERS, title="User Profiles",
+                                          row_mapper=_profile_report_row, column_types=PROFILE_REPORT_TYPES) as writer:
+                result = await session.stream(stmt)
+                async for rows in result.partitions():
+                    pending.append(asyncio.ensure_future(decrypt_columns_async(
+                        [tuple(row) for row in rows], _PROFILE_ENCRYPTED_COLUMNS, ENCRIPTION_KEY, executor)))
+                    if len(pending) > DECRYPT_WORKERS:
+                        await writer.write(await pending.popleft())
+                while pending:
+                    await writer.write(await pending.popleft())
+        return filepath
 
     except SQLAlchemyError as e:
         logging.error(f"Error generating user profile report: {e}")
@@ -438,31 +617,29 @@ async def generate_user_profile_report(start_date: str, end_date: str) -> str |
         logging.error(f"Unexpected error generating user profile report: {e}")
         return None
     finally:
-        filename = f"user_profiles_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.xlsx"
-        filepath = os.path.join(reports_dir, filename)  # Сохраняем в каталоге reports
-        # Сохраняем файл
-        wb.save(filepath)
-        return filepath
+        for future in pending:
+            future.cancel()
 
 
-async def get_user_answers_data_length(start_date: str, end_date: str) -> str:
-    try:
-        start_date_dt = datetime.strptime(start_date, '%d.%m.%Y')
-        end_date_dt = datetime.strptime(end_date, '%d.%m.%Y') + timedelta(days=1)
+def _report_filepath(name: str, report_format: str) -> str:
+    """Путь к файлу отчета в REPORTS_DIR с расширением формата."""
+    if report_format not in REPORT_FORMATS:
+        raise ValueError(f"Неверный формат отчета: {report_format}")
+    return os.path.join(REPORTS_DIR, name + REPORT_FORMATS[report_format])
 
-        async with session_scope() as session:
-            # Проверяем наличие данных в таблице UserAnswerOptions
-            count_result = await session.execute(
-                select(UserAnswerOptions).filter(
-                    UserAnswerOptions.created_at >= start_date_dt,
-                    UserAnswerOptions.created_at <= end_date_dt
-                )
-            )
 
-            # Получаем количество записей
-            count = len(count_result.scalars().all())
-            return count
+def _report_date_range(start_date: str, end_date: str):
+    """Границы периода отчета ДД.ММ.ГГГГ-ДД.ММ.ГГГГ, включая последний день."""
+    return datetime.strptime(start_date, '%d.%m.%Y'), datetime.strptime(end_date, '%d.%m.%Y') + timedelta(days=1)
+
 
+async def get_user_answers_data_length(start_date: str, end_date: str) -> Optional[int]:
+    """Количество ответов пользователей за период (COUNT(*) без загрузки строк)."""
+    try:
+        start_date_dt, end_date_dt = _report_date_range(start_date, end_date)
+        return await count_rows(UserAnswerOptions,
+                                UserAnswerOptions.created_at >= start_date_dt,
+                                UserAnswerOptions.created_at <= end_date_dt)
     except SQLAlchemyError as e:
         logging.error(f"Error getting user answers data: {e}")
         return None
@@ -471,52 +648,69 @@ async def get_user_answers_data_length(start_date: str, end_date: str) -> str:
         return None
 
 
-async def get_user_answers_data(start_date: str, end_date: str) -> str:
-    """Получает данные об ответах пользователей и генерирует XLSX-файл."""
+async def get_registered_users_length(start_date: str, end_date: str) -> Optional[int]:
+    """Количество пользователей, зарегистрированных за период (для отчета по профилям)."""
     try:
-        start_date_dt = datetime.strptime(start_date, '%d.%m.%Y')
-        end_date_dt = datetime.strptime(end_date, '%d.%m.%Y') + timedelta(days=1)
+        start_date_dt, end_date_dt = _report_date_range(start_date, end_date)
+        return await count_rows(User, User.created_at >= start_date_dt, User.created_at <= end_date_dt)
+    except SQLAlchemyError as e:
+        logging.error(f"Error counting registered users: {e}")
+        return None
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        return None
 
-        async with session_scope() as session:
-            stmt = select(
-                    User.telegram_id,
-                    Question.question_text,
-                    AnswerOption.option_text,
-                    UserAnswerOptions.created_at,
-                    UserScore.score.label("user_score")
-                ).select_from(UserAnswerOptions)  # Указываем начальную таблицу
-
-            stmt = stmt.join(User, UserAnswerOptions.user_id == User.id) # Explicit joins
-            stmt = stmt.join(Question, UserAnswerOptions.question_id == Question.id)
-            stmt = stmt.join(AnswerOption, UserAnswerOptions.answer_option_id == AnswerOption.id)
-            stmt = stmt.outerjoin(UserScore, UserAnswerOptions.user_id == UserScore.user_id)
-
-            stmt = stmt.filter(UserAnswerOptions.created_at >= start_date_dt, UserAnswerOptions.created_at <= end_date_dt)
-
-            result = await session.execute(stmt)
-
-            data = []
-            for telegram_id, question_text, option_text, created_at, score in result:
-                data.append({
-                    "Telegram ID": telegram_id,
-                    "Question Text": question_text,
-                    "Answer Option Text": option_text,
-                    "Answered At": created_at.strftime("%Y-%m-%d %H:%M:%S"),
-                    "Score": score if score is not None else 0
-                })
-
-            df = pd.DataFrame(data)
-
-            wb = Workbook()
-            ws = wb.active
-            for r in dataframe_to_rows(df, index=False, header=True):
-                ws.append(r)
-
-            filename = f"user_answers_{start_date_dt.strftime('%Y%m%d')}_{end_date_dt.strftime('%Y%m%d')}.xlsx"
-            filepath = f"./reports/{filename}"
-            wb.save(filepath)
-
-            return filepath
+
+USER_ANSWERS_REPORT_HEADERS = ["Telegram ID", "Question Text", "Answer Option Text", "Answered At", "Score"]
+USER_ANSWERS_REPORT_TYPES = ["int", "str", "str", "datetime", "int"]  # типы столбцов для Parquet
+
+
+def _user_answers_report_row(row) -> list:
+    # Время ответа - ячейка даты, а не строка: уникальные строки копятся в таблице sharedStrings в памяти
+    telegram_id, question_text, option_text, created_at, score = row
+    return [telegram_id, question_text, option_text, created_at.replace(microsecond=0),
+            score if score is not None else 0]
+
+
+async def get_user_answers_data(start_date: str, end_date: str, chunk_size: int = REPORT_CHUNK_SIZE,
+                                report_format: str = "xlsx") -> str:
+    """
+    Генерирует файл с ответами пользователей за период в формате report_format
+    ("xlsx", "csv", "csv.gz" или "parquet").
+
+    Строки читаются из БД порциями по chunk_size через серверный курсор (session.stream) и сразу
+    пишутся в файл в рабочем потоке (open_report_writer; XLSX - книга openpyxl в режиме write_only):
+    в памяти одновременно не больше двух порций, цикл событий не блокируется.
+
+    Returns:
+        Путь к файлу или None при ошибке.
+    """
+    try:
+        start_date_dt, end_date_dt = _report_date_range(start_date, end_date)
+        filepath = _report_filepath(
+            f"user_answers_{start_date_dt.strftime('%Y%m%d')}_{end_date_dt.strftime('%Y%m%d')}", report_format)
+
+        stmt = (
+            select(User.telegram_id, Question.question_text, AnswerOption.option_text,
+                   UserAnswerOptions.created_at, UserScore.score.label("user_score"))
+            .select_from(UserAnswerOptions)
+            .join(User, UserAnswerOptions.user_id == User.id)
+            .join(Question, UserAnswerOptions.question_id == Question.id)
+            .join(AnswerOption, UserAnswerOptions.answer_option_id == AnswerOption.id)
+            .outerjoin(UserScore, UserAnswerOptions.user_id == UserScore.user_id)
+            .where(UserAnswerOptions.created_at >= start_date_dt, UserAnswerOptions.created_at <= end_date_dt)
+            .order_by(UserAnswerOptions.id)
+            .execution_options(yield_per=chunk_size)
+        )
+
+        async with session_manager() as session:
+            async with open_report_writer(report_format, filepath, USER_ANSWERS_REPORT_HEADERS,
+                                          row_mapper=_user_answers_report_row,
+                                          column_types=USER_ANSWERS_REPORT_TYPES) as writer:
+                result = await session.stream(stmt)
+                async for rows in result.partitions():
+                    await writer.write(rows)
+        return filepath
 
     except SQLAlchemyError as e:
         logging.error(f"Error getting user answers data: {e}")
@@ -526,7 +720,6 @@ async def get_user_answers_data(start_date: str, end_date: str) -> str:
         return None
 
 
-
 async def clean_tables(selected_tables):
     async for session in get_async_session():
         for table_name in selected_tables:
@@ -540,25 +733,10 @@ async def upsert_user_score_by_telegram_id(telegram_id: int, score: int) -> bool
     """Adds or updates a UserScore record based on the user's Telegram ID."""
     async with session_scope() as session:
         try:
-            # 1. Get the User object using the Telegram ID
-            user = await session.scalar(select(User).where(User.telegram_id == telegram_id))
-            if not user:
+            if not await ScoreRepository(session).upsert(telegram_id, score):
                 logging.warning(f"User with Telegram ID {telegram_id} not found.")
                 return False  # User not found
-
-            # 2. Check for existing UserScore record for this user
-            existing_score = await session.scalar(select(UserScore).where(UserScore.user_id == user.id))
-
-            if existing_score:
-                # Update existing score
-                existing_score.score = score
-                logging.info(f"Updated score for user (Telegram ID: {telegram_id}), new score: {score}")
-            else:
-                # Create and add a new score record
-                new_score = UserScore(user_id=user.id, score=score)
-                session.add(new_score)
-                logging.info(f"Added new score for user (Telegram ID: {telegram_id}), score: {score}")
-
+            logging.info(f"Saved score for user (Telegram ID: {telegram_id}), score: {score}")
             await session.commit()
             return True
 
@@ -572,5 +750,301 @@ async def upsert_user_score_by_telegram_id(telegram_id: int, score: int) -> bool
             return False
 
 
+
+# ---------------------- агрегатные запросы ---------------------------------------------
+# Проверки и счетчики выполняются в СУБД (EXISTS, COUNT, GROUP BY): строки таблиц не загружаются в память.
+
+async def has_rows(model, *criteria) -> bool:
+    """Есть ли в таблице модели строки, удовлетворяющие условиям (SELECT EXISTS). Ошибки БД не перехватываются."""
+    async with session_manager() as session:
+        return bool(await session.scalar(select(exists().where(*criteria).select_from(model))))
+
+
+async def count_rows(model, *criteria) -> int:
+    """Количество строк таблицы модели, удовлетворяющих условиям (SELECT COUNT(*)). Ошибки БД не перехватываются."""
+    async with session_manager() as session:
+        return await session.scalar(select(func.count()).select_from(model).where(*criteria)) or 0
+
+
+async def count_answers_by_day(start_date: str, end_date: str) -> List[tuple]:
+    """
+    Количество ответов по дням за период.
+
+    Returns:
+        Список (день 'ГГГГ-ММ-ДД', количество) по возрастанию дня.
+    """
+    start_date_dt, end_date_dt = _report_date_range(start_date, end_date)
+    day = func.date(UserAnswerOptions.created_at)
+    async with session_manager() as session:
+        try:
+            result = await session.execute(
+                select(day, func.count())
+                .where(UserAnswerOptions.created_at >= start_date_dt, UserAnswerOptions.created_at <= end_date_dt)
+                .group_by(day)
+                .order_by(day)
+            )
+            return [(str(answer_day), count) for answer_day, count in result]
+        except SQLAlchemyError as e:
+            logging.error(f"Error counting answers by day: {e}")
+            return []
+
+
+async def count_answers_by_question(start_date: str, end_date: str) -> List[tuple]:
+    """
+    Количество ответов по вопросам за период.
+
+    Returns:
+        Список (question_id, текст вопроса, количество) в порядке вопросов.
+    """
+    start_date_dt, end_date_dt = _report_date_range(start_date, end_date)
+    answers = (
+        select(UserAnswerOptions.question_id, func.count().label("answers"))
+        .where(UserAnswerOptions.created_at >= start_date_dt, UserAnswerOptions.created_at <= end_date_dt)
+        .group_by(UserAnswerOptions.question_id)
+        .subquery()
+    )
+    async with session_manager() as session:
+        try:
+            result = await session.execute(
+                select(Question.id, Question.question_text, answers.c.answers)
+                .join(answers, answers.c.question_id == Question.id)
+                .order_by(Question.id)
+            )
+            return [tuple(row) for row in result]
+        except SQLAlchemyError as e:
+            logging.error(f"Error counting answers by question: {e}")
+            return []
+
+
+async def count_users_with_answers() -> int:
+    """Количество пользователей, у которых есть сохраненные ответы."""
+    async with session_manager() as session:
+        try:
+            count = await session.scalar(select(func.count(func.distinct(UserAnswerOptions.user_id))))
+            return count or 0
+        except SQLAlchemyError as e:
+            logging.error(f"Error counting users with answers: {e}")
+            return 0
+
+
+async def iter_user_answers_batches(batch_size: int = 1000):
+    """
+    Постранично выдает ответы пользователей, не загружая всю таблицу в память.
+
+    Пагинация идет по user_id (keyset), каждая страница читается в отдельной короткой сессии.
+    Yields:
+        Список пар (user_id, [AnswerOption.id выбранных ответов]) длиной не более batch_size.
+    """
+    last_user_id = 0
+    while True:
+        async with session_manager() as session:
+            user_ids = (await session.scalars(
+                select(UserAnswerOptions.user_id)
+                .where(UserAnswerOptions.user_id > last_user_id)
+                .distinct()
+                .order_by(UserAnswerOptions.user_id)
+                .limit(batch_size)
+            )).all()
+            if not user_ids:
+                return
+
+            rows = await session.execute(
+                select(UserAnswerOptions.user_id, UserAnswerOptions.answer_option_id)
+                .where(UserAnswerOptions.user_id > last_user_id, UserAnswerOptions.user_id <= user_ids[-1])
+                .order_by(UserAnswerOptions.user_id, UserAnswerOptions.id)
+            )
+            answers = {user_id: [] for user_id in user_ids}
+            for user_id, option_id in rows:
+                answers[user_id].append(option_id)
+
+        yield list(answers.items())
+        last_user_id = user_ids[-1]
+
+
+async def bulk_upsert_user_scores(scores: List[tuple]) -> None:
+    """
+    Пакетно добавляет или обновляет баллы пользователей в одной транзакции.
+
+    Args:
+        scores: список пар (user_id, score), отсортированный по user_id.
+    """
+    if not scores:
+        return
+    async with session_scope() as session:
+        existing = set((await session.scalars(
+            select(UserScore.user_id)
+            .where(UserScore.user_id >= scores[0][0], UserScore.user_id <= scores[-1][0])
+        )).all())
+
+        to_update = [{"b_user_id": user_id, "b_score": score} for user_id, score in scores if user_id in existing]
+        to_insert = [{"user_id": user_id, "score": score} for user_id, score in scores if user_id not in existing]
+
+        if to_update:
+            await session.execute(
+                update(UserScore.__table__)
+                .where(UserScore.__table__.c.user_id == bindparam("b_user_id"))
+                .values(score=bindparam("b_score")),
+                to_update,
+            )
+        if to_insert:
+            await session.execute(insert(UserScore), to_insert)
+
+
+async def bulk_save_answers(answers: List[tuple], known_user_ids: Dict[int, int] = None) -> int:
+    """
+    Сохраняет накопленные ответы опроса одним пакетным INSERT в user_answer_options.
+
+    Args:
+        answers: список (telegram_id, question_id, answer_option_id).
+        known_user_ids: уже известные соответствия telegram_id -> users.id; остальные читаются из БД.
+
+    Returns:
+        Количество сохраненных строк. Ответы незарегистрированных пользователей пропускаются.
+        Ошибки БД пробрасываются, чтобы вызывающий код мог повторить сохранение.
+    """
+    if not answers:
+        return 0
+    async with session_scope() as session:
+        telegram_ids = {telegram_id for telegram_id, _, _ in answers}
+        users = dict(known_user_ids or {})
+        unknown = telegram_ids - users.keys()
+        if unknown:
+            users.update((await session.execute(
+                select(User.telegram_id, User.id).where(User.telegram_id.in_(unknown))
+            )).all())
+        rows = [{"user_id": users[telegram_id], "question_id": question_id, "answer_option_id": option_id}
+                for telegram_id, question_id, option_id in answers if telegram_id in users]
+        if len(users) < len(telegram_ids):
+            logging.error(f"User not found for telegram_id: {sorted(telegram_ids - users.keys())}")
+        if rows:
+            await session.execute(insert(UserAnswerOptions), rows)
+        return len(rows)
+
+
+
+# ---------------------- фоновые задачи ---------------------------------------------------
+# Записи задач очереди app/utils/jobs.py. Ошибки БД пробрасываются: их обрабатывает очередь.
+
+async def create_job(kind: str, params: dict, chat_id: Optional[int] = None) -> int:
+    """Добавляет задачу в статусе QUEUED. Returns: Job.id."""
+    async with session_scope() as session:
+        job = Job(kind=kind, params=json.dumps(params, ensure_ascii=False), chat_id=chat_id,
+                  status=JobStatus.QUEUED)
+        session.add(job)
+        await session.flush()
+        return job.id
+
+
+async def get_job(job_id: int) -> Optional[Job]:
+    async with session_manager() as session:
+        return await session.get(Job, job_id)
+
+
+async def update_job(job_id: int, **values) -> None:
+    async with session_scope() as session:
+        await session.execute(update(Job).where(Job.id == job_id).values(**values))
+
+
+async def claim_job(job_id: int) -> bool:
+    """Переводит задачу из QUEUED в RUNNING. False, если задача уже отменена или взята."""
+    async with session_scope() as session:
+        result = await session.execute(
+            update(Job).where(Job.id == job_id, Job.status == JobStatus.QUEUED)
+            .values(status=JobStatus.RUNNING, started_at=datetime.now(), attempts=Job.attempts + 1))
+        return result.rowcount == 1
+
+
+async def requeue_interrupted_jobs() -> List[int]:
+    """
+    Возвращает в очередь задачи, прерванные остановкой бота (RUNNING).
+    Returns: идентификаторы всех задач в статусе QUEUED в порядке создания.
+    """
+    async with session_scope() as session:
+        await session.execute(update(Job).where(Job.status == JobStatus.RUNNING).values(status=JobStatus.QUEUED))
+        return list(await session.scalars(select(Job.id).where(Job.status == JobStatus.QUEUED).order_by(Job.id)))
+
+
+
+# ---------------------- кэш отчетов ------------------------------------------------------
+# Записи кэша готовых файлов отчетов app/utils/report_cache.py.
+
+async def get_report_watermark(report_type: str, start_date: str, end_date: str) -> Optional[str]:
+    """
+    Отметка состояния данных отчета за период: количество строк, наибольшие id и время изменения.
+    Если отметка не изменилась, не изменился и файл отчета. Returns: строка или None при ошибке.
+    """
+    try:
+        start_date_dt, end_date_dt = _report_date_range(start_date, end_date)
+        async with session_manager() as session:
+            if report_type == "answers":
+                in_period = (UserAnswerOptions.created_at >= start_date_dt, UserAnswerOptions.created_at <= end_date_dt)
+                answers = (await session.execute(
+                    select(func.count(UserAnswerOptions.id), func.max(UserAnswerOptions.id),
+                           func.max(UserAnswerOptions.created_at)).where(*in_period)
+                )).one()
+                # Баллы в отчете меняются при пересчете без изменения ответов;
+                # учитываются только пользователи, чьи ответы попадают в период
+                scores = (await session.execute(
+                    select(func.count(UserScore.id), func.coalesce(func.sum(UserScore.score), 0))
+                    .where(UserScore.user_id.in_(select(UserAnswerOptions.user_id).where(*in_period)))
+                )).one()
+                values = (*answers, *scores)
+            elif report_type == "profile":
+                values = (await session.execute(
+                    select(func.count(User.id), func.max(User.id), func.max(UserProfile.id),
+                           func.max(UserProfile.updated_at))
+                    .outerjoin(UserProfile, UserProfile.user_id == User.id)
+                    .where(User.created_at >= start_date_dt, User.created_at <= end_date_dt)
+                )).one()
+            else:
+                raise ValueError(f"Неверный тип отчета: {report_type}")
+        return ":".join(str(value) for value in values)
+    except SQLAlchemyError as e:
+        logging.error(f"Error getting report watermark: {e}")
+        return None
+
+
+def _cached_report_key(report_type: str, report_format: str, start_date, end_date):
+    return (ReportCache.report_type == report_type, ReportCache.report_format == report_format,
+            ReportCache.start_date == start_date, ReportCache.end_date == end_date)
+
+
+async def get_cached_report(report_type: str, start_date, end_date, report_format: str = "xlsx") -> Optional[ReportCache]:
+    async with session_manager() as session:
+        return await session.scalar(select(ReportCache).where(
+            *_cached_report_key(report_type, report_format, start_date, end_date)))
+
+
+async def save_cached_report(report_type: str, start_date, end_date, watermark: str, file_path: str,
+                             file_size: int, report_format: str = "xlsx") -> int:
+    """Добавляет или заменяет запись кэша за период (file_id прежнего файла сбрасывается). Returns: ReportCache.id."""
+    async with session_scope() as session:
+        await session.execute(delete(ReportCache).where(
+            *_cached_report_key(report_type, report_format, start_date, end_date)))
+        entry = ReportCache(report_type=report_type, report_format=report_format, start_date=start_date,
+                            end_date=end_date, watermark=watermark, file_path=file_path, file_size=file_size,
+                            last_used_at=datetime.now())
+        session.add(entry)
+        await session.flush()
+        return entry.id
+
+
+async def update_cached_report(entry_id: int, **values) -> None:
+    async with session_scope() as session:
+        await session.execute(update(ReportCache).where(ReportCache.id == entry_id).values(**values))
+
+
+async def list_cached_reports() -> List[ReportCache]:
+    """Записи кэша, начиная с давно не использованных."""
+    async with session_manager() as session:
+        return list(await session.scalars(select(ReportCache).order_by(ReportCache.last_used_at, ReportCache.id)))
+
+
+async def delete_cached_reports(entry_ids: List[int]) -> None:
+    if entry_ids:
+        async with session_scope() as session:
+            await session.execute(delete(ReportCache).where(ReportCache.id.in_(entry_ids)))
+
+
 if __name__ == "__main__":
     pass
@@ -0,0 +1,218 @@
+## -*- coding: utf-8 -*-
+
+"""
+Единица работы (unit of work) обработки одного апдейта и репозитории поверх нее.
+
+DBSessionMiddleware передает обработчику data["uow"]: UnitOfWork (наследник LazySession) берет
+соединение из пула только при первом запросе, и все чтения и записи апдейта идут в одной сессии
+и одной транзакции.
+Репозитории (uow.users, uow.profiles, uow.answers, uow.scores) не фиксируют транзакцию сами:
+обработчик вызывает uow.commit() (например, до отправки ответа пользователю), а если не вызвал,
+middleware фиксирует изменения после успешной обработки апдейта и откатывает их при исключении.
+
+Функции app.database.requests, вызванные внутри апдейта, тоже работают в сессии единицы работы
+(см. joined), но в точке сохранения (SAVEPOINT): их commit() только сбрасывает изменения в БД,
+а rollback() и ошибка откатывают лишь изменения самой функции, не затрагивая остальные изменения апдейта.
+"""
+
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Callable, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, AsyncSessionTransaction
+
+from app.config import ENCRIPTION_KEY
+from app.database.database import LazySession, async_session_maker, current_lazy_session, lazy_session
+from app.database.models import User, UserProfile, UserAnswerOptions, UserScore
+from app.utils.encripter import encrypt_message
+
+
+class Repository:
+    """Базовый репозиторий: работает в переданной AsyncSession или в сессии UnitOfWork."""
+
+    def __init__(self, source):
+        self._source = source
+
+    async def _session(self) -> AsyncSession:
+        if isinstance(self._source, UnitOfWork):
+            return await self._source.session()
+        return self._source
+
+
+class UserRepository(Repository):
+    async def get(self, telegram_id: int) -> Optional[User]:
+        session = await self._session()
+        return await session.scalar(select(User).where(User.telegram_id == telegram_id))
+
+    async def get_or_create(self, telegram_id: int) -> User:
+        user = await self.get(telegram_id)
+        if user is None:
+            session = await self._session()
+            user = User(telegram_id=telegram_id)
+            session.add(user)
+            await session.flush()  # user.id
+        return user
+
+
+class ProfileRepository(Repository):
+    async def upsert(self, tg_id: int, full_name: str = None, email: str = None, phone_number: str = None,
+                     city: str = None, status_in_germany: str = None) -> UserProfile:
+        """Добавляет или обновляет профиль пользователя (ФИО, email и телефон шифруются)."""
+        session = await self._session()
+        user = await UserRepository(session).get_or_create(tg_id)
+        profile = await session.scalar(select(UserProfile).where(UserProfile.user_id == user.id))
+        if profile is None:
+            profile = UserProfile(user_id=user.id)
+            session.add(profile)
+        profile.full_name = await encrypt_message(full_name, ENCRIPTION_KEY)
+        profile.email = await encrypt_message(email, ENCRIPTION_KEY)
+        profile.phone_number = await encrypt_message(phone_number, ENCRIPTION_KEY)
+        profile.city = city
+        profile.status_in_germany = status_in_germany
+        await session.flush()
+        return profile
+
+
+class AnswerRepository(Repository):
+    async def option_ids(self, telegram_id: int) -> List[int]:
+        """Идентификаторы выбранных вариантов ответа пользователя в порядке сохранения."""
+        session = await self._session()
+        result = await session.scalars(
+            select(UserAnswerOptions.answer_option_id)
+            .join(User, UserAnswerOptions.user_id == User.id)
+            .where(User.telegram_id == telegram_id)
+            .order_by(UserAnswerOptions.id)
+        )
+        return list(result.all())
+
+
+class ScoreRepository(Repository):
+    async def upsert(self, telegram_id: int, score: int) -> bool:
+        """Добавляет или обновляет балл пользователя. False, если пользователь не зарегистрирован."""
+        session = await self._session()
+        user_id = await session.scalar(select(User.id).where(User.telegram_id == telegram_id))
+        if user_id is None:
+            return False
+        user_score = await session.scalar(select(UserScore).where(UserScore.user_id == user_id))
+        if user_score is None:
+            session.add(UserScore(user_id=user_id, score=score))
+        else:
+            user_score.score = score
+        await session.flush()
+        return True
+
+
+class JoinedSession:
+    """
+    Сессия единицы работы, которую получают функции app.database.requests (см. UnitOfWork.joined).
+    commit() только сбрасывает изменения в БД (flush): транзакцию апдейта фиксирует UnitOfWork.
+    rollback() откатывает точку сохранения, открытую для функции. Остальное делегируется AsyncSession.
+    """
+
+    def __init__(self, session: AsyncSession, savepoint: AsyncSessionTransaction):
+        self._session = session
+        self._savepoint = savepoint
+        self._released = False  # точка сохранения уже зафиксирована или откачена
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    async def commit(self) -> None:
+        await self._session.flush()
+
+    async def rollback(self) -> None:
+        # После ошибки flush точка сохранения неактивна, но откатить ее все равно нужно
+        if not self._released:
+            self._released = True
+            await self._savepoint.rollback()
+
+    async def release(self) -> None:
+        """Фиксирует точку сохранения или, если ошибка flush ее деактивировала, откатывает."""
+        if self._released:
+            return
+        if not self._savepoint.is_active:
+            await self.rollback()
+            return
+        self._released = True
+        await self._savepoint.commit()
+
+
+class UnitOfWork(LazySession):
+    """
+    Сессия и транзакция на время обработки одного апдейта поверх соединения LazySession.
+
+    Соединение берется из пула при первом запросе; задачи, запущенные из обработчика, используют
+    собственные сессии (см. LazySession.usable): одну сессию нельзя использовать конкурентно.
+    """
+
+    def __init__(self, bind: AsyncEngine = None):
+        super().__init__(bind)
+        self._session: Optional[AsyncSession] = None
+        self._after_commit: List[Callable[[], None]] = []
+        self.users = UserRepository(self)
+        self.profiles = ProfileRepository(self)
+        self.answers = AnswerRepository(self)
+        self.scores = ScoreRepository(self)
+
+    async def session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = async_session_maker(bind=await self.connection())
+        return self._session
+
+    @asynccontextmanager
+    async def joined(self) -> AsyncGenerator[JoinedSession, None]:
+        """
+        Сессия единицы работы для функций app.database.requests в точке сохранения (begin_nested):
+        при исключении откатываются только изменения внутри блока, транзакция апдейта продолжается.
+        """
+        session = await self.session()
+        joined = JoinedSession(session, await session.begin_nested())
+        try:
+            yield joined
+        except Exception:
+            await joined.rollback()
+            raise
+        await joined.release()
+
+    def after_commit(self, callback: Callable[[], None]) -> None:
+        """
+        Вызывает callback после фиксации транзакции апдейта (например, кэширует id созданной записи).
+        При откате транзакции callback отбрасывается.
+        """
+        self._after_commit.append(callback)
+
+    async def commit(self) -> None:
+        if self._session is not None:
+            await self._session.commit()
+        callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            callback()
+
+    async def rollback(self) -> None:
+        self._after_commit.clear()
+        if self._session is not None:
+            await self._session.rollback()
+
+    async def close(self) -> None:
+        """Закрывает сессию (незафиксированные изменения откатываются) и возвращает соединение в пул."""
+        self._after_commit.clear()
+        session, self._session = self._session, None
+        try:
+            if session is not None:
+                await session.close()
+        finally:
+            await super().close()
+
+
+def current_unit_of_work() -> Optional[UnitOfWork]:
+    """UnitOfWork текущего апдейта, если ее можно использовать в текущей задаче."""
+    lazy = current_lazy_session()
+    return lazy if isinstance(lazy, UnitOfWork) else None
+
+
+@asynccontextmanager
+async def unit_of_work(bind: AsyncEngine = None) -> AsyncGenerator[UnitOfWork, None]:
+    """Единица работы на время блока: фиксирует изменения при успешном выходе, откатывает при исключении."""
+    async with lazy_session(UnitOfWork(bind)) as uow:
+        yield uow
+        await uow.commit()
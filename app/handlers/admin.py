@@ -7,6 +7,7 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from datetime import datetime
 import os
+import logging
 import pandas as pd
 from io import BytesIO
 import asyncio
@@ -15,7 +16,14 @@ import asyncio
 from app.handlers.common import is_admin
 from app.keyboards import admin_keyboards
 from app.utils.matrix import Matrix
-from app.database.requests import clear_questions_and_options, add_questions_with_options
+from app.utils.matrix_snapshot import snapshot_path
+from app.utils.quiz_cache import get_matrix, invalidate_quiz_data
+from app.utils.question_catalog import bump_catalog_version
+from app.utils.report_cache import clear_report_cache
+from app.utils.rescoring import rescore_all_users
+from app.utils.shablon import Shablon
+from app.database.requests import replace_questions_with_options, load_answer_option_keys
+from app.utils.jobs import JobContext, JobResult, job_handler, job_queue
 
 admin_router = Router()
 
@@ -34,82 +42,123 @@ class UploadingExcelFile(StatesGroup):
     uploading_shablon = State()
 
 
-async def save_questions_to_database(df: pd.DataFrame) -> None:
+async def save_questions_to_database(file_path: str) -> None:
     """
-    Сохраняет вопросы из DataFrame в базу данных.
+    Сохраняет вопросы из файла матрицы file_path в базу данных и снимок матрицы рядом с файлом.
     """
 
-    matrix = Matrix(os.path.join('quiz_data', 'quiz_matrix.xlsx'))
+    matrix = Matrix(file_path)
 
     await matrix.process_matrix_file(matrix.excel_file)  # Загрузка файла
     await matrix.extract_questions()
     print('ВОПРОСЫ:', matrix.questions)
 
-    await clear_questions_and_options()
-    await add_questions_with_options(matrix.questions)
+    # Старые вопросы удаляются и новые добавляются в одной транзакции
+    await replace_questions_with_options(matrix.questions)
+    await clear_report_cache()  # в готовых отчетах прежние тексты вопросов и ответов
 
+    # Привязываем строки матрицы к AnswerOption.id, чтобы считать баллы по идентификаторам
+    matrix.model.bind_option_ids(await load_answer_option_keys())
+    await matrix.save_snapshot()  # бинарный снимок для быстрого запуска и подсчета баллов
 
 
-
-
-
-async def process_excel_file(message: types.Message, state: FSMContext, file_type: str) -> None:
+async def install_excel_file(upload_file_path: str, full_file_path: str, file_type: str) -> None:
     """
-    Функция для обработки Excel-файла с матрицей вопросов.
+    Делает загруженный файл рабочим. Матрица сначала импортируется в БД, и только после этого
+    файл (со снимком) заменяет рабочий: при ошибке импорта остаются прежние файл и вопросы.
     """
-    try:
-        async with asyncio.timeout(60):
-            await message.answer("Начинаю скачивание файла...")
-            file_id = message.document.file_id
-            file_info = await message.bot.get_file(file_id)
-            file_path = file_info.file_path
-            await message.answer("Файл скачивается...")
-
-            # Загрузка файла через HTTP-запрос
-            file_url = f"https://api.telegram.org/file/bot{message.bot.token}/{file_path}"
-            async with aiohttp.ClientSession() as session:
-                async with session.get(file_url) as response:
-                    if response.status != 200:
-                        await message.answer("Ошибка при загрузке файла.")
-                        return
-                    file_bytes = await response.read()
-
-            await message.answer("Файл скачан, начинаю чтение...")
-            excel_file = BytesIO(file_bytes)
-            df = pd.read_excel(excel_file)
-
-            await state.update_data(excel_data=df)
-
-            await message.answer("Файл прочитан, начинаю создание каталога...")
-            quiz_data_dir = "quiz_data"
-            os.makedirs(quiz_data_dir, exist_ok=True)
-
-            await message.answer("Каталог создан, начинаю сохранение файла...")
-            now = datetime.now()
-            timestamp = now.strftime("%Y%m%d_%H%M%S")
-            # file_name = f"quiz_matrix_{timestamp}.xlsx"
-            file_name = f"quiz_{file_type}.xlsx"
-            full_file_path = os.path.join(quiz_data_dir, file_name)
-
-            with open(full_file_path, 'wb') as f:
-                f.write(file_bytes)
-
-            await message.answer("Файл сохранен.")
-
-            num_rows, num_cols = df.shape
-            await message.answer(f"Файл успешно загружен, обработан и сохранен в {full_file_path}!\n"
-                                 f"Количество строк: {num_rows}\n"
-                                 f"Количество столбцов: {num_cols}")
-
-            # Сохранение данных в базу данных
-            if file_type == "matrix":
-                await save_questions_to_database(df)
+    if file_type == "matrix":
+        await save_questions_to_database(upload_file_path)
+    os.replace(upload_file_path, full_file_path)
+    if file_type == "matrix":
+        # mtime и размер файла при замене не меняются, поэтому снимок остается действительным
+        os.replace(snapshot_path(upload_file_path), snapshot_path(full_file_path))
+        bump_catalog_version()  # новые вопросы будут загружены в каталог при следующем старте опроса
+    invalidate_quiz_data(file_type)  # сбрасываем кэш разобранных файлов
 
 
+async def validate_shablon_file(file_path: str) -> None:
+    """
+    Проверяет файл шаблонов ответов: интервалы баллов не должны пересекаться или иметь разрывы.
+    При ошибке выбрасывает ValueError; файл неверной структуры - ошибки разбора pandas (KeyError и др.).
+    """
+    shablon = Shablon(file_path)
+    await shablon.process_shablon_file()
+    await shablon.extract_shablon_data()
 
-    except asyncio.TimeoutError:
-        await message.answer("Превышено время ожидания загрузки файла.")
 
+@job_handler("import_excel", "Загрузка файла")
+async def process_excel_file(ctx: JobContext, file_id: str, file_type: str) -> JobResult:
+    """
+    Фоновая задача обработки Excel-файла с матрицей вопросов или шаблонами ответов.
+    """
+    async with asyncio.timeout(60):
+        await ctx.progress("Файл скачивается...", force=True)
+        file_info = await ctx.bot.get_file(file_id)
+        file_path = file_info.file_path
+
+        # Загрузка файла через HTTP-запрос
+        file_url = f"https://api.telegram.org/file/bot{ctx.bot.token}/{file_path}"
+        async with aiohttp.ClientSession() as session:
+            async with session.get(file_url) as response:
+                if response.status != 200:
+                    raise RuntimeError("Ошибка при загрузке файла.")
+                file_bytes = await response.read()
+
+    return await import_excel_file(ctx, file_bytes, file_type)
+
+
+async def import_excel_file(ctx: JobContext, file_bytes: bytes, file_type: str) -> JobResult:
+    """Проверяет скачанный Excel-файл и делает его рабочим файлом матрицы или шаблонов."""
+    await ctx.progress("Файл скачан, начинаю чтение...", force=True)
+    df = await ctx.run_blocking(pd.read_excel, BytesIO(file_bytes))
+
+    quiz_data_dir = "quiz_data"
+    os.makedirs(quiz_data_dir, exist_ok=True)
+    file_name = f"quiz_{file_type}.xlsx"
+    full_file_path = os.path.join(quiz_data_dir, file_name)
+
+    # Сначала сохраняем во временный файл, чтобы не затереть рабочий файл некорректным
+    upload_file_path = os.path.join(quiz_data_dir, f"upload_{file_name}")
+    with open(upload_file_path, 'wb') as f:
+        f.write(file_bytes)
+
+    if file_type == "shablon":
+        try:
+            await validate_shablon_file(upload_file_path)
+        except Exception as e:
+            # Кроме ошибок проверки интервалов (ValueError) файл может не разобраться вовсе:
+            # нет нужных столбцов (KeyError), не строки в ячейках (AttributeError, TypeError)
+            logging.warning(f"Файл шаблонов отклонен: {e!r}")
+            os.remove(upload_file_path)
+            return JobResult(f"Файл шаблонов отклонен: {e!r}")
+
+    num_rows, num_cols = df.shape
+    await ctx.progress(f"Файл прочитан.\n"
+                       f"Количество строк: {num_rows}\n"
+                       f"Количество столбцов: {num_cols}", force=True)
+
+    # Отмена задачи не прерывает импорт на середине: он доводится до конца, затем задача отменяется
+    install = asyncio.ensure_future(install_excel_file(upload_file_path, full_file_path, file_type))
+    try:
+        await asyncio.shield(install)
+    except asyncio.CancelledError:
+        await asyncio.gather(install, return_exceptions=True)
+        raise
+    finally:
+        for path in (upload_file_path, snapshot_path(upload_file_path)):
+            if os.path.exists(path):  # импорт не удался
+                os.remove(path)
+    return JobResult(f"файл успешно загружен, обработан и сохранен в {full_file_path} "
+                     f"({num_rows} строк, {num_cols} столбцов)")
+
+
+async def enqueue_excel_file(message: types.Message, file_type: str) -> None:
+    """Ставит обработку загруженного Excel-файла в очередь фоновых задач."""
+    try:
+        job_id = await job_queue.submit("import_excel", {"file_id": message.document.file_id, "file_type": file_type},
+                                        chat_id=message.chat.id)
+        await message.answer(f"Файл принят, обработка поставлена в очередь (задача #{job_id}).")
     except Exception as e:
         await message.answer(f"Произошла ошибка при обработке файла: {e}")
 
@@ -134,7 +183,7 @@ async def handle_shablon_upload(message: types.Message, state: FSMContext):
 async def process_document(message: types.Message, state: FSMContext):
     if message.document.mime_type != 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet':
         return await message.answer("Пожалуйста, загрузите файл в формате Excel (.xlsx)")
-    await process_excel_file(message, state, "matrix")
+    await enqueue_excel_file(message, "matrix")
     await state.set_state(state=None)
 
 
@@ -142,7 +191,7 @@ async def process_document(message: types.Message, state: FSMContext):
 async def process_document(message: types.Message, state: FSMContext):
     if message.document.mime_type != 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet':
         return await message.answer("Пожалуйста, загрузите файл в формате Excel (.xlsx)")
-    await process_excel_file(message, state, "shablon")
+    await enqueue_excel_file(message, "shablon")
     await state.set_state(state=None)
 
 
@@ -164,3 +213,52 @@ async def handle_answer_templates(message: types.Message, state: FSMContext):
         await message.reply("У вас нет прав для выполнения этой команды.")
 
 
+@admin_router.message(F.text == "Пересчитать баллы")
+async def rescore_users_handler(message: types.Message):
+    """
+    Ставит пересчет баллов всех пользователей по текущей матрице вопросов в очередь фоновых задач;
+    о ходе выполнения задача сообщает в чат администратора.
+    """
+    if not await is_admin(message.from_user.id):
+        await message.reply("У вас нет прав для выполнения этой команды.")
+        return
+
+    try:
+        await get_matrix()
+    except FileNotFoundError:
+        await message.answer("Матрица вопросов не загружена.")
+        return
+
+    job_id = await job_queue.submit("rescore", chat_id=message.chat.id)
+    await message.answer(f"Пересчет баллов поставлен в очередь (задача #{job_id}).")
+
+
+@job_handler("rescore", "Пересчет баллов")
+async def rescore_users_job(ctx: JobContext) -> JobResult:
+    """Фоновая задача пересчета баллов всех пользователей по текущей матрице."""
+    matrix = await get_matrix()
+
+    async def report_progress(processed: int, total: int, elapsed: float):
+        speed = processed / elapsed if elapsed > 0 else 0
+        await ctx.progress(f"{processed} из {total} пользователей ({speed:.0f} польз./сек.)")
+
+    result = await rescore_all_users(matrix.model, progress_callback=report_progress)
+    await clear_report_cache()  # в готовых отчетах прежние баллы
+    text = f"{result['processed']} пользователей за {result['elapsed']:.1f} сек."
+    if result["skipped"]:
+        text += (f" Пропущено {result['skipped']} пользователей: их ответы не привязаны к матрице, "
+                 f"баллы не изменены.")
+    return JobResult(text)
+
+
+@admin_router.callback_query(F.data.startswith("job_cancel:"))
+async def cancel_job_handler(callback: CallbackQuery):
+    """Отмена фоновой задачи кнопкой в сообщении о ходе ее выполнения."""
+    if not await is_admin(callback.from_user.id):
+        await callback.answer("У вас нет прав для выполнения этой команды.")
+        return
+    job_id = int(callback.data.split(":")[1])
+    if await job_queue.cancel(job_id):
+        await callback.answer(f"Задача #{job_id} отменяется.")
+    else:
+        await callback.answer(f"Задача #{job_id} уже завершена.")
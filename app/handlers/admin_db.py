@@ -9,6 +9,8 @@ from aiogram.enums import ParseMode
 
 from app.database.models import User, UserProfile, Question, AnswerOption, UserAnswerOptions
 from app.database.requests import clean_tables, TABLES_TO_CLEAN
+from app.utils.question_catalog import bump_catalog_version
+from app.utils.identity_cache import identity_cache
 
 db_router = Router()
 
@@ -70,6 +72,10 @@ async def confirm_clear(callback: CallbackQuery):
     """Обработчик подтверждения очистки таблиц."""
     try:
         await clean_tables(selected_tables)
+        if selected_tables & {"questions", "answer_options"}:
+            bump_catalog_version()
+        if "users" in selected_tables:
+            identity_cache.invalidate()
         await callback.message.edit_text(
             f"Таблицы {', '.join(selected_tables)} успешно очищены."
         )
@@ -92,6 +98,9 @@ async def cancel_clear(callback: CallbackQuery):
 
 @db_router.message(F.text == "База данных")
 async def handle_database(message: types.Message):
+    stats = identity_cache.stats()
+    await message.answer(f"Кэш пользователей: {stats['size']} записей, "
+                         f"попаданий {stats['hits']} из {stats['hits'] + stats['misses']} ({stats['hit_rate']:.0%})")
     keyboard = get_tables_keyboard()
     await message.answer("Выбери таблицы для очистки:",
         reply_markup=keyboard,
@@ -5,16 +5,21 @@ from aiogram import F, Router, types, Bot
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
-from aiogram.types import Message, FSInputFile, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from datetime import datetime
+from functools import partial
 
-from app.database.requests import generate_user_profile_report, get_user_answers_data, get_user_answers_data_length
+from app.database.requests import get_user_answers_data_length, get_registered_users_length
+from app.utils.jobs import JobContext, JobResult, job_handler, job_queue
+from app.utils.report_cache import find_cached_report, get_report, remember_report_file_id, report_documents, send_report
+from app.utils.report_writer import PARQUET_AVAILABLE, REPORT_FORMATS
 
 logging.basicConfig(level=logging.INFO)
 
 class ReportForm(StatesGroup):
     date_range = State()
     report_type = State()
+    report_format = State()
 
 
 report_router = Router()
@@ -58,53 +63,84 @@ async def get_date_range(message: types.Message, state: FSMContext):
 
 
 
+@job_handler("report", "Отчет")
+async def report_job(ctx: JobContext, report_type: str, start_date: str, end_date: str,
+                     report_format: str = "xlsx") -> JobResult:
+    """Формирует отчет в фоновой задаче (см. generate_report) или берет готовый файл из кэша отчетов."""
+    if report_type == "profile":
+        # Проверка наличия данных - COUNT(*) в БД, без загрузки строк
+        count = await get_registered_users_length(start_date, end_date)
+        if count is None:
+            raise RuntimeError("Ошибка при подсчете пользователей за период. Пожалуйста, проверьте логи.")
+        if count == 0:
+            return JobResult("За указанный период времени нет зарегистрированных пользователей.")
+        await ctx.progress(f"Профилей за период: {count}, формирую файл...", force=True)
+    elif report_type == "answers":
+        count = await get_user_answers_data_length(start_date, end_date)
+        if count is None:
+            raise RuntimeError("Ошибка при подсчете ответов за период. Пожалуйста, проверьте логи.")
+        if count == 0:
+            logging.warning(f"За указанный период времени ({start_date} - {end_date}) нет статистики по ответам пользователя.")
+            return JobResult("За указанный период времени нет статистики по ответам пользователя.")
+        await ctx.progress(f"Ответов за период: {count}, формирую файл...", force=True)
+    else:
+        raise ValueError(f"Неверный тип отчета: {report_type}")
+
+    report = await get_report(report_type, start_date, end_date, report_format)
+    if report is None:
+        raise RuntimeError("Ошибка при генерации отчета. Пожалуйста, проверьте логи.")
+    documents = await report_documents(report)
+    if documents != [report.file_path]:
+        return JobResult(f"{start_date} - {end_date}: файл больше 50 МБ, отправлен частями ({len(documents)}). "
+                         f"Части собираются командой cat или архиватором 7-Zip.", documents=tuple(documents))
+    document_sent = partial(remember_report_file_id, report.entry_id) if report.entry_id else None
+    return JobResult(f"{start_date} - {end_date}", report.file_path, report.file_id, document_sent)
+
+
 @report_router.callback_query(StateFilter(ReportForm.report_type), F.data.startswith("report_type:"))
-async def generate_report(callback: CallbackQuery, state: FSMContext, bot: Bot):
-    """Generates the report based on the provided data."""
-    report_type = callback.data.split(":")[1]  # Извлекаем тип отчета из callback_data
+async def choose_report_format(callback: CallbackQuery, state: FSMContext):
+    """Сохраняет тип отчета и предлагает выбрать формат файла."""
+    await state.update_data(report_type=callback.data.split(":")[1])
+    formats = [report_format for report_format in REPORT_FORMATS if report_format != "parquet" or PARQUET_AVAILABLE]
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=report_format, callback_data=f"report_format:{report_format}")]
+        for report_format in formats
+    ])
+    await callback.message.answer("Выберите формат файла:", reply_markup=keyboard)
+    await state.set_state(ReportForm.report_format)
+    await callback.answer()
+
+
+@report_router.callback_query(StateFilter(ReportForm.report_format), F.data.startswith("report_format:"))
+async def generate_report(callback: CallbackQuery, state: FSMContext):
+    """
+    Отправляет готовый отчет из кэша или ставит формирование отчета в очередь фоновых задач:
+    файл придет отдельным сообщением.
+    """
+    report_format = callback.data.split(":")[1]  # Извлекаем формат из callback_data
     data = await state.get_data()
+    report_type = data.get('report_type')
     start_date = data.get('start_date')
     end_date = data.get('end_date')
+    await state.clear()  # Clear FSM state
 
     if not start_date or not end_date:
         await callback.message.answer("Необходимо указать временной интервал.")
-        await state.clear()
-        return
-
-    try:
-        if report_type == "profile":
-            filepath = await generate_user_profile_report(start_date, end_date)
-            # await callback.message.answer("Генерация profile отчетов пока не поддерживается.")
-            # await state.clear()
-            # return
-        elif report_type == "answers":
-            # 1. Получаем данные асинхронно
-            count = await get_user_answers_data_length(start_date, end_date)
-            if count == 0:
-                logging.warning(f"За указанный период времени ({start_date} - {end_date}) нет статистики по ответам пользователя.")
-                await callback.message.answer("За указанный период времени нет статистики по ответам пользователя.")
-                await state.clear()
-                return
+    elif report_type not in ("profile", "answers"):
+        await callback.message.answer("Неверный тип отчета.")
+    elif report_format not in REPORT_FORMATS:
+        await callback.message.answer("Неверный формат отчета.")
+    else:
+        try:
+            report = await find_cached_report(report_type, start_date, end_date, report_format)
+            if report is not None:
+                await send_report(callback.bot, callback.message.chat.id, report)
             else:
-                filepath = await get_user_answers_data(start_date, end_date)
-        else:
-            await callback.message.answer("Неверный тип отчета.")
-            await state.clear()
-            return
-
-        if filepath:
-            try:
-                document = FSInputFile(filepath)  # Создаем FSInputFile
-                await bot.send_document(callback.message.chat.id, document=document)  # Отправляем документ
-            except FileNotFoundError:
-                await callback.message.answer("Ошибка: Файл не найден.")
-        else:
-            await callback.message.answer("Ошибка при генерации отчета. Пожалуйста, проверьте логи.")
-
-    except Exception as e:
-        logging.error(f"Error in generate_report handler: {e}")
-        await callback.message.answer("Произошла ошибка при генерации отчета.")
-    finally:
-        await state.clear()  # Clear FSM state
+                job_id = await job_queue.submit("report", {"report_type": report_type, "start_date": start_date,
+                                                           "end_date": end_date, "report_format": report_format},
+                                                chat_id=callback.message.chat.id)
+                await callback.message.answer(f"Отчет поставлен в очередь (задача #{job_id}).")
+        except Exception as e:
+            logging.error(f"Error in generate_report handler: {e}")
+            await callback.message.answer("Произошла ошибка при генерации отчета.")
     await callback.answer()  # Обязательно нужно ответить на callbackQuery
-
@@ -2,7 +2,7 @@
 
 from aiogram import Router, types
 from aiogram.filters import CommandStart, Command
-from app.database.requests import add_user, get_user_by_telegram_id
+from app.utils.identity_cache import get_user_id
 from app.config import ADMIN_IDS
 import app.keyboards.user_keyboards as user_kb
 import app.keyboards.admin_keyboards as admin_kb
@@ -27,21 +27,14 @@ async def start_handler(message: types.Message):
         # админ
         await message.reply("Привет, админ!", reply_markup=admin_kb.admin_keyboard)
     else:
-        # user
-        user = await get_user_by_telegram_id(user_id) # используем await
-        if not user:
-            await add_user(user_id)
-            await message.answer(f"""
-            Привет!\nЯ твой цифровой ассистент FinCheckUp на пути к твоим целям. Пройдите небольшой отпрос.
-    📌 Это займет всего 3 минуты!
-     """, reply_markup=user_kb.start_test)
-            # if user_id in ADMIN_IDS:
-            #     await set_admin_status(user_id, True, session)  # используем await
-        else:
-            await message.answer(f"""
+        # user: регистрация (если нужно) - не больше одного запроса, повторный /start - из кэша
+        await get_user_id(user_id, create=True)
+        await message.answer(f"""
             Привет!\nЯ твой цифровой ассистент FinCheckUp на пути к твоим целям. Пройдите небольшой отпрос.
     📌 Это займет всего 3 минуты!
      """, reply_markup=user_kb.start_test)
+        # if user_id in ADMIN_IDS:
+        #     await set_admin_status(user_id, True, session)  # используем await
 
 
 @common_router.message(Command("help"))
@@ -6,9 +6,8 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from app.config import MANAGER_TELEGRAM_ID
-from app.database.requests import add_new_user_profile, get_user_answers, upsert_user_score_by_telegram_id
-from app.utils.matrix import Matrix
-from app.utils.shablon import Shablon
+from app.database.unit_of_work import UnitOfWork
+from app.utils.quiz_cache import get_matrix, get_shablon
 from app.keyboards.user_keyboards import consult_record, user_status_in_germany_keyboard
 from app.utils.validators import (validate_email, normalize_phone_number, validate_international_phone_number_basic,
                                   validate_full_name, validate_city_name)
@@ -80,7 +79,7 @@ async def register_user_status(message: Message, state: FSMContext):
 
 
 @user_router.callback_query(UserProfileData.waiting_for_status_in_germany)
-async def add_user_profile(callback: CallbackQuery, state: FSMContext):
+async def add_user_profile(callback: CallbackQuery, state: FSMContext, uow: UnitOfWork):
     await callback.answer()
     status_in_germany = callback.data
     if validate_city_name(status_in_germany):
@@ -90,31 +89,41 @@ async def add_user_profile(callback: CallbackQuery, state: FSMContext):
         data = await state.get_data()
         try:
             data['tg_id'] = callback.from_user.id  # ИСПРАВЛЕНО: используем callback.from_user.id
-            success = await add_new_user_profile(**data)
-            if success:
-                print("User profile added successfully.")
-                user_answers = await get_user_answers(callback.from_user.id) # ИСПРАВЛЕНО
-                if len(user_answers) == 0:
-                    await callback.message.answer("Отлично! Вы прошли наш небольшой опрос.", reply_markup=consult_record)
-                else:
-                    matrix = Matrix(os.path.join('quiz_data','quiz_matrix.xlsx'))
-                    await matrix.process_matrix_file(matrix.excel_file)
-                    user_points = await matrix.calculate_points(user_answers)
-                    await upsert_user_score_by_telegram_id(callback.from_user.id, user_points) # ИСПРАВЛЕНО
-                    print('user_points:', user_points)
-                    shablon = Shablon(os.path.join('quiz_data', 'quiz_shablon.xlsx'))
-                    await shablon.process_shablon_file()
-                    await shablon.extract_shablon_data()
-                    user_results = await shablon.get_shablon(user_points)
-                    print(user_results)
-                    await state.clear()
-                    if user_results is None:
-                        user_results = "---"
-                    await callback.message.answer(user_results, reply_markup=consult_record)
+            # Счет, набранный по ходу опроса (см. user_test.update_running_score)
+            quiz_score = data.pop('quiz_score', None)
+            quiz_matrix_version = data.pop('quiz_matrix_version', None)
+            await uow.profiles.upsert(**data)
+            user_points = None
+            if quiz_score is not None:
+                matrix = await get_matrix()
+                if matrix.version == quiz_matrix_version:
+                    user_points = quiz_score
+            if user_points is None:
+                # Полный пересчет, если счет не вели или матрица сменилась
+                user_answer_ids = await uow.answers.option_ids(callback.from_user.id)
+                if user_answer_ids:
+                    matrix = await get_matrix()
+                    user_points = await matrix.calculate_points_by_ids(user_answer_ids)
+            if user_points is not None:
+                await uow.scores.upsert(callback.from_user.id, user_points)
+            # Профиль и балл - одной транзакцией, до ответа пользователю
+            await uow.commit()
+            print("User profile added successfully.")
+
+            if user_points is None:
+                await callback.message.answer("Отлично! Вы прошли наш небольшой опрос.", reply_markup=consult_record)
             else:
-                print("Failed to add user profile.")
+                print('user_points:', user_points)
+                shablon = await get_shablon()
+                user_results = await shablon.get_shablon(user_points)
+                print(user_results)
+                await state.clear()
+                if user_results is None:
+                    user_results = "---"
+                await callback.message.answer(user_results, reply_markup=consult_record)
         except Exception as e:
             logging.error(f"Ошибка добавления профиля пользователя {e}")
+            await uow.rollback()
             await state.clear()
 
     else:
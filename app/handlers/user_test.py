@@ -1,16 +1,21 @@
 ## -*- coding: utf-8 -*-
 
 import logging
-from typing import List, Dict, Any
+from typing import List
 
 from aiogram import F, Router, types
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from app.database.requests import (load_questions, get_user_by_telegram_id, save_answer, clear_user_answer_options)
-from app.database.models import QuestionType
-from app.keyboards.user_keyboards import create_keyboard, personal_data, allow_personal_data_keyboard
+from app.database.requests import clear_user_answer_options
+from app.keyboards.user_keyboards import (question_keyboard, personal_data, allow_personal_data_keyboard,
+                                          start_test as start_test_keyboard)
+from app.utils.answer_buffer import answer_buffer
+from app.utils.matrix import to_score_value
+from app.utils.quiz_cache import get_matrix
+from app.utils.quiz_session import (QuizSession, start_quiz_session, get_quiz_session, next_quiz_question,
+                                   save_selected_options)
 
 # Импортируем session_manager
 from app.database.requests import session_manager
@@ -19,52 +24,29 @@ from app.database.requests import session_manager
 class UserState(StatesGroup):
     waiting_for_answer = State()
 
-# Глобальные переменные для хранения вопросов и текущего вопроса
-all_questions: List[Dict[str, Any]] = []
-current_question_index = 0
 logging.basicConfig(level=logging.INFO)
 
 user_test_router = Router()
 
-async def load_data():
-    global all_questions
-    all_questions = await load_questions()
-
 @user_test_router.callback_query(F.data == 'start_test')
 async def start_test(callback: CallbackQuery, state: FSMContext):
-    global current_question_index
-    current_question_index = 0
     try:
         await state.clear()
-        await load_data()
-        print(f"All questions: {all_questions}") # Debug print
-        await state.set_state(UserState.waiting_for_answer)
-
-        if not all_questions:
+        # Прогресс опроса хранится в состоянии пользователя, вопросы - в общем каталоге (без запросов к БД)
+        session = await start_quiz_session(state)
+        if session is None:
             await callback.message.answer("Вопросы не найдены. Пожалуйста, убедитесь, что база данных заполнена.")
             return
+        await state.set_state(UserState.waiting_for_answer)
 
-        question = all_questions[current_question_index]
         try:
+            await answer_buffer.discard(callback.from_user.id)  # несохраненные ответы прошлой попытки
             await clear_user_answer_options(callback.from_user.id)
         except Exception as e:
             logging.exception(f"Error in clear_user_answer_options({callback.from_user.id}) function: {e}")
             await callback.message.answer(f"Произошла ошибка: {e}")
 
-        try:
-
-            is_multiple_choice = QuestionType(question["type"]) == QuestionType.MULTIPLE_CHOICE
-        except ValueError as e:
-            logging.error(f"Invalid QuestionType in database: {question['type']}. Error: {e}")
-            is_multiple_choice = False
-
-        print("Creating keyboard...")  # Debug print
-        keyboard = create_keyboard(question["options"], is_multiple_choice)
-        print(f"Keyboard created: {keyboard}") #Debug print
-
-        print("Sending message...") #Debug print
-        await callback.message.answer(f"{current_question_index + 1}. {question['question']}", reply_markup=keyboard)
-        await state.update_data(question_index=current_question_index, selected_options=set())
+        await send_question(callback.message, session)
     except Exception as e:
         logging.exception(f"Error in start function: {e}")
         await callback.message.answer(f"Произошла ошибка: {e}")
@@ -73,17 +55,17 @@ async def start_test(callback: CallbackQuery, state: FSMContext):
 @user_test_router.callback_query(UserState.waiting_for_answer)
 async def button(query: CallbackQuery, state: FSMContext):
     await query.answer()
-    data = await state.get_data()
-    question_index = data["question_index"]
-    question = all_questions[question_index]
-    try:
-        is_multiple_choice = QuestionType(question["type"]) == QuestionType.MULTIPLE_CHOICE
-    except ValueError:
-        # Обработка случая, когда значение в базе данных не является допустимым QuestionType
-        logging.error(f"Invalid QuestionType in database: {question['type']}")
-        is_multiple_choice = False  # Или другое значение по умолчанию
+    session = await get_quiz_session(state)
+    if session is None:
+        # Вопросы были перезагружены администратором во время опроса
+        await state.clear()
+        await query.message.answer("Вопросы опроса были обновлены. Пожалуйста, начните опрос заново.",
+                                   reply_markup=start_test_keyboard)
+        return
+    question = session.question
+    is_multiple_choice = question.is_multiple_choice
 
-    selected_options = data.get("selected_options", set())
+    selected_options = session.selected_options
 
     if query.data.startswith("option_"):
         key = query.data.split("_")[1]
@@ -92,23 +74,21 @@ async def button(query: CallbackQuery, state: FSMContext):
                 selected_options.remove(key)  # Убрать из выбранных
             else:
                 selected_options.add(key)  # Добавить в выбранные
-            keyboard = create_keyboard(question["options"], is_multiple_choice, selected_options)
+            keyboard = question_keyboard(session.catalog.version, question, selected_options)
             await query.message.edit_reply_markup(reply_markup=keyboard)  # Update keyboard immediately
-            await state.update_data(selected_options=selected_options) # Update selected options
+            await save_selected_options(state, selected_options) # Update selected options
         else:
             # Single choice
             selected_option_index = int(key)
-            selected_option_name = question["options"][selected_option_index]
+            selected_option_name = question.options[selected_option_index]
 
-            # Get user and question IDs
-            user = await get_user_by_telegram_id(query.from_user.id)
-            if user:
-                await save_answer(user.id, question["id"], [key])  # save the answer
-            else:
-                logging.error(f"User not found for telegram_id: {query.from_user.id}")
+            # Ответ записывается в БД пакетом в конце опроса (см. answer_buffer)
+            option_ids = [question.option_ids[selected_option_index]]
+            answer_buffer.add(query.from_user.id, question.id, option_ids)
+            await update_running_score(state, option_ids)
 
             await query.message.edit_text(f"Вы выбрали: {selected_option_name}")
-            await next_question(query.message, state) # Go to the next question
+            await next_question(query.message, state, session, query.from_user.id) # Go to the next question
     elif query.data == "done":
         # Обработка завершения выбора для multiple choice
         if not selected_options:
@@ -116,40 +96,56 @@ async def button(query: CallbackQuery, state: FSMContext):
             await query.answer("Вы не выбрали ни одного варианта. Пожалуйста, выберите хотя бы один.", show_alert=True)
             return  # Exit the handler if no options are selected
 
-        selected_option_names = [question["options"][int(key)] for key in selected_options]
+        selected_option_names = [question.options[int(key)] for key in selected_options]
 
-        # Get user and question IDs
-        user = await get_user_by_telegram_id(query.from_user.id)
-        if user:
-            await save_answer(user.id, question["id"], list(selected_options))  # save the answer
-        else:
-            logging.error(f"User not found for telegram_id: {query.from_user.id}")
+        option_ids = [question.option_ids[int(key)] for key in selected_options]
+        answer_buffer.add(query.from_user.id, question.id, option_ids)
+        await update_running_score(state, option_ids)
         print(selected_option_names)
         await query.message.edit_text("Вы выбрали: \n" + ', \n'.join(selected_option_names))
-        await next_question(query.message, state)  # Go to the next question
-
-# Функция для перехода к следующему вопросу
-async def next_question(message: types.Message, state: FSMContext):
-    global current_question_index
-    current_question_index += 1
+        await next_question(query.message, state, session, query.from_user.id)  # Go to the next question
+
+async def send_question(message: types.Message, session: QuizSession):
+    question = session.question
+    keyboard = question_keyboard(session.catalog.version, question)
+    await message.answer(f"{session.number}. {question.text}", reply_markup=keyboard)
+
+async def update_running_score(state: FSMContext, new_option_ids: List[int]):
+    """
+    Добавляет к текущему счету опроса баллы за новые ответы: их базовые баллы и
+    корректировки относительно уже данных ответов. К концу опроса итоговый счет уже готов.
+    """
+    try:
+        matrix = await get_matrix()
+    except FileNotFoundError:
+        return
+    data = await state.get_data()
+    option_ids = data.get("quiz_option_ids", [])
+    score = data.get("quiz_score", 0)
+    if data.get("quiz_matrix_version") != matrix.version:
+        # Матрица сменилась во время опроса - пересчитываем по уже данным ответам
+        score = matrix.model.score_ids(option_ids)
+    score = to_score_value(score + matrix.model.score_ids_increment(option_ids, new_option_ids))
+    await state.update_data(quiz_option_ids=option_ids + new_option_ids, quiz_score=score,
+                            quiz_matrix_version=matrix.version)
 
-    if current_question_index < len(all_questions):
-        question = all_questions[current_question_index]
-        try:
-            is_multiple_choice = QuestionType(question["type"]) == QuestionType.MULTIPLE_CHOICE
-        except ValueError:
-            # Обработка случая, когда значение в базе данных не является допустимым QuestionType
-            logging.error(f"Invalid QuestionType in database: {question['type']}")
-            is_multiple_choice = False  # Или другое значение по умолчанию
 
-        keyboard = create_keyboard(question["options"], is_multiple_choice)
-        await message.answer(f"{current_question_index + 1}. {question['question']}", reply_markup=keyboard)
-        await state.update_data(question_index=current_question_index, selected_options=set())  # Reset selected_options
+# Функция для перехода к следующему вопросу
+async def next_question(message: types.Message, state: FSMContext, session: QuizSession, telegram_id: int):
+    session = await next_quiz_question(state, session)
 
+    if session is not None:
+        await send_question(message, session)
         await state.set_state(UserState.waiting_for_answer) # Ensure state is reset
     else:
+        # Все ответы опроса - одним INSERT; при ошибке они останутся в буфере до следующей попытки
+        await answer_buffer.flush(telegram_id)
         await message.answer("Поздравляю, ваши первые результаты готовы!")
+        data = await state.get_data()
         await state.clear()
+        # Итоговый счет сохраняем до регистрации профиля (см. user.add_user_profile)
+        if "quiz_score" in data:
+            await state.update_data(quiz_score=data["quiz_score"], quiz_matrix_version=data["quiz_matrix_version"])
         await message.answer("""Мы заботимся о ваших персональных данных и соблюдаем законодательство ЕС, поэтому просим вас подтвердить свое согласие на обработку персональных данных в Deutsche Vermögensberatung AG (DVAG) в рамках финансового консультирования в соответствии с GDPR / DSGVO.
 
  📌 Кто обрабатывает данные?
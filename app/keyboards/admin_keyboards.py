@@ -8,9 +8,17 @@ from aiogram.types import (ReplyKeyboardMarkup, KeyboardButton,
 admin_keyboard = ReplyKeyboardMarkup(keyboard=[
     [KeyboardButton(text="Загрузить матрицу вопросов")],
     [KeyboardButton(text="Загрузить шаблоны ответов")],
+    [KeyboardButton(text="Пересчитать баллы")],
     [KeyboardButton(text="Отчеты"),
     KeyboardButton(text="База данных")]
                                      ],
 input_field_placeholder='Ваш выбор:',
 resize_keyboard=True)
 
+
+
+def job_cancel_keyboard(job_id: int) -> InlineKeyboardMarkup:
+    """Кнопка отмены фоновой задачи (app/utils/jobs.py)."""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="Отменить", callback_data=f"job_cancel:{job_id}")]
+    ])
@@ -3,7 +3,8 @@
 from aiogram.types import (ReplyKeyboardMarkup, KeyboardButton,
                            InlineKeyboardMarkup, InlineKeyboardButton)
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from typing import List, Dict, Any
+from collections import OrderedDict
+from typing import List, Dict, Any, Iterable
 
 # from app.database.requests import get_categories, get_category_item
 
@@ -81,6 +82,85 @@ def create_keyboard(options: List[str], is_multiple_choice: bool = False, select
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+# ---------------------- кэш клавиатур опроса ------------------------------------------
+
+QUIZ_KEYBOARD_CACHE_SIZE = 1024  # сколько клавиатур с отмеченными вариантами держать в памяти
+
+
+def selected_mask(selected_options: Iterable[str]) -> int:
+    """Битовая маска выбранных вариантов: бит i установлен, если выбран вариант с индексом i."""
+    mask = 0
+    for key in selected_options:
+        mask |= 1 << int(key)
+    return mask
+
+
+class QuizKeyboardCache:
+    """
+    Готовые клавиатуры вопросов опроса одной, текущей версии каталога по ключу
+    (id вопроса, маска выбранных вариантов).
+
+    Клавиатуры без отмеченных вариантов строятся сразу для всего каталога (prebuild),
+    варианты с отметками (multiple choice) создаются при первом нажатии и вытесняются по LRU.
+    Запрос с более новой версией каталога сбрасывает все клавиатуры; запрос с устаревшей версией
+    (опрос начат до загрузки новой матрицы) получает клавиатуру, построенную без сохранения в кэше.
+    Объекты InlineKeyboardMarkup не изменяются после создания, поэтому их можно отправлять повторно.
+    """
+
+    def __init__(self, maxsize: int = QUIZ_KEYBOARD_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._version = None
+        self._unselected: Dict[int, InlineKeyboardMarkup] = {}
+        self._toggled: "OrderedDict[tuple, InlineKeyboardMarkup]" = OrderedDict()
+
+    def prebuild(self, version: int, questions) -> None:
+        """Строит клавиатуры без отметок для всех вопросов каталога и сбрасывает клавиатуры прошлых версий."""
+        self._unselected = {q.id: create_keyboard(q.options, q.is_multiple_choice) for q in questions}
+        self._toggled.clear()
+        self._version = version
+
+    def get(self, version: int, question, selected_options: Iterable[str] = ()) -> InlineKeyboardMarkup:
+        if self._version is not None and version < self._version:
+            # Устаревшая версия не должна вытеснять клавиатуры текущего каталога
+            selected = set(selected_options) if question.is_multiple_choice else None
+            return create_keyboard(question.options, question.is_multiple_choice, selected)
+        if version != self._version:
+            # Каталог сменился - клавиатуры прошлой версии больше не нужны
+            self._unselected = {}
+            self._toggled.clear()
+            self._version = version
+
+        mask = selected_mask(selected_options) if question.is_multiple_choice else 0
+        if mask == 0:
+            keyboard = self._unselected.get(question.id)
+            if keyboard is None:
+                keyboard = self._unselected[question.id] = create_keyboard(question.options,
+                                                                            question.is_multiple_choice)
+            return keyboard
+
+        key = (question.id, mask)
+        keyboard = self._toggled.get(key)
+        if keyboard is not None:
+            self._toggled.move_to_end(key)
+            return keyboard
+        selected = {str(i) for i in range(len(question.options)) if mask >> i & 1}
+        keyboard = self._toggled[key] = create_keyboard(question.options, True, selected)
+        if len(self._toggled) > self.maxsize:
+            self._toggled.popitem(last=False)
+        return keyboard
+
+    def __len__(self) -> int:
+        return len(self._unselected) + len(self._toggled)
+
+
+quiz_keyboards = QuizKeyboardCache()
+
+
+def question_keyboard(version: int, question, selected_options: Iterable[str] = ()) -> InlineKeyboardMarkup:
+    """Клавиатура вопроса каталога версии version с отмеченными вариантами selected_options."""
+    return quiz_keyboards.get(version, question, selected_options)
+
+
 # async def categories():
 #     all_categories = await get_categories()
 #     keyboard = InlineKeyboardBuilder()
@@ -0,0 +1,183 @@
+## -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import logging
+import os
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from app.database.requests import bulk_save_answers
+from app.database.unit_of_work import current_unit_of_work
+from app.utils.identity_cache import identity_cache
+
+ANSWER_FLUSH_INTERVAL = 10.0  # сек, периодическое сохранение буфера
+ANSWER_FLUSH_SIZE = 1000  # при таком количестве накопленных ответов буфер сохраняется сразу
+PENDING_ANSWERS_FILE = os.path.join('quiz_data', 'pending_answers.jsonl')
+
+
+class AnswerBuffer:
+    """
+    Буфер отложенной записи ответов опроса.
+
+    Ответы копятся в памяти по telegram_id пользователя и записываются в user_answer_options
+    одним пакетным INSERT: в конце опроса пользователя, периодически и при переполнении буфера.
+    Если запись не удалась, ответы остаются в буфере до следующей попытки; ответы, которые БД
+    отвергает (например, ссылка на удаленный вариант ответа), отбрасываются, чтобы не блокировать
+    остальные. При остановке бота несохраненные ответы выгружаются в файл spool_file и загружаются
+    обратно при следующем запуске; файл удаляется, когда все ответы из него сохранены.
+    """
+
+    def __init__(self, flush_size: int = ANSWER_FLUSH_SIZE, flush_interval: float = ANSWER_FLUSH_INTERVAL,
+                 spool_file: str = PENDING_ANSWERS_FILE):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.spool_file = spool_file
+        self._pending: Dict[int, List[Tuple[int, int]]] = {}  # telegram_id -> [(question_id, option_id)]
+        self._size = 0
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop = None
+        self._periodic_task: Optional[asyncio.Task] = None
+        self._flush_tasks = set()
+        self._spooled: Counter = Counter()  # ответы из spool_file, еще не сохраненные в БД
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _get_lock(self) -> asyncio.Lock:
+        # Блокировка привязывается к циклу событий, поэтому создается в том цикле, где используется
+        loop = asyncio.get_running_loop()
+        if self._lock_loop is not loop:
+            self._lock, self._lock_loop = asyncio.Lock(), loop
+        return self._lock
+
+    def add(self, telegram_id: int, question_id: int, option_ids: List[int]) -> None:
+        """Добавляет выбранные варианты ответа на вопрос. Запись в БД - позже, пакетом."""
+        self._pending.setdefault(telegram_id, []).extend((question_id, option_id) for option_id in option_ids)
+        self._size += len(option_ids)
+        if self._size >= self.flush_size:
+            task = asyncio.create_task(self.flush())
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+
+    def _take(self, telegram_id: Optional[int]) -> List[tuple]:
+        if telegram_id is None:
+            pending, self._pending = self._pending, {}
+        else:
+            rows = self._pending.pop(telegram_id, None)
+            pending = {telegram_id: rows} if rows else {}
+        answers = [(tg_id, question_id, option_id)
+                   for tg_id, rows in pending.items() for question_id, option_id in rows]
+        self._size -= len(answers)
+        return answers
+
+    def _put_back(self, answers: List[tuple]) -> None:
+        returned = {}
+        for telegram_id, question_id, option_id in answers:
+            returned.setdefault(telegram_id, []).append((question_id, option_id))
+        for telegram_id, rows in returned.items():
+            # Возвращенные ответы старше тех, что успели прийти во время записи
+            self._pending[telegram_id] = rows + self._pending.get(telegram_id, [])
+        self._size += len(answers)
+
+    async def flush(self, telegram_id: Optional[int] = None) -> bool:
+        """
+        Записывает в БД ответы пользователя telegram_id (или все накопленные ответы).
+        Возвращает False, если запись не удалась; ответы при этом остаются в буфере.
+        """
+        async with self._get_lock():
+            answers = self._take(telegram_id)
+            if not answers:
+                return True
+            known_user_ids = identity_cache.get_many({tg_id for tg_id, _, _ in answers})
+            try:
+                try:
+                    saved = await bulk_save_answers(answers, known_user_ids)
+                except IntegrityError as e:
+                    logging.warning(f"Пакет ответов отвергнут БД ({e}), сохраняю ответы по одному")
+                    saved = await self._save_each(answers, known_user_ids)
+                uow = current_unit_of_work()
+                if uow is not None:
+                    # Внутри апдейта ответы фиксируются до того, как буфер их забудет:
+                    # ошибка дальше в обработчике откатила бы их вместе с транзакцией апдейта
+                    await uow.commit()
+            except Exception as e:
+                logging.error(f"Ошибка при сохранении ответов ({len(answers)} шт.), повтор позже: {e}")
+                self._put_back(answers)
+                return False
+            logging.info(f"Сохранено ответов: {saved}")
+            self._forget_spooled(answers)
+            return True
+
+    @staticmethod
+    async def _save_each(answers: List[tuple], known_user_ids: Dict[int, int]) -> int:
+        """Сохраняет ответы по одному; ответы, которые БД отвергает, отбрасываются."""
+        saved = 0
+        for answer in answers:
+            try:
+                saved += await bulk_save_answers([answer], known_user_ids)
+            except IntegrityError as e:
+                logging.error(f"Ответ {answer} отброшен: {e}")
+        return saved
+
+    def _forget_spooled(self, answers: List[tuple]) -> None:
+        """Удаляет spool_file, когда все загруженные из него ответы сохранены."""
+        if not self._spooled:
+            return
+        self._spooled -= Counter(answers)
+        if not self._spooled and os.path.exists(self.spool_file):
+            os.remove(self.spool_file)
+
+    async def discard(self, telegram_id: int) -> None:
+        """Удаляет несохраненные ответы пользователя (опрос начат заново)."""
+        async with self._get_lock():
+            rows = self._pending.pop(telegram_id, ())
+            self._size -= len(rows)
+            self._forget_spooled([(telegram_id, question_id, option_id) for question_id, option_id in rows])
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self) -> None:
+        """Загружает ответы, оставшиеся с прошлого запуска, и запускает периодическое сохранение."""
+        if os.path.exists(self.spool_file):
+            with open(self.spool_file, encoding='utf-8') as f:
+                answers = [tuple(json.loads(line)) for line in f if line.strip()]
+            self._put_back(answers)
+            self._spooled = Counter(answers)
+            logging.info(f"Загружено несохраненных ответов с прошлого запуска: {len(answers)}")
+            await self.flush()
+        if self._periodic_task is None:
+            self._periodic_task = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self) -> None:
+        """Останавливает периодическое сохранение и записывает все накопленные ответы."""
+        if self._periodic_task is not None:
+            self._periodic_task.cancel()
+            try:
+                await self._periodic_task
+            except asyncio.CancelledError:
+                pass
+            self._periodic_task = None
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks)
+        if not await self.flush() or self._size:
+            self._spool()
+
+    def _spool(self) -> None:
+        """Выгружает несохраненные ответы в файл (атомарно), чтобы загрузить их при следующем запуске."""
+        answers = self._take(None)
+        self._spooled = Counter()  # файл перезаписывается всеми несохраненными ответами
+        tmp_file = self.spool_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            for answer in answers:
+                f.write(json.dumps(answer) + '\n')
+        os.replace(tmp_file, self.spool_file)
+        logging.warning(f"Несохраненные ответы ({len(answers)} шт.) выгружены в {self.spool_file}")
+
+
+answer_buffer = AnswerBuffer()
@@ -1,17 +1,75 @@
 import asyncio
-from cryptography.fernet import Fernet
 import base64
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Optional, Sequence
+
+from cryptography.fernet import Fernet
+
+DECRYPT_WORKERS = os.cpu_count() or 1  # процессов для пакетной расшифровки
+
+_decrypt_executor: Optional[Executor] = None
+
+
+@lru_cache(maxsize=8)
+def get_cipher(key: bytes) -> Fernet:
+  """Один экземпляр Fernet на ключ (в каждом процессе)."""
+  return Fernet(key)
 
 
 async def encrypt_message(message: str, key: bytes) -> str:
   """Шифрует сообщение с использованием AES."""
-  f = Fernet(key)
-  encrypted_message = f.encrypt(message.encode('utf-8'))
+  encrypted_message = get_cipher(key).encrypt(message.encode('utf-8'))
   return base64.b64encode(encrypted_message).decode('utf-8')
 
 async def decrypt_message(encrypted_message: str, key: bytes) -> str:
   """Дешифрует сообщение, зашифрованное AES."""
-  f = Fernet(key)
   encrypted_message_bytes = base64.b64decode(encrypted_message.encode('utf-8'))
-  decrypted_message = f.decrypt(encrypted_message_bytes).decode('utf-8')
+  decrypted_message = get_cipher(key).decrypt(encrypted_message_bytes).decode('utf-8')
   return decrypted_message
+
+
+def decrypt_columns(rows: Sequence[Sequence], columns: Sequence[int], key: bytes) -> List[list]:
+  """
+  Расшифровывает значения в столбцах columns каждой строки (None -> "").
+  Синхронная функция уровня модуля: выполняется в пуле процессов (см. decrypt_columns_async).
+  """
+  cipher = get_cipher(key)
+  result = []
+  for row in rows:
+    row = list(row)
+    for column in columns:
+      value = row[column]
+      row[column] = cipher.decrypt(base64.b64decode(value)).decode('utf-8') if value else ""
+    result.append(row)
+  return result
+
+
+def get_decrypt_executor() -> Executor:
+  """
+  Пул для пакетной расшифровки: Fernet выполняется в основном под GIL, поэтому при нескольких
+  ядрах - пул процессов (spawn: без копии потоков и соединений бота), при одном - один поток.
+  """
+  global _decrypt_executor
+  if _decrypt_executor is None:
+    if DECRYPT_WORKERS > 1:
+      _decrypt_executor = ProcessPoolExecutor(DECRYPT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    else:
+      _decrypt_executor = ThreadPoolExecutor(1, thread_name_prefix="decrypt")
+  return _decrypt_executor
+
+
+def shutdown_decrypt_executor() -> None:
+  global _decrypt_executor
+  if _decrypt_executor is not None:
+    _decrypt_executor.shutdown(cancel_futures=True)
+    _decrypt_executor = None
+
+
+async def decrypt_columns_async(rows: Sequence[Sequence], columns: Sequence[int], key: bytes,
+                                executor: Executor = None) -> List[list]:
+  """decrypt_columns в пуле расшифровки, не блокируя цикл событий."""
+  loop = asyncio.get_running_loop()
+  return await loop.run_in_executor(executor or get_decrypt_executor(), decrypt_columns, rows, columns, key)
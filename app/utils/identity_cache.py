@@ -0,0 +1,100 @@
+## -*- coding: utf-8 -*-
+
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from app.database.requests import get_or_create_user_id, get_user_id_by_telegram_id
+from app.database.unit_of_work import current_unit_of_work
+
+IDENTITY_CACHE_SIZE = 100_000  # telegram_id -> users.id, около 10 МБ
+IDENTITY_CACHE_TTL = 3600.0  # сек
+
+
+class UserIdentityCache:
+    """
+    Кэш соответствия telegram_id -> users.id с вытеснением по LRU и сроком жизни записи.
+
+    Кэшируются только найденные пользователи: незарегистрированный telegram_id при следующем
+    обращении снова ищется в БД. Счетчики hits/misses показывают эффективность кэша.
+    """
+
+    def __init__(self, maxsize: int = IDENTITY_CACHE_SIZE, ttl: float = IDENTITY_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()  # telegram_id -> (user_id, expires_at)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, telegram_id: int) -> Optional[int]:
+        entry = self._entries.get(telegram_id)
+        if entry is not None:
+            if entry[1] > time.monotonic():
+                self._entries.move_to_end(telegram_id)
+                self.hits += 1
+                return entry[0]
+            del self._entries[telegram_id]
+        self.misses += 1
+        return None
+
+    def get_many(self, telegram_ids) -> Dict[int, int]:
+        """Найденные в кэше users.id для набора telegram_id."""
+        found = {}
+        for telegram_id in telegram_ids:
+            user_id = self.get(telegram_id)
+            if user_id is not None:
+                found[telegram_id] = user_id
+        return found
+
+    def put(self, telegram_id: int, user_id: int) -> None:
+        self._entries[telegram_id] = (user_id, time.monotonic() + self.ttl)
+        self._entries.move_to_end(telegram_id)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, telegram_id: Optional[int] = None) -> None:
+        """Удаляет запись пользователя или, без аргумента, весь кэш (например, после очистки таблицы users)."""
+        if telegram_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(telegram_id, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+identity_cache = UserIdentityCache()
+
+
+async def get_user_id(telegram_id: int, create: bool = False) -> Optional[int]:
+    """
+    users.id пользователя по telegram_id: из кэша или одним запросом к БД.
+
+    Args:
+        create: зарегистрировать пользователя, если его еще нет (INSERT ... ON CONFLICT DO NOTHING).
+    """
+    user_id = identity_cache.get(telegram_id)
+    if user_id is not None:
+        return user_id
+    if create:
+        user_id = await get_or_create_user_id(telegram_id)
+    else:
+        user_id = await get_user_id_by_telegram_id(telegram_id)
+    if user_id is not None:
+        uow = current_unit_of_work()
+        if uow is not None:
+            # Внутри апдейта запись пользователя может быть еще не зафиксирована: при откате
+            # транзакции апдейта в кэше остался бы id несуществующего пользователя
+            uow.after_commit(lambda: identity_cache.put(telegram_id, user_id))
+        else:
+            identity_cache.put(telegram_id, user_id)
+    return user_id
@@ -0,0 +1,291 @@
+## -*- coding: utf-8 -*-
+
+"""
+Очередь фоновых задач: отчеты, загрузка Excel-файлов, пересчет баллов.
+
+Обработчик апдейта только ставит задачу в очередь (job_queue.submit) и сразу отвечает, задачу
+выполняет один из JOB_WORKERS обработчиков очереди. Записи задач хранятся в таблице jobs
+(модель Job): после перезапуска бота задачи, которые не успели выполниться или были прерваны,
+выполняются заново. Блокирующая работа (чтение Excel, запись файлов) выполняется в ограниченном
+пуле потоков очереди через JobContext.run_blocking. О ходе выполнения и результате сообщает
+notifier (TelegramJobNotifier - сообщением в чат с кнопкой отмены и документом с результатом).
+"""
+
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile
+
+from app.database.models import Job, JobStatus
+from app.database.requests import claim_job, create_job, get_job, requeue_interrupted_jobs, update_job
+from app.database.unit_of_work import current_unit_of_work
+from app.keyboards.admin_keyboards import job_cancel_keyboard
+
+JOB_WORKERS = 2  # задач, выполняемых одновременно (и потоков для блокирующей работы)
+JOB_PROGRESS_INTERVAL = 3.0  # сек между сообщениями о ходе выполнения (Telegram ограничивает частоту)
+
+
+class JobResult(NamedTuple):
+    text: Optional[str] = None  # итоговое сообщение
+    document: Optional[str] = None  # путь к файлу, который нужно отправить
+    file_id: Optional[str] = None  # file_id документа, уже загруженного в Telegram (отправляется без загрузки)
+    document_sent: Optional[Callable[[str], Awaitable]] = None  # вызывается с file_id после отправки документа
+    documents: Tuple[str, ...] = ()  # файлы, которые нужно отправить вместо document (например, части файла)
+
+
+class JobHandler(NamedTuple):
+    title: str
+    run: Callable[..., Awaitable[Optional[JobResult]]]
+
+
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str, title: str):
+    """Регистрирует async-функцию (ctx, **params) -> JobResult | None как обработчик задач вида kind."""
+    def decorator(func):
+        JOB_HANDLERS[kind] = JobHandler(title, func)
+        return func
+    return decorator
+
+
+async def send_document(bot, chat_id: int, path: str, file_id: Optional[str] = None) -> str:
+    """
+    Отправляет документ: по file_id без повторной загрузки, если он есть и еще действителен,
+    иначе загружает файл. Returns: file_id отправленного документа.
+    """
+    if file_id:
+        try:
+            await bot.send_document(chat_id, document=file_id)
+            return file_id
+        except TelegramBadRequest as e:
+            logging.warning(f"file_id документа {path} недействителен, файл загружается заново: {e}")
+    message = await bot.send_document(chat_id, document=FSInputFile(path))
+    return message.document.file_id
+
+
+class JobNotifier:
+    """Уведомления о задачах; по умолчанию ничего не делает."""
+
+    async def started(self, job: Job, title: str) -> None:
+        pass
+
+    async def progress(self, job: Job, title: str, text: str) -> None:
+        pass
+
+    async def finished(self, job: Job, title: str, result: Optional[JobResult]) -> None:
+        pass
+
+
+class TelegramJobNotifier(JobNotifier):
+    """Сообщение о ходе выполнения с кнопкой отмены в чате задачи; по завершении - итог и документ."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._messages: Dict[int, object] = {}  # Job.id -> сообщение о ходе выполнения
+
+    async def _show(self, job: Job, text: str, keyboard=None) -> None:
+        message = self._messages.get(job.id)
+        try:
+            if message is None:
+                self._messages[job.id] = await self.bot.send_message(job.chat_id, text, reply_markup=keyboard)
+            else:
+                await message.edit_text(text, reply_markup=keyboard)
+        except Exception as e:
+            logging.warning(f"Не удалось отправить сообщение о задаче #{job.id}: {e}")
+
+    async def started(self, job: Job, title: str) -> None:
+        if job.chat_id is not None:
+            resumed = " (возобновлена после перезапуска)" if job.attempts > 1 else ""
+            await self._show(job, f"Задача #{job.id}: {title} - выполняется{resumed}...", job_cancel_keyboard(job.id))
+
+    async def progress(self, job: Job, title: str, text: str) -> None:
+        if job.chat_id is not None:
+            await self._show(job, f"Задача #{job.id}: {title}\n{text}", job_cancel_keyboard(job.id))
+
+    async def finished(self, job: Job, title: str, result: Optional[JobResult]) -> None:
+        if job.chat_id is None:
+            return
+        if job.status == JobStatus.DONE:
+            text = (result.text if result and result.text else None) or "готово"
+        elif job.status == JobStatus.CANCELLED:
+            text = "отменена"
+        else:
+            text = f"ошибка: {job.error}"
+        await self._show(job, f"Задача #{job.id}: {title} - {text}")
+        self._messages.pop(job.id, None)
+        if result is not None and result.documents:
+            try:
+                for document in result.documents:
+                    await send_document(self.bot, job.chat_id, document)
+            except Exception as e:
+                logging.error(f"Не удалось отправить результат задачи #{job.id}: {e}")
+        elif result is not None and result.document:
+            try:
+                file_id = await send_document(self.bot, job.chat_id, result.document, result.file_id)
+                if result.document_sent is not None and file_id != result.file_id:
+                    await result.document_sent(file_id)
+            except Exception as e:
+                logging.error(f"Не удалось отправить результат задачи #{job.id}: {e}")
+
+
+class JobContext:
+    """Контекст выполняемой задачи для обработчика."""
+
+    def __init__(self, queue: "JobQueue", job: Job, title: str):
+        self.queue = queue
+        self.job = job
+        self.title = title
+        self._last_progress = 0.0
+
+    @property
+    def job_id(self) -> int:
+        return self.job.id
+
+    @property
+    def bot(self):
+        return getattr(self.queue.notifier, "bot", None)
+
+    async def progress(self, text: str, force: bool = False) -> None:
+        """Сообщает о ходе выполнения (не чаще JOB_PROGRESS_INTERVAL, если не force)."""
+        if not force and time.monotonic() - self._last_progress < JOB_PROGRESS_INTERVAL:
+            return
+        self._last_progress = time.monotonic()
+        try:
+            await update_job(self.job.id, progress=text)
+        except Exception as e:
+            logging.warning(f"Не удалось сохранить ход выполнения задачи #{self.job.id}: {e}")
+        await self.queue.notifier.progress(self.job, self.title, text)
+
+    async def run_blocking(self, func, *args):
+        """Выполняет блокирующую функцию в пуле потоков очереди."""
+        return await asyncio.get_running_loop().run_in_executor(self.queue.executor, func, *args)
+
+
+class JobQueue:
+    """Очередь задач с JOB_WORKERS обработчиками и записями задач в БД."""
+
+    def __init__(self, workers: int = JOB_WORKERS, notifier: JobNotifier = None):
+        self.workers = workers
+        self.notifier = notifier or JobNotifier()
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks = []
+        self._running: Dict[int, asyncio.Task] = {}
+        self._cancel_requested = set()
+
+    @property
+    def started(self) -> bool:
+        return self._queue is not None
+
+    async def start(self, notifier: JobNotifier = None) -> int:
+        """
+        Запускает обработчики и ставит в очередь задачи из БД, не выполненные до остановки.
+        Returns: количество восстановленных задач.
+        """
+        if notifier is not None:
+            self.notifier = notifier
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="job")
+        self._queue = asyncio.Queue()
+        pending = await requeue_interrupted_jobs()
+        for job_id in pending:
+            self._queue.put_nowait(job_id)
+        if pending:
+            logging.info(f"Восстановлено фоновых задач: {len(pending)}")
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        return len(pending)
+
+    async def stop(self) -> None:
+        """Останавливает обработчики. Прерванные задачи остаются RUNNING и выполнятся после перезапуска."""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._queue = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def submit(self, kind: str, params: dict = None, chat_id: Optional[int] = None) -> int:
+        """Ставит задачу в очередь и сразу возвращает Job.id."""
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Неизвестный вид задачи: {kind}")
+        job_id = await create_job(kind, params or {}, chat_id)
+        uow = current_unit_of_work()
+        if uow is not None:
+            # Внутри апдейта запись задачи фиксируется сразу: обработчик очереди читает ее в своей сессии
+            await uow.commit()
+        if self._queue is not None:
+            self._queue.put_nowait(job_id)
+        return job_id
+
+    async def cancel(self, job_id: int) -> bool:
+        """Отменяет задачу в очереди или выполняемую. False, если задача уже завершена."""
+        task = self._running.get(job_id)
+        if task is not None:
+            self._cancel_requested.add(job_id)
+            task.cancel()
+            return True
+        job = await get_job(job_id)
+        if job is None or job.status != JobStatus.QUEUED:
+            return False
+        await update_job(job_id, status=JobStatus.CANCELLED, finished_at=datetime.now())
+        return True
+
+    async def join(self) -> None:
+        """Ждет выполнения всех задач в очереди."""
+        await self._queue.join()
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.exception(f"Ошибка обработчика очереди при выполнении задачи #{job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: int) -> None:
+        if not await claim_job(job_id):
+            return  # отменена до начала выполнения
+        job = await get_job(job_id)
+        handler = JOB_HANDLERS.get(job.kind)
+        if handler is None:
+            await update_job(job_id, status=JobStatus.FAILED, error=f"Неизвестный вид задачи: {job.kind}",
+                             finished_at=datetime.now())
+            return
+
+        ctx = JobContext(self, job, handler.title)
+        await self.notifier.started(job, handler.title)
+        task = asyncio.create_task(handler.run(ctx, **json.loads(job.params)))
+        self._running[job_id] = task
+        result = None
+        try:
+            result = await task
+            values = {"status": JobStatus.DONE, "result": result.document if result else None}
+        except asyncio.CancelledError:
+            if job_id not in self._cancel_requested:
+                raise  # остановка бота: задача останется RUNNING и будет выполнена после перезапуска
+            values = {"status": JobStatus.CANCELLED}
+        except Exception as e:
+            logging.exception(f"Ошибка при выполнении задачи #{job_id} ({job.kind}): {e}")
+            values = {"status": JobStatus.FAILED, "error": str(e)}
+        finally:
+            self._running.pop(job_id, None)
+            self._cancel_requested.discard(job_id)
+
+        await update_job(job_id, finished_at=datetime.now(), **values)
+        job = await get_job(job_id)
+        await self.notifier.finished(job, handler.title, result)
+
+
+job_queue = JobQueue()
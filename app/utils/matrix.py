@@ -1,15 +1,259 @@
 ## -*- coding: utf-8 -*-
 
 import pandas as pd
+import numpy as np
 import os
 import asyncio
+import logging
 import aiofiles
 from io import StringIO
 
+from app.utils.matrix_snapshot import snapshot_path, read_snapshot, write_snapshot
+
+ANSWER_COLUMN = 'Ответы / критерии (вес) / баллы'
+BASE_SCORE_COLUMN = 'Базовые баллы'
+CORRECTION_COLUMNS_START = 3  # корректирующие баллы начинаются с 4-го столбца
+
+
+class CompiledMatrix:
+    """
+    Скомпилированная модель подсчета баллов.
+
+    Строится один раз после загрузки матрицы: вектор базовых баллов и плотная матрица
+    корректирующих баллов, индексированные порядковым номером строки-ответа. Подсчет баллов
+    сводится к одной векторной выборке и суммированию по выбранным индексам.
+
+    Выбранные ответы можно передавать текстами (как в pandas-варианте: берется первая строка
+    с таким текстом) или идентификаторами AnswerOption.id. Идентификаторы привязываются
+    к строкам матрицы при импорте (bind_option_ids) по паре (текст вопроса, текст ответа),
+    поэтому одинаковые тексты ответов в разных вопросах не путаются.
+    """
+
+    def __init__(self, answers, questions, base_scores, valid, columns, corrections, option_ids=None):
+        self.answers = list(answers)  # текст каждой строки матрицы
+        self.questions = list(questions)  # текст вопроса, к которому относится строка
+        self.columns = list(columns)  # тексты ответов в заголовках корректирующих столбцов
+        self.base_scores = np.asarray(base_scores, dtype=np.float64)  # NaN - пустой базовый балл
+        self.valid = np.asarray(valid, dtype=bool)  # False - нечисловой базовый балл, строка не учитывается
+        self.corrections = np.asarray(corrections, dtype=np.float64).reshape(len(self.answers), len(self.columns))
+        self.column_index = {column: j for j, column in enumerate(self.columns)}
+        # Корректирующий столбец, соответствующий тексту строки (-1, если его нет)
+        self.row_columns = np.asarray([self.column_index.get(answer, -1) for answer in self.answers], dtype=np.intp)
+
+        # Для текста ответа используется первая строка с таким текстом
+        self.answer_index = {}
+        seen = set()
+        for i, answer in enumerate(self.answers):
+            if answer not in seen:
+                seen.add(answer)
+                if self.valid[i]:
+                    self.answer_index[answer] = i
+
+        if option_ids is None:
+            option_ids = np.zeros(len(self.answers), dtype=np.int64)
+        self._set_option_ids(option_ids)
+
+    def _set_option_ids(self, option_ids):
+        self.option_ids = np.asarray(option_ids, dtype=np.int64)  # AnswerOption.id строки, 0 - не привязана
+        self.option_index = {int(option_id): i for i, option_id in enumerate(self.option_ids)
+                             if option_id and self.valid[i]}
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame) -> 'CompiledMatrix':
+        """Компилирует модель из DataFrame матрицы (см. Matrix.process_matrix_file)."""
+        if df is None or df.empty or ANSWER_COLUMN not in df.columns or BASE_SCORE_COLUMN not in df.columns:
+            return cls([], [], [], [], [], np.zeros((0, 0)))
+
+        base_values = df[BASE_SCORE_COLUMN]
+        base_numbers = pd.to_numeric(base_values, errors='coerce').to_numpy(dtype=np.float64)
+
+        answers, questions, valid, rows = [], [], [], []
+        question = ''
+        for position, text in enumerate(df[ANSWER_COLUMN]):
+            if not isinstance(text, str):
+                continue
+            if '?' in text:
+                question = text
+            is_valid = not (np.isnan(base_numbers[position]) and not _is_blank(base_values.iloc[position]))
+            if not is_valid:
+                # Нечисловой базовый балл: ответ пропускается целиком
+                print(f"WARNING: Не удалось преобразовать базовый балл '{base_values.iloc[position]}' в число для ответа {text}")
+            answers.append(text)
+            questions.append(question)
+            valid.append(is_valid)
+            rows.append(position)
+
+        # Столбцы с повторяющимися названиями не дают корректировок (pandas возвращает для них
+        # несколько значений сразу), поэтому в модель они не попадают
+        names = [col for col in df.columns[CORRECTION_COLUMNS_START:] if isinstance(col, str)]
+        columns = [col for col in dict.fromkeys(names) if names.count(col) == 1]
+
+        if columns and rows:
+            cells = df.iloc[rows][columns].apply(pd.to_numeric, errors='coerce')
+            corrections = cells.fillna(0).to_numpy(dtype=np.float64)
+        else:
+            corrections = np.zeros((len(rows), len(columns)))
+
+        model = cls(answers, questions, base_numbers[rows], valid, columns, corrections)
+        # Ответ не корректирует сам себя
+        own = np.flatnonzero(model.row_columns >= 0)
+        model.corrections[own, model.row_columns[own]] = 0.0
+        return model
+
+    def to_snapshot_parts(self):
+        """Массивы и таблицы строк для сохранения в бинарный снимок (см. matrix_snapshot)."""
+        arrays = {
+            'base_scores': self.base_scores,
+            'valid': self.valid.astype(np.uint8),
+            'corrections': self.corrections,
+            'option_ids': self.option_ids,
+        }
+        strings = {'answers': self.answers, 'questions': self.questions, 'columns': self.columns}
+        return arrays, strings
+
+    @classmethod
+    def from_snapshot_parts(cls, arrays, strings) -> 'CompiledMatrix':
+        return cls(strings['answers'], strings['questions'], arrays['base_scores'], arrays['valid'],
+                   strings['columns'], arrays['corrections'], arrays['option_ids'])
+
+    def bind_option_ids(self, options) -> int:
+        """
+        Привязывает идентификаторы вариантов ответа из БД к строкам матрицы.
+
+        Args:
+            options: пары вида (AnswerOption.id, текст вопроса, текст ответа).
+
+        Returns:
+            Количество привязанных вариантов.
+        """
+        rows = {}
+        for i, (question, answer) in enumerate(zip(self.questions, self.answers)):
+            rows.setdefault((question, answer), i)
+
+        option_ids = np.zeros(len(self.answers), dtype=np.int64)
+        bound = 0
+        for option_id, question, answer in options:
+            i = rows.get((question, answer))
+            if i is None:
+                logging.warning(f"Вариант ответа {option_id} ('{answer}') не найден в матрице.")
+                continue
+            option_ids[i] = option_id
+            bound += 1
+        self._set_option_ids(option_ids)
+        return bound
+
+    @property
+    def has_option_ids(self) -> bool:
+        return bool(self.option_index)
+
+    def unbound_ids(self, option_ids) -> list:
+        """Идентификаторы AnswerOption.id, не привязанные к строкам матрицы."""
+        return [option_id for option_id in option_ids if int(option_id) not in self.option_index]
+
+    def _text_selection(self, answers):
+        """Строки и столбцы для ответов, заданных текстом."""
+        rows = [self.answer_index[answer.strip()] for answer in answers
+                if isinstance(answer, str) and answer.strip() in self.answer_index]
+        columns = {self.column_index[answer] for answer in answers if answer in self.column_index}
+        return rows, columns
+
+    def _id_selection(self, option_ids):
+        """Строки и столбцы для ответов, заданных идентификаторами AnswerOption.id."""
+        rows = [self.option_index[int(option_id)] for option_id in option_ids if int(option_id) in self.option_index]
+        if len(rows) < len(option_ids):
+            logging.warning(f"Варианты ответа не привязаны к матрице: "
+                            f"{[i for i in option_ids if int(i) not in self.option_index]}")
+        columns = {int(self.row_columns[i]) for i in rows if self.row_columns[i] >= 0}
+        return rows, columns
+
+    def _score(self, selection):
+        rows, columns = selection
+        rows = np.asarray(rows, dtype=np.intp)
+        columns = np.asarray(sorted(columns), dtype=np.intp)
+        total = self.base_scores[rows].sum() + self.corrections[np.ix_(rows, columns)].sum()
+        return to_score_value(total)
+
+    def _increment(self, previous, new):
+        previous_rows, previous_columns = previous
+        new_rows, new_columns = new
+        all_columns = np.asarray(sorted(previous_columns | new_columns), dtype=np.intp)
+        added_columns = np.asarray(sorted(new_columns - previous_columns), dtype=np.intp)
+        previous_rows = np.asarray(previous_rows, dtype=np.intp)
+        new_rows = np.asarray(new_rows, dtype=np.intp)
+
+        delta = (self.base_scores[new_rows].sum()
+                 + self.corrections[np.ix_(new_rows, all_columns)].sum()
+                 + self.corrections[np.ix_(previous_rows, added_columns)].sum())
+        return to_score_value(delta)
+
+    def _batch(self, selections) -> np.ndarray:
+        row_counts = np.zeros((len(selections), len(self.answers)))
+        column_mask = np.zeros((len(selections), len(self.columns)))
+        for k, (rows, columns) in enumerate(selections):
+            np.add.at(row_counts[k], np.asarray(rows, dtype=np.intp), 1)
+            column_mask[k, list(columns)] = 1.0
+
+        # NaN в базовых баллах нельзя пускать в умножение матриц: 0 * NaN = NaN
+        nan_base = np.isnan(self.base_scores)
+        base_scores = np.where(nan_base, 0.0, self.base_scores)
+        totals = row_counts @ base_scores + np.einsum('ij,ij->i', row_counts @ self.corrections, column_mask)
+        if nan_base.any():
+            totals[(row_counts[:, nan_base] > 0).any(axis=1)] = np.nan
+        return totals
+
+    def score(self, selected_answers):
+        """Вычисляет общее количество баллов для выбранных ответов (тексты)."""
+        return self._score(self._text_selection(selected_answers))
+
+    def score_ids(self, option_ids):
+        """Вычисляет общее количество баллов для выбранных ответов (AnswerOption.id)."""
+        return self._score(self._id_selection(option_ids))
+
+    def score_increment(self, previous_answers, new_answers):
+        """
+        Прирост баллов при добавлении new_answers к уже данным previous_answers:
+        базовые баллы новых ответов, их корректировки по всем данным ответам и
+        корректировки уже данных ответов по столбцам новых ответов.
+        score(previous + new) == score(previous) + score_increment(previous, new)
+        """
+        return self._increment(self._text_selection(previous_answers), self._text_selection(new_answers))
+
+    def score_ids_increment(self, previous_option_ids, new_option_ids):
+        """То же, что score_increment, для ответов, заданных AnswerOption.id."""
+        return self._increment(self._id_selection(previous_option_ids), self._id_selection(new_option_ids))
+
+    def score_batch(self, selections) -> np.ndarray:
+        """
+        Вычисляет баллы сразу для нескольких наборов ответов-текстов (по одному на пользователя).
+        Возвращает массив float64 той же длины, что и selections.
+        """
+        return self._batch([self._text_selection(selected) for selected in selections])
+
+    def score_ids_batch(self, selections) -> np.ndarray:
+        """То же, что score_batch, для наборов AnswerOption.id."""
+        return self._batch([self._id_selection(selected) for selected in selections])
+
+
+def _is_blank(value) -> bool:
+    """Значение, которое pd.to_numeric превращает в NaN без ошибки."""
+    try:
+        return bool(pd.isna(pd.to_numeric(value)))
+    except (ValueError, TypeError):
+        return False
+
+
+def to_score_value(value):
+    """Приводит сумму к int, если она целая, иначе к float."""
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
 class Matrix:
     def __init__(self, excel_file):
         self.questions = []  # Список вопросов
         self.df = None  # DataFrame для данных из Excel
+        self.model = None  # скомпилированная модель подсчета баллов (CompiledMatrix)
+        self.version = None  # номер загрузки матрицы, присваивается кэшем (см. quiz_cache)
         self.excel_file = excel_file
         # Проверка существования файла
         if not os.path.exists(self.excel_file):
@@ -28,6 +272,25 @@ class Matrix:
         except Exception as e:
             print(f"Ошибка при чтении файла: {e}")
             self.df = pd.DataFrame()  #  пустой DataFrame, чтобы избежать ошибок
+        self.model = await asyncio.to_thread(CompiledMatrix.from_dataframe, self.df)
+
+    async def load_snapshot(self) -> bool:
+        """
+        Загружает скомпилированную модель из бинарного снимка рядом с Excel-файлом.
+        Возвращает False, если снимка нет или он устарел (тогда нужно читать Excel).
+        """
+        parts = await asyncio.to_thread(read_snapshot, snapshot_path(self.excel_file), self.excel_file)
+        if parts is None:
+            return False
+        self.model = CompiledMatrix.from_snapshot_parts(*parts)
+        return True
+
+    async def save_snapshot(self) -> None:
+        """Сохраняет скомпилированную модель в бинарный снимок рядом с Excel-файлом."""
+        if self.model is None:
+            self.model = CompiledMatrix.from_dataframe(self.df)
+        arrays, strings = self.model.to_snapshot_parts()
+        await asyncio.to_thread(write_snapshot, snapshot_path(self.excel_file), self.excel_file, arrays, strings)
 
     async def extract_questions(self):
         """Извлекает вопросы и варианты ответов с баллами из DataFrame."""
@@ -91,6 +354,21 @@ class Matrix:
 
     async def calculate_points(self, selected_answers):
         """Вычисляет общее количество баллов на основе выбранных ответов."""
+        if self.model is None:
+            self.model = CompiledMatrix.from_dataframe(self.df)
+        return self.model.score(selected_answers)
+
+    async def calculate_points_by_ids(self, option_ids):
+        """Вычисляет общее количество баллов по идентификаторам выбранных вариантов ответа."""
+        if self.model is None:
+            self.model = CompiledMatrix.from_dataframe(self.df)
+        return self.model.score_ids(option_ids)
+
+    async def calculate_points_pandas(self, selected_answers):
+        """
+        Эталонный подсчет баллов напрямую по DataFrame.
+        Медленный, используется только для проверки скомпилированной модели.
+        """
         total_points = 0
 
         for answer in selected_answers:
@@ -0,0 +1,139 @@
+## -*- coding: utf-8 -*-
+
+"""
+Бинарный снимок скомпилированной матрицы вопросов (см. CompiledMatrix).
+
+Снимок лежит рядом с quiz_matrix.xlsx и позволяет не разбирать Excel при каждом запуске.
+Формат файла:
+    MAGIC (8 байт) | версия (uint32) | длина заголовка (uint32) | заголовок JSON | массивы
+
+Заголовок содержит mtime и размер исходного xlsx (по ним снимок признается устаревшим)
+и описание массивов: dtype, shape и смещение от начала области данных. Массивы выровнены по 8 байт
+и читаются через np.memmap без копирования. Строки (тексты ответов, вопросов и названия столбцов)
+хранятся как таблицы строк: общий UTF-8 буфер и массив смещений.
+
+Версия 2: строки матрицы хранятся все (включая повторяющиеся тексты), добавлены
+признак корректного базового балла, тексты вопросов и привязка к AnswerOption.id.
+"""
+
+import json
+import logging
+import os
+import struct
+
+import numpy as np
+
+SNAPSHOT_MAGIC = b'QMSNAP\x00\x00'
+SNAPSHOT_VERSION = 2
+_PREFIX = struct.Struct('<8sII')
+_ALIGNMENT = 8
+_BLOB_SUFFIX = '__blob'
+_OFFSETS_SUFFIX = '__offsets'
+
+
+def snapshot_path(excel_file: str) -> str:
+    """Путь к снимку для указанного xlsx-файла матрицы."""
+    return os.path.splitext(excel_file)[0] + '.snapshot'
+
+
+def _align(size: int) -> int:
+    return -(-size // _ALIGNMENT) * _ALIGNMENT
+
+
+def _encode_strings(strings):
+    """Кодирует список строк в таблицу строк: (UTF-8 буфер, смещения)."""
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded], dtype=np.int64)
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def _decode_strings(blob, offsets):
+    data = bytes(blob)
+    return [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+
+def write_snapshot(path: str, source_file: str, arrays: dict, strings: dict) -> None:
+    """
+    Записывает снимок атомарно (через временный файл).
+
+    Args:
+        arrays: именованные numpy-массивы.
+        strings: именованные списки строк (сохраняются как таблицы строк).
+    """
+    arrays = {name: np.ascontiguousarray(array, dtype=np.asarray(array).dtype.newbyteorder('<'))
+              for name, array in arrays.items()}
+    for name, values in strings.items():
+        blob, offsets = _encode_strings(values)
+        arrays[f'{name}{_BLOB_SUFFIX}'] = blob
+        arrays[f'{name}{_OFFSETS_SUFFIX}'] = offsets.astype('<i8')
+
+    stat = os.stat(source_file)
+    header = {
+        'source_mtime_ns': stat.st_mtime_ns,
+        'source_size': stat.st_size,
+        'strings': list(strings),
+        'arrays': {},
+    }
+    # Смещения массивов считаются от начала области данных, которая идет сразу
+    # после заголовка (с выравниванием)
+    data_size = 0
+    for name, array in arrays.items():
+        header['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': data_size}
+        data_size += _align(array.nbytes)
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = _align(_PREFIX.size + len(header_bytes))
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREFIX.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + header['arrays'][name]['offset'])
+            f.write(array.tobytes())
+        f.truncate(data_start + data_size)
+    os.replace(tmp_path, path)
+    logging.info(f"Снимок матрицы сохранен: {path}")
+
+
+def read_snapshot(path: str, source_file: str):
+    """
+    Читает снимок. Возвращает пару (arrays, strings) в том же виде, в каком они были
+    переданы в write_snapshot, или None, если снимка нет, он другой версии или устарел
+    относительно source_file.
+    """
+    if not os.path.exists(path) or not os.path.exists(source_file):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            magic, version, header_size = _PREFIX.unpack(f.read(_PREFIX.size))
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                logging.info(f"Снимок {path} другой версии, будет пересоздан.")
+                return None
+            header = json.loads(f.read(header_size).decode('utf-8'))
+        data_start = _align(_PREFIX.size + header_size)
+
+        stat = os.stat(source_file)
+        if header['source_mtime_ns'] != stat.st_mtime_ns or header['source_size'] != stat.st_size:
+            logging.info(f"Снимок {path} устарел, будет пересоздан.")
+            return None
+
+        arrays = {}
+        for name, info in header['arrays'].items():
+            shape = tuple(info['shape'])
+            if 0 in shape:
+                arrays[name] = np.zeros(shape, dtype=info['dtype'])
+            else:
+                arrays[name] = np.memmap(path, dtype=info['dtype'], mode='r',
+                                         offset=data_start + info['offset'], shape=shape)
+
+        strings = {}
+        for name in header['strings']:
+            strings[name] = _decode_strings(arrays.pop(f'{name}{_BLOB_SUFFIX}'),
+                                            arrays.pop(f'{name}{_OFFSETS_SUFFIX}'))
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        logging.error(f"Ошибка чтения снимка {path}: {e}")
+        return None
+
+    return arrays, strings
@@ -0,0 +1,83 @@
+## -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+from typing import NamedTuple, Tuple
+
+from app.database.models import QuestionType
+from app.database.requests import load_questions
+from app.keyboards.user_keyboards import quiz_keyboards
+
+
+class CatalogQuestion(NamedTuple):
+    """Вопрос каталога с вариантами ответа (неизменяемая запись)."""
+    id: int
+    text: str
+    type: QuestionType
+    options: Tuple[str, ...]
+    option_ids: Tuple[int, ...]
+
+    @property
+    def is_multiple_choice(self) -> bool:
+        return self.type == QuestionType.MULTIPLE_CHOICE
+
+
+class QuestionCatalog(NamedTuple):
+    """Снимок всех вопросов опроса, загруженный под номером версии."""
+    version: int
+    questions: Tuple[CatalogQuestion, ...]
+
+
+def _question_type(value) -> QuestionType:
+    try:
+        return QuestionType(value)
+    except ValueError:
+        # Обработка случая, когда значение в базе данных не является допустимым QuestionType
+        logging.error(f"Invalid QuestionType in database: {value}")
+        return QuestionType.SINGLE_CHOICE
+
+
+# Версия каталога увеличивается при каждом изменении вопросов (загрузка матрицы, очистка таблиц)
+_version = 1
+_catalog: QuestionCatalog | None = None
+_lock = asyncio.Lock()
+
+
+def bump_catalog_version() -> int:
+    """Помечает каталог устаревшим: следующий вызов get_question_catalog перечитает вопросы из БД."""
+    global _version
+    _version += 1
+    return _version
+
+
+async def get_question_catalog() -> QuestionCatalog:
+    """
+    Возвращает каталог вопросов из памяти процесса.
+    БД читается одним запросом только при первом обращении и после bump_catalog_version().
+    """
+    global _catalog
+    catalog = _catalog
+    if catalog is not None and catalog.version == _version:
+        return catalog
+
+    async with _lock:
+        if _catalog is not None and _catalog.version == _version:
+            return _catalog
+        version = _version
+        questions = await load_questions()
+        catalog = QuestionCatalog(version=version, questions=tuple(
+            CatalogQuestion(
+                id=q["id"],
+                text=q["question"],
+                type=_question_type(q["type"]),
+                options=tuple(q["options"]),
+                option_ids=tuple(q["option_ids"]),
+            )
+            for q in questions
+        ))
+        # Пустой каталог не кэшируем: вопросы могут появиться после загрузки матрицы
+        if catalog.questions:
+            _catalog = catalog
+            quiz_keyboards.prebuild(version, catalog.questions)
+        logging.info(f"Каталог вопросов загружен: версия {version}, вопросов {len(catalog.questions)}")
+        return catalog
@@ -0,0 +1,107 @@
+## -*- coding: utf-8 -*-
+
+import asyncio
+import itertools
+import logging
+import os
+
+from app.database.requests import load_answer_option_keys
+from app.utils.matrix import Matrix
+from app.utils.shablon import Shablon
+
+QUIZ_DATA_DIR = 'quiz_data'
+MATRIX_FILE = os.path.join(QUIZ_DATA_DIR, 'quiz_matrix.xlsx')
+SHABLON_FILE = os.path.join(QUIZ_DATA_DIR, 'quiz_shablon.xlsx')
+
+
+class QuizDataCache:
+    """
+    Общий для процесса кэш разобранной матрицы вопросов и шаблонов ответов.
+
+    Файлы читаются лениво при первом обращении. Запись считается устаревшей,
+    если у файла изменились mtime или размер, либо после явного вызова invalidate()
+    (например, из обработчика загрузки файлов администратором).
+    """
+
+    def __init__(self):
+        self._entries = {}  # file_type -> (mtime_ns, size, объект)
+        self._locks = {}
+        self._matrix_versions = itertools.count(1)
+
+    @staticmethod
+    def _signature(path: str):
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    async def _load_matrix(self, path: str) -> Matrix:
+        matrix = Matrix(path)
+        # Для подсчета баллов достаточно скомпилированной модели из снимка;
+        # Excel читается, только если снимка нет или он устарел
+        if not await matrix.load_snapshot():
+            await matrix.process_matrix_file(matrix.excel_file)
+            # Снимок, созданный при импорте, уже содержит привязку к AnswerOption.id;
+            # при чтении Excel восстанавливаем ее по вариантам ответа из БД
+            matrix.model.bind_option_ids(await load_answer_option_keys())
+            try:
+                await matrix.save_snapshot()
+            except OSError as e:
+                logging.error(f"Не удалось сохранить снимок матрицы: {e}")
+        matrix.version = next(self._matrix_versions)
+        return matrix
+
+    async def _load_shablon(self, path: str) -> Shablon:
+        shablon = Shablon(path)
+        await shablon.process_shablon_file()
+        await shablon.extract_shablon_data()
+        return shablon
+
+    async def _get(self, file_type: str, path: str, loader):
+        entry = self._entries.get(file_type)
+        signature = self._signature(path) if os.path.exists(path) else None
+        if entry is not None and entry[:2] == signature:
+            return entry[2]
+
+        lock = self._locks.setdefault(file_type, asyncio.Lock())
+        async with lock:
+            # Пока ждали блокировку, данные мог загрузить другой обработчик
+            entry = self._entries.get(file_type)
+            signature = self._signature(path)
+            if entry is not None and entry[:2] == signature:
+                return entry[2]
+            # Сохраняется подпись, снятая до чтения: если файл заменят во время загрузки,
+            # следующее обращение увидит новую подпись и загрузит файл заново
+            value = await loader(path)
+            self._entries[file_type] = (*signature, value)
+            logging.info(f"Файл {path} загружен в кэш.")
+            return value
+
+    async def get_matrix(self, path: str = MATRIX_FILE) -> Matrix:
+        return await self._get('matrix', path, self._load_matrix)
+
+    async def get_shablon(self, path: str = SHABLON_FILE) -> Shablon:
+        return await self._get('shablon', path, self._load_shablon)
+
+    def invalidate(self, file_type: str = None) -> None:
+        """Сбрасывает кэш для 'matrix', 'shablon' или для всех файлов (file_type=None)."""
+        if file_type is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(file_type, None)
+
+
+quiz_cache = QuizDataCache()
+
+
+async def get_matrix() -> Matrix:
+    """Возвращает разобранную матрицу вопросов из общего кэша."""
+    return await quiz_cache.get_matrix()
+
+
+async def get_shablon() -> Shablon:
+    """Возвращает разобранные шаблоны ответов из общего кэша."""
+    return await quiz_cache.get_shablon()
+
+
+def invalidate_quiz_data(file_type: str = None) -> None:
+    """Сбрасывает кэш после загрузки нового файла матрицы или шаблонов."""
+    quiz_cache.invalidate(file_type)
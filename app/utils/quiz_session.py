@@ -0,0 +1,67 @@
+## -*- coding: utf-8 -*-
+
+from typing import NamedTuple, Optional, Set
+
+from aiogram.fsm.context import FSMContext
+
+from app.utils.question_catalog import CatalogQuestion, QuestionCatalog, get_question_catalog
+
+
+class QuizSession(NamedTuple):
+    """
+    Прогресс одного пользователя в опросе.
+
+    Хранится в FSM-состоянии пользователя (question_index, catalog_version, selected_options),
+    поэтому одновременные опросы разных пользователей не влияют друг на друга.
+    Версия каталога закрепляется при старте: если вопросы были перезагружены во время
+    опроса, сессия становится недействительной и опрос нужно начать заново.
+    """
+    catalog: QuestionCatalog
+    question_index: int
+    selected_options: Set[str]
+
+    @property
+    def question(self) -> CatalogQuestion:
+        return self.catalog.questions[self.question_index]
+
+    @property
+    def number(self) -> int:
+        """Номер текущего вопроса для показа пользователю (с 1)."""
+        return self.question_index + 1
+
+
+async def start_quiz_session(state: FSMContext) -> Optional[QuizSession]:
+    """Начинает опрос с первого вопроса. Возвращает None, если вопросов нет."""
+    catalog = await get_question_catalog()
+    if not catalog.questions:
+        return None
+    await state.update_data(question_index=0, catalog_version=catalog.version, selected_options=set())
+    return QuizSession(catalog, 0, set())
+
+
+async def get_quiz_session(state: FSMContext) -> Optional[QuizSession]:
+    """
+    Текущая сессия пользователя или None, если опрос не начат
+    либо каталог вопросов сменился после его начала.
+    """
+    data = await state.get_data()
+    question_index = data.get("question_index")
+    if question_index is None:
+        return None
+    catalog = await get_question_catalog()
+    if data.get("catalog_version") != catalog.version or question_index >= len(catalog.questions):
+        return None
+    return QuizSession(catalog, question_index, set(data.get("selected_options", ())))
+
+
+async def save_selected_options(state: FSMContext, selected_options: Set[str]) -> None:
+    await state.update_data(selected_options=selected_options)
+
+
+async def next_quiz_question(state: FSMContext, session: QuizSession) -> Optional[QuizSession]:
+    """Переводит сессию к следующему вопросу. Возвращает None, если вопросы закончились."""
+    question_index = session.question_index + 1
+    if question_index >= len(session.catalog.questions):
+        return None
+    await state.update_data(question_index=question_index, selected_options=set())
+    return QuizSession(session.catalog, question_index, set())
@@ -0,0 +1,301 @@
+## -*- coding: utf-8 -*-
+
+"""
+Кэш готовых файлов отчетов.
+
+Файл отчета за период запоминается в таблице report_cache вместе с отметкой состояния данных
+периода (get_report_watermark: количество строк, наибольшие id и время изменения) и file_id
+документа в Telegram. Повторный запрос того же отчета за тот же период, пока отметка не изменилась,
+отправляется без построения файла и без повторной загрузки. Файлы, которые давно не запрашивали,
+удаляются, когда кэш превышает REPORT_CACHE_MAX_MB. Изменения, которые отметка не видит
+(новая матрица вопросов, пересчет баллов), сбрасывают кэш целиком (clear_report_cache).
+Отчеты за стандартные периоды (вчера,
+последние 7 дней, текущий месяц) готовит ночная задача report_prebuild (ReportPrebuilder).
+"""
+
+import asyncio
+import glob
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from app.config import REPORT_CACHE_MAX_MB, REPORT_PREBUILD_HOUR
+from app.database.requests import (delete_cached_reports, generate_user_profile_report, get_cached_report,
+                                   get_registered_users_length, get_report_watermark, get_user_answers_data,
+                                   get_user_answers_data_length, list_cached_reports, save_cached_report,
+                                   update_cached_report)
+from app.utils.jobs import JobContext, JobQueue, JobResult, job_handler, send_document
+from app.utils.report_writer import TELEGRAM_DOCUMENT_LIMIT, split_for_telegram
+
+# Тип отчета -> (построение файла за период, количество строк за период)
+REPORT_GENERATORS = {
+    "answers": (get_user_answers_data, get_user_answers_data_length),
+    "profile": (generate_user_profile_report, get_registered_users_length),
+}
+
+
+class CachedReport(NamedTuple):
+    entry_id: Optional[int]  # ReportCache.id; None - файл построен без сохранения в кэше
+    file_path: str
+    file_id: Optional[str]  # file_id документа в Telegram, если файл уже отправлялся
+    hit: bool  # файл взят из кэша
+
+
+class _BuildLock:
+    """Блокировка построения одного отчета и число запросов, которые ее держат или ждут."""
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+_build_locks: Dict[tuple, _BuildLock] = {}
+
+
+def _range_dates(start_date: str, end_date: str) -> Tuple[date, date]:
+    return datetime.strptime(start_date, '%d.%m.%Y').date(), datetime.strptime(end_date, '%d.%m.%Y').date()
+
+
+async def _lookup(report_type: str, start_date: str, end_date: str, report_format: str,
+                  watermark: Optional[str]) -> Optional[CachedReport]:
+    if watermark is None:
+        return None
+    entry = await get_cached_report(report_type, *_range_dates(start_date, end_date), report_format)
+    if entry is None or entry.watermark != watermark or not os.path.exists(entry.file_path):
+        return None
+    await update_cached_report(entry.id, last_used_at=datetime.now())
+    return CachedReport(entry.id, entry.file_path, entry.telegram_file_id, True)
+
+
+async def find_cached_report(report_type: str, start_date: str, end_date: str,
+                             report_format: str = "xlsx") -> Optional[CachedReport]:
+    """Актуальный файл отчета из кэша или None (файл не строится)."""
+    watermark = await get_report_watermark(report_type, start_date, end_date)
+    return await _lookup(report_type, start_date, end_date, report_format, watermark)
+
+
+async def get_report(report_type: str, start_date: str, end_date: str,
+                     report_format: str = "xlsx") -> Optional[CachedReport]:
+    """
+    Файл отчета за период в формате report_format: из кэша, если данные периода не изменились, иначе
+    строит новый и сохраняет его в кэше. Одновременные запросы одного отчета ждут одного построения.
+    Returns: CachedReport или None при ошибке построения.
+    """
+    if report_type not in REPORT_GENERATORS:
+        raise ValueError(f"Неверный тип отчета: {report_type}")
+    key = (report_type, report_format, *_range_dates(start_date, end_date))
+    build_lock = _build_locks.setdefault(key, _BuildLock())
+    build_lock.users += 1
+    try:
+        async with build_lock.lock:
+            # Отметка берется до построения: данные, добавленные во время построения, изменят ее,
+            # и следующий запрос построит файл заново
+            watermark = await get_report_watermark(report_type, start_date, end_date)
+            cached = await _lookup(report_type, start_date, end_date, report_format, watermark)
+            if cached is not None:
+                return cached
+
+            generate, _ = REPORT_GENERATORS[report_type]
+            filepath = await generate(start_date, end_date, report_format=report_format)
+            if not filepath:
+                return None
+            if watermark is None:
+                return CachedReport(None, filepath, None, False)
+
+            start, end = _range_dates(start_date, end_date)
+            previous = await get_cached_report(report_type, start, end, report_format)
+            if previous is not None and previous.file_path != filepath:
+                _remove_file(previous.file_path)
+            # Архив и части для Telegram строятся один раз, вместе с файлом, и учитываются в размере кэша
+            _remove_parts(filepath)
+            documents = await asyncio.to_thread(split_for_telegram, filepath, TELEGRAM_DOCUMENT_LIMIT)
+            file_size = sum(os.path.getsize(path) for path in {filepath, *documents})
+            entry_id = await save_cached_report(report_type, start, end, watermark, filepath, file_size,
+                                                report_format)
+            await evict_reports(keep=entry_id)
+            return CachedReport(entry_id, filepath, None, False)
+    finally:
+        # Запись удаляется, только когда ее никто не ждет: иначе следующий запрос создал бы
+        # вторую блокировку и построил отчет параллельно с ожидающими первую
+        build_lock.users -= 1
+        if build_lock.users == 0:
+            del _build_locks[key]
+
+
+async def remember_report_file_id(entry_id: int, file_id: str) -> None:
+    """Сохраняет file_id отправленного файла отчета: следующая отправка пройдет без загрузки."""
+    try:
+        await update_cached_report(entry_id, telegram_file_id=file_id)
+    except Exception as e:
+        logging.warning(f"Не удалось сохранить file_id отчета #{entry_id}: {e}")
+
+
+async def report_documents(report: CachedReport) -> List[str]:
+    """
+    Файлы для отправки отчета в Telegram: сам файл или, если он больше 50 МБ, архив или его части.
+    Для файла из кэша они уже построены (см. get_report), иначе строятся сейчас.
+    """
+    if os.path.getsize(report.file_path) <= TELEGRAM_DOCUMENT_LIMIT:
+        return [report.file_path]
+    return (_existing_parts(report.file_path)
+            or await asyncio.to_thread(split_for_telegram, report.file_path, TELEGRAM_DOCUMENT_LIMIT))
+
+
+async def send_report(bot, chat_id: int, report: CachedReport) -> int:
+    """
+    Отправляет файл отчета: по сохраненному file_id без загрузки, если он есть; большой файл - частями.
+    Returns: количество отправленных документов.
+    """
+    documents = await report_documents(report)
+    if documents != [report.file_path]:
+        for document in documents:
+            await send_document(bot, chat_id, document)
+        return len(documents)
+    file_id = await send_document(bot, chat_id, report.file_path, report.file_id)
+    if report.entry_id is not None and file_id != report.file_id:
+        await remember_report_file_id(report.entry_id, file_id)
+    return 1
+
+
+def _existing_parts(path: str) -> List[str]:
+    """Построенные split_for_telegram архив path.zip или части path[.zip].001, .002, ... по порядку."""
+    pattern = glob.escape(path)
+    for parts_pattern in (pattern + ".zip.[0-9][0-9][0-9]", pattern + ".[0-9][0-9][0-9]"):
+        parts = sorted(glob.glob(parts_pattern))
+        if parts:
+            return parts
+    return glob.glob(pattern + ".zip")
+
+
+def _remove_parts(path: str) -> None:
+    """Удаляет архив и части файла отчета для отправки (path.zip, path.001, ...)."""
+    pattern = glob.escape(path)
+    for file in glob.glob(pattern + ".zip*") + glob.glob(pattern + ".[0-9][0-9][0-9]"):
+        try:
+            os.remove(file)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Не удалось удалить файл отчета {file}: {e}")
+
+
+def _remove_file(path: str) -> None:
+    """Удаляет файл отчета вместе с архивом и частями для отправки."""
+    _remove_parts(path)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.warning(f"Не удалось удалить файл отчета {path}: {e}")
+
+
+async def evict_reports(max_bytes: int = None, keep: int = None) -> int:
+    """
+    Удаляет записи кэша без файлов и, пока файлы кэша занимают больше max_bytes
+    (по умолчанию REPORT_CACHE_MAX_MB), - файлы, которые дольше всех не запрашивали.
+    Запись keep (только что построенный отчет) не удаляется. Returns: количество удаленных записей.
+    """
+    if max_bytes is None:
+        max_bytes = REPORT_CACHE_MAX_MB * 2 ** 20
+    entries = await list_cached_reports()
+    evicted = [entry for entry in entries if not os.path.exists(entry.file_path)]
+    total = sum(entry.file_size for entry in entries if entry not in evicted)
+    for entry in entries:
+        if total <= max_bytes:
+            break
+        if entry.id == keep or entry in evicted:
+            continue
+        _remove_file(entry.file_path)
+        evicted.append(entry)
+        total -= entry.file_size
+    await delete_cached_reports([entry.id for entry in evicted])
+    if evicted:
+        logging.info(f"Удалено отчетов из кэша: {len(evicted)}, размер кэша {total / 2 ** 20:.1f} МБ")
+    return len(evicted)
+
+
+async def clear_report_cache() -> int:
+    """
+    Удаляет все файлы и записи кэша отчетов. Вызывается после загрузки матрицы вопросов и пересчета
+    баллов: они меняют тексты вопросов и баллы без новых строк, и отметка данных этого не замечает.
+    Returns: количество удаленных записей.
+    """
+    entries = await list_cached_reports()
+    for entry in entries:
+        _remove_file(entry.file_path)
+    await delete_cached_reports([entry.id for entry in entries])
+    if entries:
+        logging.info(f"Кэш отчетов очищен: удалено {len(entries)} отчетов")
+    return len(entries)
+
+
+def standard_report_ranges(today: date) -> List[Tuple[str, str]]:
+    """
+    Стандартные периоды ДД.ММ.ГГГГ: вчера, последние 7 дней, текущий месяц (1-го числа - прошедший).
+    Периоды заканчиваются вчерашним днем: данные за прошедшие дни не меняются до следующей ночи.
+    """
+    yesterday = today - timedelta(days=1)
+    ranges = [(yesterday, yesterday), (today - timedelta(days=7), yesterday), (yesterday.replace(day=1), yesterday)]
+    return [(start.strftime('%d.%m.%Y'), end.strftime('%d.%m.%Y')) for start, end in ranges]
+
+
+@job_handler("report_prebuild", "Подготовка отчетов")
+async def prebuild_reports_job(ctx: JobContext, day: str = None) -> JobResult:
+    """Готовит отчеты всех типов за стандартные периоды (пустые периоды пропускаются)."""
+    today = date.fromisoformat(day) if day else date.today()
+    built = failed = 0
+    for report_type, (_, count_rows) in REPORT_GENERATORS.items():
+        for start_date, end_date in standard_report_ranges(today):
+            count = await count_rows(start_date, end_date)
+            if count is None:  # ошибка БД уже записана в лог
+                failed += 1
+                continue
+            if not count:
+                continue
+            await ctx.progress(f"{report_type}: {start_date} - {end_date}")
+            if await get_report(report_type, start_date, end_date) is not None:
+                built += 1
+            else:
+                failed += 1
+    return JobResult(f"Подготовлено отчетов: {built}" + (f", с ошибкой: {failed}" if failed else ""))
+
+
+class ReportPrebuilder:
+    """Каждую ночь в REPORT_PREBUILD_HOUR ставит задачу report_prebuild в очередь фоновых задач."""
+
+    def __init__(self, hour: int = REPORT_PREBUILD_HOUR):
+        self.hour = hour
+        self._task: Optional[asyncio.Task] = None
+
+    def seconds_until_next_run(self, now: datetime) -> float:
+        next_run = now.replace(hour=self.hour, minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        return (next_run - now).total_seconds()
+
+    def start(self, queue: JobQueue) -> None:
+        self._task = asyncio.create_task(self._run(queue))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self, queue: JobQueue) -> None:
+        last_day = None
+        while True:
+            await asyncio.sleep(self.seconds_until_next_run(datetime.now()))
+            today = date.today()
+            if today == last_day:
+                continue  # таймер сработал чуть раньше часа запуска
+            last_day = today
+            try:
+                await queue.submit("report_prebuild", {"day": today.isoformat()})
+            except Exception as e:
+                logging.error(f"Не удалось поставить подготовку отчетов в очередь: {e}")
+
+
+report_prebuilder = ReportPrebuilder()
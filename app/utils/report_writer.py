@@ -0,0 +1,235 @@
+## -*- coding: utf-8 -*-
+
+import asyncio
+import csv
+from abc import ABC, abstractmethod
+import gzip
+import os
+import zipfile
+from typing import Callable, Iterable, List, Optional, Sequence
+
+from openpyxl import Workbook
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow - необязательная зависимость, нужна только для выгрузки в Parquet
+    pa = pq = None
+
+REPORTS_DIR = "reports"
+REPORT_CHUNK_SIZE = 5000  # строк, читаемых из БД и передаваемых в поток записи за раз
+REPORT_FORMATS = {"xlsx": ".xlsx", "csv": ".csv", "csv.gz": ".csv.gz", "parquet": ".parquet"}  # формат -> расширение
+PARQUET_AVAILABLE = pa is not None
+TELEGRAM_DOCUMENT_LIMIT = 50 * 1000 * 1000  # предельный размер документа, отправляемого ботом (50 МБ)
+
+
+class StreamWriter(ABC):
+    """
+    Базовый класс потоковой записи отчета. Строки пишутся в рабочем потоке (asyncio.to_thread),
+    пока цикл событий читает из БД следующую порцию; одновременно в очереди не больше одной порции.
+    Файл пишется под временным именем и заменяет filepath только после успешного сохранения,
+    поэтому прежний файл отчета (например, из кэша отчетов) остается целым до конца записи.
+
+    Наследники реализуют _write_rows, _save (сохранение во временный файл) и _discard.
+
+    Пример:
+        async with XlsxStreamWriter(path, headers, row_mapper=format_row) as writer:
+            async for rows in result.partitions():
+                await writer.write(rows)
+    """
+
+    def __init__(self, filepath: str, headers: Sequence[str], row_mapper: Optional[Callable[[Sequence], List]] = None):
+        self.filepath = filepath
+        self.headers = list(headers)
+        self.row_mapper = row_mapper
+        self.rows_written = 0
+        self._tmp_path = filepath + ".tmp"
+        self._pending: Optional[asyncio.Future] = None
+
+    def _append(self, rows: Iterable[Sequence]) -> None:
+        mapper = self.row_mapper
+        rows = [mapper(row) if mapper else list(row) for row in rows]
+        self._write_rows(rows)
+        self.rows_written += len(rows)
+
+    @abstractmethod
+    def _write_rows(self, rows: List[list]) -> None:
+        """Записывает порцию строк (вызывается в рабочем потоке)."""
+
+    @abstractmethod
+    def _save(self) -> None:
+        """Сохраняет файл под временным именем."""
+
+    @abstractmethod
+    def _discard(self) -> None:
+        """Освобождает ресурсы записи без сохранения файла."""
+
+    def _make_dirs(self) -> None:
+        directory = os.path.dirname(self.filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _remove_tmp(self) -> None:
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    async def write(self, rows: Sequence[Sequence]) -> None:
+        """Передает порцию строк в рабочий поток; ждет, только если предыдущая порция еще пишется."""
+        if self._pending is not None:
+            await self._pending
+        self._pending = asyncio.ensure_future(asyncio.to_thread(self._append, rows))
+
+    async def close(self) -> str:
+        """Дописывает строки и сохраняет файл. Returns: путь к файлу."""
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            await pending
+        await asyncio.to_thread(self._save)
+        os.replace(self._tmp_path, self.filepath)
+        return self.filepath
+
+    async def __aenter__(self) -> "StreamWriter":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            await self.close()
+        else:
+            # Ошибка чтения - дожидаемся записи порции, файл не сохраняем
+            if self._pending is not None:
+                await asyncio.gather(self._pending, return_exceptions=True)
+                self._pending = None
+            await asyncio.to_thread(self._discard)
+
+
+class XlsxStreamWriter(StreamWriter):
+    """
+    Потоковая запись XLSX-отчета: openpyxl в режиме write_only сбрасывает строки во временный файл,
+    поэтому расход памяти не зависит от числа строк. Сохранение книги тоже выполняется в рабочем потоке.
+    """
+
+    def __init__(self, filepath: str, headers: Sequence[str], title: str = None,
+                 row_mapper: Optional[Callable[[Sequence], List]] = None):
+        super().__init__(filepath, headers, row_mapper)
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet(title)
+        self._sheet.append(self.headers)
+
+    def _write_rows(self, rows: List[list]) -> None:
+        for row in rows:
+            self._sheet.append(row)
+
+    def _save(self) -> None:
+        self._make_dirs()
+        self._workbook.save(self._tmp_path)
+
+    def _discard(self) -> None:
+        """Закрывает и удаляет временный файл листа без сохранения книги."""
+        self._sheet.close()
+        self._sheet._writer.cleanup()
+
+
+class CsvStreamWriter(StreamWriter):
+    """Потоковая запись CSV (UTF-8, разделитель - запятая), при compress=True - со сжатием gzip."""
+
+    def __init__(self, filepath: str, headers: Sequence[str], row_mapper: Optional[Callable[[Sequence], List]] = None,
+                 compress: bool = False):
+        super().__init__(filepath, headers, row_mapper)
+        self._make_dirs()
+        if compress:
+            self._file = gzip.open(self._tmp_path, "wt", encoding="utf-8", newline="")
+        else:
+            self._file = open(self._tmp_path, "w", encoding="utf-8", newline="")
+        self._csv = csv.writer(self._file)
+        self._csv.writerow(self.headers)
+
+    def _write_rows(self, rows: List[list]) -> None:
+        self._csv.writerows(rows)
+
+    def _save(self) -> None:
+        self._file.close()
+
+    def _discard(self) -> None:
+        self._file.close()
+        self._remove_tmp()
+
+
+class ParquetStreamWriter(StreamWriter):
+    """
+    Потоковая запись Parquet (pyarrow): каждая порция строк - отдельная группа строк (row group)
+    со схемой column_types ("int", "str" или "datetime" для каждого столбца).
+    """
+
+    def __init__(self, filepath: str, headers: Sequence[str], column_types: Sequence[str],
+                 row_mapper: Optional[Callable[[Sequence], List]] = None):
+        if not PARQUET_AVAILABLE:
+            raise RuntimeError("Для выгрузки в Parquet нужен пакет pyarrow")
+        super().__init__(filepath, headers, row_mapper)
+        types = {"int": pa.int64(), "str": pa.string(), "datetime": pa.timestamp("us")}
+        self._schema = pa.schema([(name, types[column_type]) for name, column_type in zip(self.headers, column_types)])
+        self._make_dirs()
+        self._writer = pq.ParquetWriter(self._tmp_path, self._schema)
+
+    def _write_rows(self, rows: List[list]) -> None:
+        if not rows:
+            return
+        columns = [pa.array(column, type=field.type) for column, field in zip(zip(*rows), self._schema)]
+        self._writer.write_table(pa.Table.from_arrays(columns, schema=self._schema))
+
+    def _save(self) -> None:
+        self._writer.close()
+
+    def _discard(self) -> None:
+        self._writer.close()
+        self._remove_tmp()
+
+
+def open_report_writer(report_format: str, filepath: str, headers: Sequence[str], title: str = None,
+                       row_mapper: Optional[Callable[[Sequence], List]] = None,
+                       column_types: Sequence[str] = None) -> StreamWriter:
+    """Потоковая запись отчета в формате report_format (см. REPORT_FORMATS)."""
+    if report_format == "xlsx":
+        return XlsxStreamWriter(filepath, headers, title=title, row_mapper=row_mapper)
+    if report_format in ("csv", "csv.gz"):
+        return CsvStreamWriter(filepath, headers, row_mapper=row_mapper, compress=report_format == "csv.gz")
+    if report_format == "parquet":
+        return ParquetStreamWriter(filepath, headers, column_types, row_mapper=row_mapper)
+    raise ValueError(f"Неверный формат отчета: {report_format}")
+
+
+def split_for_telegram(filepath: str, limit: int = TELEGRAM_DOCUMENT_LIMIT) -> List[str]:
+    """
+    Файлы для отправки документами Telegram. Файл больше limit: несжатый CSV упаковывается в ZIP;
+    если и архив больше limit, он (или файл в сжатом формате) делится на части filepath[.zip].001,
+    .002, ... по limit байт, которые собираются обратно командой cat или архиватором 7-Zip.
+    """
+    if os.path.getsize(filepath) <= limit:
+        return [filepath]
+    source = filepath
+    if filepath.endswith(".csv"):
+        source = filepath + ".zip"
+        with zipfile.ZipFile(source, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.write(filepath, os.path.basename(filepath))
+        if os.path.getsize(source) <= limit:
+            return [source]
+
+    parts = []
+    with open(source, "rb") as src:
+        while True:
+            part = f"{source}.{len(parts) + 1:03d}"
+            with open(part, "wb") as dst:
+                _copy_bytes(src, dst, limit)
+            if os.path.getsize(part) == 0:
+                os.remove(part)
+                break
+            parts.append(part)
+    return parts
+
+
+def _copy_bytes(src, dst, size: int, block: int = 2 ** 20) -> None:
+    while size > 0:
+        data = src.read(min(block, size))
+        if not data:
+            return
+        dst.write(data)
+        size -= len(data)
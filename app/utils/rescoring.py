@@ -0,0 +1,62 @@
+## -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import time
+
+import numpy as np
+
+from app.database.requests import count_users_with_answers, iter_user_answers_batches, bulk_upsert_user_scores
+from app.utils.matrix import CompiledMatrix, to_score_value
+
+RESCORING_BATCH_SIZE = 1000
+
+
+async def rescore_all_users(model: CompiledMatrix, batch_size: int = RESCORING_BATCH_SIZE,
+                            progress_callback=None) -> dict:
+    """
+    Пересчитывает баллы всех пользователей по текущей матрице.
+
+    Идентификаторы выбранных вариантов читаются из user_answer_options постранично,
+    каждая страница считается векторно (CompiledMatrix.score_ids_batch) в отдельном потоке
+    и записывается в user_score одним пакетным upsert. В памяти одновременно находится
+    только одна страница.
+
+    Пользователи, среди ответов которых есть варианты, не привязанные к матрице
+    (например, ответы на варианты прежней матрицы), пропускаются: их баллы не записываются,
+    чтобы не сохранить сумму по части ответов.
+
+    Args:
+        model: скомпилированная матрица с привязанными AnswerOption.id (см. bind_option_ids).
+        batch_size: количество пользователей в одной странице.
+        progress_callback: async-функция (прочитано пользователей, total, elapsed), вызывается после каждой страницы.
+
+    Returns:
+        Словарь с количеством пересчитанных (processed) и пропущенных (skipped) пользователей
+        и затраченным временем (сек).
+    """
+    if not model.has_option_ids:
+        raise ValueError("Матрица не привязана к вариантам ответа в БД. Загрузите матрицу заново.")
+    total = await count_users_with_answers()
+    processed = skipped = read = 0
+    started = time.monotonic()
+
+    async for batch in iter_user_answers_batches(batch_size):
+        read += len(batch)
+        bound = [(user_id, option_ids) for user_id, option_ids in batch if not model.unbound_ids(option_ids)]
+        skipped += len(batch) - len(bound)
+        if bound:
+            totals = await asyncio.to_thread(model.score_ids_batch, [option_ids for _, option_ids in bound])
+            scores = [(user_id, None if np.isnan(points) else to_score_value(points))
+                      for (user_id, _), points in zip(bound, totals)]
+            await bulk_upsert_user_scores(scores)
+            processed += len(bound)
+
+        if progress_callback is not None:
+            await progress_callback(read, total, time.monotonic() - started)
+
+    elapsed = time.monotonic() - started
+    if skipped:
+        logging.warning(f"Пересчет баллов: пропущено {skipped} пользователей с ответами, не привязанными к матрице.")
+    logging.info(f"Пересчет баллов завершен: {processed} пользователей за {elapsed:.1f} сек.")
+    return {"processed": processed, "skipped": skipped, "elapsed": elapsed}
@@ -1,13 +1,17 @@
 ## -*- coding: utf-8 -*-
 
 import pandas as pd
+import numpy as np
 import os
 import asyncio
+import bisect
 
 class Shablon:
     def __init__(self, excel_file):
         self.data = []  # шаблоны ответов пользователю исходя из набранных баллов
         self.df = None  # DataFrame для данных из Excel
+        self._starts = []  # отсортированные нижние границы интервалов (для bisect)
+        self._ends = []  # соответствующие верхние границы
         self.excel_file = excel_file
         # Проверка существования файла
         if not os.path.exists(self.excel_file):
@@ -16,7 +20,7 @@ class Shablon:
 
     async def process_shablon_file(self):
         """Загрузка данных из Excel файла."""
-        self.df = pd.read_excel(self.excel_file, header=0)
+        self.df = await asyncio.to_thread(pd.read_excel, self.excel_file, header=0)
         self.df.columns = self.df.columns.str.strip()
         self.df['Баллы'] = self.df['Баллы'].str.strip()
         self.df['Результат'] = self.df['Результат'].str.strip()
@@ -24,26 +28,74 @@ class Shablon:
 
 
     async def extract_shablon_data(self):
-        """Извлекает шаблоны ответов из DataFrame."""
+        """
+        Извлекает шаблоны ответов из DataFrame и строит интервальный индекс.
+
+        Интервалы сортируются по нижней границе и проверяются: они не должны пересекаться
+        и между ними не должно быть разрывов. Соседние интервалы могут либо иметь общую
+        границу ("0-50", "50-100"), либо идти подряд по целым числам ("0-50", "51-100").
+        При нарушении выбрасывается ValueError.
+        """
         self.data.clear()
+        self._starts = []
+        self._ends = []
         if self.df is None:
             return
+        data = []
         for index, row in self.df.iterrows():
             score_interval = str(row['Баллы'])
             result_description = str(row['Результат'])
             # Удаление пробелов и преобразование строки в две переменные
             start, end = map(int, score_interval.replace(' ', '').split('-'))
-            self.data.append({'score_start': start, 'score_end': end, 'description': result_description})
-
-
+            if start > end:
+                raise ValueError(f"Некорректный интервал баллов '{score_interval}': начало больше конца.")
+            data.append({'score_start': start, 'score_end': end, 'description': result_description})
+
+        data.sort(key=lambda res: res['score_start'])
+        for prev, res in zip(data, data[1:]):
+            if res['score_start'] < prev['score_end']:
+                raise ValueError(f"Интервалы баллов пересекаются: "
+                                 f"{prev['score_start']}-{prev['score_end']} и {res['score_start']}-{res['score_end']}.")
+            if res['score_start'] > prev['score_end'] + 1:
+                raise ValueError(f"Разрыв между интервалами баллов: "
+                                 f"{prev['score_start']}-{prev['score_end']} и {res['score_start']}-{res['score_end']}.")
+
+        self.data.extend(data)
+        self._starts = [res['score_start'] for res in data]
+        self._ends = [res['score_end'] for res in data]
+
+    def find_shablon_id(self, score) -> int | None:
+        """
+        Возвращает номер шаблона (индекс в self.data) для набранных баллов.
+
+        Обе границы интервала включаются: "0-50" содержит баллы от 0 до 50 включительно.
+        Баллы на общей границе ("0-50", "50-100") относятся к следующему интервалу.
+        Дробные баллы между интервалами, идущими подряд по целым числам ("0-50", "51-100"),
+        например 50.5, не попадают ни в один интервал и, как и баллы вне всех интервалов, дают None.
+        """
+        if not self._starts or score is None or score != score:  # score != score - проверка на NaN
+            return None
+        i = bisect.bisect_right(self._starts, score) - 1
+        return i if i >= 0 and score <= self._ends[i] else None
 
     async def get_shablon(self, score: int):
         """Определяем нужный вариант (шаблон) ответа исходя из набранных баллов"""
-        for res in self.data:
-            if res['score_start'] < score < res['score_end']:
-                return res['description']
-
-        return None
+        shablon_id = self.find_shablon_id(score)
+        return self.data[shablon_id]['description'] if shablon_id is not None else None
+
+    async def get_shablon_ids(self, scores) -> np.ndarray:
+        """
+        Пакетный поиск: сопоставляет массиву баллов номера шаблонов за один вызов
+        (границы интервалов - как в find_shablon_id). Для баллов вне всех интервалов возвращается -1.
+        """
+        scores = np.asarray(scores, dtype=np.float64)
+        if not self._starts:
+            return np.full(scores.shape, -1, dtype=np.intp)
+        ids = np.searchsorted(np.asarray(self._starts, dtype=np.float64), scores, side='right') - 1
+        ends = np.asarray(self._ends, dtype=np.float64)[np.maximum(ids, 0)]
+        out_of_range = (ids < 0) | (scores > ends) | np.isnan(scores)
+        ids[out_of_range] = -1
+        return ids
 
 async def main():
     shablon = Shablon(r'..\..\quiz_data\quiz_shablon.xlsx')
@@ -0,0 +1,187 @@
+## -*- coding: utf-8 -*-
+
+"""
+Бенчмарк запросов отчетов и поиска ответов до и после миграций с индексами.
+
+Запуск из корня проекта:
+    python -m benchmarks.db_index_benchmark --users 100000 --output db_index_benchmark.json
+
+Создается синтетическая SQLite-база в состоянии до миграций (без индексов), замеряются запросы,
+затем применяются миграции (app.database.migrations) и запросы замеряются повторно.
+"""
+
+import os
+import tempfile
+
+# Отдельная файловая БД: переменные должны быть заданы до импорта app.database
+_tmp_dir = tempfile.mkdtemp()
+os.environ["DB_TYPE"] = "sqlite"
+os.environ["SQLITE_FILE"] = os.path.join(_tmp_dir, "db_index_benchmark.db")
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import shutil
+import time
+from datetime import datetime, timedelta
+
+import sqlalchemy
+from sqlalchemy import insert, select
+
+from app.database.database import engine
+from app.database.migrations import run_migrations, schema_version
+from app.database.models import Base, User, UserProfile, Question, AnswerOption, QuestionType, UserAnswerOptions, UserScore
+from app.database.requests import (count_answers_by_day, get_registered_users_length, get_user_answer_ids,
+                                   get_user_answers, get_user_answers_data_length, session_manager)
+from benchmarks.quiz_benchmark import summarize
+
+QUESTIONS_COUNT = 12
+OPTIONS_PER_QUESTION = 4
+PERIOD_DAYS = 365
+INSERT_CHUNK = 50_000
+START_DATE = datetime(2025, 1, 1)
+
+
+async def insert_chunked(conn, model, rows):
+    for i in range(0, len(rows), INSERT_CHUNK):
+        await conn.execute(insert(model), rows[i:i + INSERT_CHUNK])
+
+
+async def build_legacy_database(users_count: int, seed: int = 0):
+    """Синтетическая база без индексов: пользователи за год, ответ на каждый вопрос, баллы, профили у трети."""
+    rnd = random.Random(seed)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                await conn.run_sync(index.drop)
+        await conn.run_sync(schema_version.drop)
+
+        await insert_chunked(conn, Question, [
+            {'id': q, 'question_text': f'Вопрос {q}?', 'type': QuestionType.SINGLE_CHOICE}
+            for q in range(1, QUESTIONS_COUNT + 1)])
+        await insert_chunked(conn, AnswerOption, [
+            {'id': (q - 1) * OPTIONS_PER_QUESTION + o, 'question_id': q, 'option_text': f'Ответ {q}.{o}'}
+            for q in range(1, QUESTIONS_COUNT + 1) for o in range(1, OPTIONS_PER_QUESTION + 1)])
+
+        created = [START_DATE + timedelta(seconds=rnd.randrange(PERIOD_DAYS * 86400)) for _ in range(users_count)]
+        await insert_chunked(conn, User, [
+            {'id': u, 'telegram_id': 1_000_000 + u, 'created_at': created[u - 1]} for u in range(1, users_count + 1)])
+        await insert_chunked(conn, UserProfile, [
+            {'user_id': u, 'city': 'Berlin'} for u in range(1, users_count + 1, 3)])
+        await insert_chunked(conn, UserScore, [
+            {'user_id': u, 'score': rnd.randint(0, 100)} for u in range(1, users_count + 1)])
+
+        rows = []
+        for u in range(1, users_count + 1):
+            for q in range(1, QUESTIONS_COUNT + 1):
+                rows.append({'user_id': u, 'question_id': q,
+                             'answer_option_id': (q - 1) * OPTIONS_PER_QUESTION + rnd.randint(1, OPTIONS_PER_QUESTION),
+                             'created_at': created[u - 1] + timedelta(seconds=q * 10)})
+            if len(rows) >= INSERT_CHUNK:
+                await conn.execute(insert(UserAnswerOptions), rows)
+                rows = []
+        if rows:
+            await conn.execute(insert(UserAnswerOptions), rows)
+
+
+async def get_user_score(user_id: int):
+    async with session_manager() as session:
+        return await session.scalar(select(UserScore.score).where(UserScore.user_id == user_id))
+
+
+async def get_user_profile(user_id: int):
+    async with session_manager() as session:
+        return await session.scalar(select(UserProfile).where(UserProfile.user_id == user_id))
+
+
+async def measure_calls(calls, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for make_coro in calls:
+            await make_coro()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples, per_call=len(calls))
+
+
+async def measure_queries(users_count: int, lookups: int, repeat: int, seed: int = 1) -> dict:
+    rnd = random.Random(seed)
+    user_ids = [rnd.randint(1, users_count) for _ in range(lookups)]
+    week = ('03.06.2025', '09.06.2025')
+    month = ('01.06.2025', '30.06.2025')
+    scenarios = {
+        'get_user_answers': [lambda u=u: get_user_answers(1_000_000 + u) for u in user_ids],
+        'get_user_answer_ids': [lambda u=u: get_user_answer_ids(1_000_000 + u) for u in user_ids],
+        'user_score_by_user_id': [lambda u=u: get_user_score(u) for u in user_ids],
+        'user_profile_by_user_id': [lambda u=u: get_user_profile(u) for u in user_ids],
+        'get_user_answers_data_length (7 дней)': [lambda: get_user_answers_data_length(*week)],
+        'count_answers_by_day (30 дней)': [lambda: count_answers_by_day(*month)],
+        'get_registered_users_length (30 дней)': [lambda: get_registered_users_length(*month)],
+    }
+    return {name: await measure_calls(calls, repeat) for name, calls in scenarios.items()}
+
+
+async def run(users_count: int, lookups: int, repeat: int) -> dict:
+    started = time.perf_counter()
+    await build_legacy_database(users_count)
+    build_seconds = time.perf_counter() - started
+    logging.info(f"База создана за {build_seconds:.1f} сек.")
+
+    before = await measure_queries(users_count, lookups, repeat)
+    started = time.perf_counter()
+    version = await run_migrations(engine)
+    migration_seconds = time.perf_counter() - started
+    after = await measure_queries(users_count, lookups, repeat)
+    await engine.dispose()
+
+    return {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'users': users_count,
+            'answers': users_count * QUESTIONS_COUNT,
+            'lookups': lookups,
+            'repeat': repeat,
+            'build_seconds': build_seconds,
+            'migration_seconds': migration_seconds,
+            'schema_version': version,
+        },
+        'results': [
+            {'name': name, 'before': before[name], 'after': after[name],
+             'speedup': before[name]['median'] / after[name]['median']}
+            for name in before
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк запросов до и после миграций с индексами.")
+    parser.add_argument('--output', default='db_index_benchmark.json', help="Файл для результатов (JSON).")
+    parser.add_argument('--users', type=int, default=100_000, help="Количество пользователей в базе.")
+    parser.add_argument('--lookups', type=int, default=50, help="Количество поисков по пользователю в замере.")
+    parser.add_argument('--repeat', type=int, default=3, help="Количество повторов каждого замера.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    engine.echo = False  # логирование SQL искажает замеры
+    try:
+        report = asyncio.run(run(args.users, args.lookups, args.repeat))
+    finally:
+        shutil.rmtree(_tmp_dir, ignore_errors=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for result in report['results']:
+        print(f"{result['name']:<40} {result['before']['median'] * 1e3:10.2f} мс -> "
+              f"{result['after']['median'] * 1e3:10.2f} мс  (x{result['speedup']:.1f})")
+    print(f"Результаты сохранены в {args.output}")
+
+
+if __name__ == '__main__':
+    main()
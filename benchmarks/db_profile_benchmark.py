@@ -0,0 +1,144 @@
+## -*- coding: utf-8 -*-
+
+"""
+Бенчмарк пропускной способности БД для профилей движка (app.database.database.ENGINE_PROFILES).
+
+Запуск из корня проекта:
+    python -m benchmarks.db_profile_benchmark --workers 50 --quizzes 2000 --output db_profile_benchmark.json
+
+Для каждого профиля создается отдельная файловая SQLite-база, и workers параллельных задач
+проходят quizzes опросов: регистрация пользователя, пакетная запись ответов и чтение ответов.
+Профиль legacy - прежние настройки движка (echo=True, без пула соединений и PRAGMA).
+Логи SQL пишутся в /dev/null, но их форматирование входит в замер.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+import sqlalchemy
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.database.database import ENGINE_PROFILES, create_engine_for_profile
+from app.database.models import Base, User, UserAnswerOptions
+
+ANSWERS_PER_QUIZ = 12
+
+
+async def take_quiz(engine, telegram_id: int):
+    """Операции одного опроса: регистрация, запись ответов одним INSERT, чтение ответов."""
+    async with engine.begin() as conn:
+        user_id = await conn.scalar(sqlite_insert(User).values(telegram_id=telegram_id)
+                                    .on_conflict_do_nothing(index_elements=[User.telegram_id])
+                                    .returning(User.id))
+    async with engine.begin() as conn:
+        await conn.execute(insert(UserAnswerOptions), [
+            {'user_id': user_id, 'question_id': q, 'answer_option_id': q * 4} for q in range(1, ANSWERS_PER_QUIZ + 1)])
+    async with engine.connect() as conn:
+        answers = (await conn.execute(select(UserAnswerOptions.answer_option_id)
+                                      .where(UserAnswerOptions.user_id == user_id))).all()
+    assert len(answers) == ANSWERS_PER_QUIZ
+
+
+async def bench_profile(name: str, db_file: str, workers: int, quizzes: int, devnull) -> dict:
+    url = f'sqlite+aiosqlite:///{db_file}'
+    if name == 'legacy':
+        engine = create_async_engine(url, echo=True)
+    else:
+        engine = create_engine_for_profile(url, name)
+    # Логи SQL (echo) форматируются как обычно, но пишутся в /dev/null
+    sql_logger = logging.getLogger('sqlalchemy.engine.Engine')
+    for handler in sql_logger.handlers:
+        handler.setStream(devnull)
+    sql_logger.propagate = False
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    queue = asyncio.Queue()
+    for telegram_id in range(1, quizzes + 1):
+        queue.put_nowait(telegram_id)
+    errors = []
+
+    async def worker():
+        while not queue.empty():
+            telegram_id = queue.get_nowait()
+            try:
+                await take_quiz(engine, telegram_id)
+            except Exception as e:
+                errors.append(repr(e))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    elapsed = time.perf_counter() - started
+
+    async with engine.connect() as conn:
+        saved = await conn.scalar(select(func.count()).select_from(UserAnswerOptions))
+    await engine.dispose()
+
+    return {
+        'name': name,
+        'seconds': elapsed,
+        'quizzes_per_second': (quizzes - len(errors)) / elapsed,
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'saved_answers': saved,
+    }
+
+
+async def run(profiles, workers: int, quizzes: int) -> dict:
+    results = []
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        with open(os.devnull, 'w') as devnull:
+            for name in profiles:
+                logging.info(f"Профиль {name}: {quizzes} опросов, {workers} параллельных задач")
+                results.append(await bench_profile(name, os.path.join(tmp_dir, f'{name}.db'), workers, quizzes,
+                                                   devnull))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'workers': workers,
+            'quizzes': quizzes,
+            'answers_per_quiz': ANSWERS_PER_QUIZ,
+        },
+        'results': results,
+    }
+
+
+def main():
+    profiles = ['legacy'] + list(ENGINE_PROFILES)
+    parser = argparse.ArgumentParser(description="Бенчмарк пропускной способности БД для профилей движка.")
+    parser.add_argument('--output', default='db_profile_benchmark.json', help="Файл для результатов (JSON).")
+    parser.add_argument('--profiles', nargs='*', choices=profiles, default=profiles, help="Профили для замера.")
+    parser.add_argument('--workers', type=int, default=50, help="Количество параллельных задач.")
+    parser.add_argument('--quizzes', type=int, default=2000, help="Количество опросов.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    report = asyncio.run(run(args.profiles, args.workers, args.quizzes))
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for result in report['results']:
+        print(f"{result['name']:<10} {result['quizzes_per_second']:10.1f} опросов/сек  "
+              f"{result['seconds']:8.2f} сек  ошибок: {result['errors']}")
+    print(f"Результаты сохранены в {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+## -*- coding: utf-8 -*-
+
+"""
+Бенчмарк отчета по профилям пользователей: прежняя реализация (расшифровка каждого поля отдельным
+Fernet в цикле событий) против пакетной расшифровки порций в пуле процессов с разным числом процессов.
+
+Запуск из корня проекта:
+    python -m benchmarks.profile_report_benchmark --users 100000 --workers 1 2 4 --output profile_report_benchmark.json
+
+Время отчета с пакетной расшифровкой должно уменьшаться с числом процессов, пока их не больше ядер.
+"""
+
+import os
+import tempfile
+
+# Отдельная файловая БД: переменные должны быть заданы до импорта app.database
+_tmp_dir = tempfile.mkdtemp()
+os.environ["DB_TYPE"] = "sqlite"
+os.environ["SQLITE_FILE"] = os.path.join(_tmp_dir, "profile_report_benchmark.db")
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import sqlalchemy
+from openpyxl import Workbook
+from sqlalchemy import insert, select
+from sqlalchemy.orm import selectinload
+
+from app.config import ENCRIPTION_KEY
+from app.database import requests as requests_module
+from app.database.database import engine
+from app.database.models import Base, User, UserProfile
+from app.database.requests import _report_date_range, generate_user_profile_report, session_manager
+from app.utils import encripter
+from app.utils.encripter import decrypt_message, encrypt_message
+
+INSERT_CHUNK = 20_000
+START_DATE = datetime(2025, 1, 1)
+PERIOD = ('01.01.2025', '31.12.2025')
+
+
+async def build_database(users_count: int):
+    """Пользователи за год, у каждого профиль с зашифрованными ФИО, email и телефоном."""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        for start in range(1, users_count + 1, INSERT_CHUNK):
+            stop = min(start + INSERT_CHUNK, users_count + 1)
+            await conn.execute(insert(User), [
+                {'id': u, 'telegram_id': 1_000_000 + u, 'created_at': START_DATE + timedelta(minutes=5 * u)}
+                for u in range(start, stop)])
+            profiles = []
+            for u in range(start, stop):
+                profiles.append({
+                    'user_id': u,
+                    'full_name': await encrypt_message(f'Пользователь Номер {u}', ENCRIPTION_KEY),
+                    'email': await encrypt_message(f'user{u}@example.com', ENCRIPTION_KEY),
+                    'phone_number': await encrypt_message(f'+49176{u:08d}', ENCRIPTION_KEY),
+                    'city': 'Berlin',
+                    'status_in_germany': 'worker',
+                })
+            await conn.execute(insert(UserProfile), profiles)
+
+
+async def legacy_profile_report(start_date: str, end_date: str) -> str:
+    """Прежняя реализация generate_user_profile_report (без сохранения ошибок в finally)."""
+    start_date, end_date = _report_date_range(start_date, end_date)
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "User Profiles"
+    ws.append(["User ID", "Telegram ID", "Full Name", "Email", "Phone Number", "City", "Status in Germany",
+               "Registration Date"])
+    async with session_manager() as session:
+        result = await session.execute(
+            select(User)
+            .filter(User.created_at >= start_date, User.created_at <= end_date)
+            .options(selectinload(User.profile))
+        )
+        for user in result.scalars().all():
+            # Прежний decrypt_message создавал Fernet на каждый вызов
+            encripter.get_cipher.cache_clear()
+            ws.append([
+                user.id,
+                user.telegram_id,
+                await decrypt_message(user.profile.full_name, ENCRIPTION_KEY) if user.profile else "",
+                await decrypt_message(user.profile.email, ENCRIPTION_KEY) if user.profile else "",
+                await decrypt_message(user.profile.phone_number, ENCRIPTION_KEY) if user.profile else "",
+                user.profile.city if user.profile else "",
+                user.profile.status_in_germany if user.profile else "",
+                user.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            ])
+    filepath = os.path.join(_tmp_dir, "legacy_user_profiles.xlsx")
+    wb.save(filepath)
+    return filepath
+
+
+async def measure(name: str, make_coro) -> dict:
+    started = time.perf_counter()
+    filepath = await make_coro()
+    seconds = time.perf_counter() - started
+    await engine.dispose()
+    logging.info(f"{name}: {seconds:.1f} сек")
+    return {'name': name, 'seconds': seconds, 'file_mb': os.path.getsize(filepath) / 2 ** 20}
+
+
+async def run(users_count: int, workers_counts, legacy: bool) -> dict:
+    started = time.perf_counter()
+    await build_database(users_count)
+    build_seconds = time.perf_counter() - started
+    logging.info(f"База создана за {build_seconds:.1f} сек.")
+    requests_module.REPORTS_DIR = _tmp_dir
+
+    results = []
+    if legacy:
+        results.append(await measure('legacy', lambda: legacy_profile_report(*PERIOD)))
+    for workers in workers_counts:
+        if workers == 1:
+            executor = ThreadPoolExecutor(1)
+        else:
+            executor = ProcessPoolExecutor(workers)
+            # Запуск процессов пула не входит в замер
+            await asyncio.gather(*(asyncio.get_running_loop().run_in_executor(executor, encripter.get_cipher,
+                                                                              ENCRIPTION_KEY)
+                                   for _ in range(workers)))
+        requests_module.DECRYPT_WORKERS = workers
+        try:
+            results.append(await measure(f'batched, {workers} proc', lambda: generate_user_profile_report(
+                *PERIOD, executor=executor)))
+        finally:
+            executor.shutdown()
+
+    return {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'users': users_count,
+            'build_seconds': build_seconds,
+        },
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк отчета по профилям пользователей.")
+    parser.add_argument('--output', default='profile_report_benchmark.json', help="Файл для результатов (JSON).")
+    parser.add_argument('--users', type=int, default=100_000, help="Количество пользователей с профилями.")
+    parser.add_argument('--workers', type=int, nargs='*', default=[1, 2, 4], help="Числа процессов расшифровки.")
+    parser.add_argument('--no-legacy', action='store_true', help="Не замерять прежнюю реализацию.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    engine.echo = False  # логирование SQL искажает замеры
+    try:
+        report = asyncio.run(run(args.users, args.workers, not args.no_legacy))
+    finally:
+        shutil.rmtree(_tmp_dir, ignore_errors=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for result in report['results']:
+        print(f"{result['name']:<20} {result['seconds']:8.1f} сек")
+    print(f"Ядер: {report['meta']['cpu_count']}. Результаты сохранены в {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+## -*- coding: utf-8 -*-
+
+"""
+Бенчмарк подсчета баллов, поиска шаблонов и загрузки вопросов.
+
+Запуск из корня проекта:
+    python -m benchmarks.quiz_benchmark --output quiz_benchmark.json
+
+Матрицы и шаблоны генерируются синтетически, вопросы загружаются в SQLite в памяти.
+Результаты пишутся в JSON, чтобы сравнивать их между релизами.
+"""
+
+import os
+
+# БД в памяти: переменная должна быть задана до импорта app.database
+os.environ["DB_TYPE"] = "sqlite"
+os.environ["SQLITE_FILE"] = ":memory:"
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from app.database.database import create_tables, engine
+from app.database.requests import load_questions, replace_questions_with_options
+from app.utils.matrix import Matrix
+from app.utils.shablon import Shablon
+from benchmarks.synthetic import write_matrix_file, write_shablon_file
+
+# (количество вариантов ответа, тип корректирующих столбцов).
+# sparse - корректирующие столбцы есть у 10% ответов, заполнено 5% ячеек;
+# dense - столбец есть у каждого ответа, заполнено 50% ячеек.
+# Плотная матрица на 5000 ответов - это 25 млн ячеек xlsx, поэтому по умолчанию не входит.
+DEFAULT_MATRIX_SCENARIOS = [
+    (50, 'sparse'), (50, 'dense'),
+    (200, 'sparse'), (200, 'dense'),
+    (1000, 'sparse'), (1000, 'dense'),
+    (5000, 'sparse'),
+]
+MATRIX_KINDS = {
+    'sparse': {'columns_share': 0.1, 'density': 0.05},
+    'dense': {'columns_share': 1.0, 'density': 0.5},
+}
+DEFAULT_SHABLON_BANDS = [10, 100, 1000]
+SCORING_CALLS = 200
+LOOKUPS = 10_000
+
+
+def summarize(samples, per_call: int = 1) -> dict:
+    """Статистика по замерам (секунды на один вызов)."""
+    samples = [s / per_call for s in samples]
+    return {
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'mean': statistics.fmean(samples),
+        'repeat': len(samples),
+    }
+
+
+async def measure(make_coro, repeat: int, per_call: int = 1) -> dict:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await make_coro()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples, per_call)
+
+
+async def bench_matrix(tmp_dir: str, options_count: int, kind: str, repeat: int, results: list):
+    params = {'options': options_count, 'kind': kind}
+    columns_count = max(1, int(options_count * MATRIX_KINDS[kind]['columns_share']))
+    path = os.path.join(tmp_dir, f'matrix_{options_count}_{kind}.xlsx')
+    questions = write_matrix_file(path, options_count, columns_count, MATRIX_KINDS[kind]['density'])
+    params['columns'] = columns_count
+
+    matrix = Matrix(path)
+    results.append({'name': 'Matrix.process_matrix_file', 'params': params,
+                    'seconds': await measure(lambda: matrix.process_matrix_file(path), min(repeat, 3))})
+    results.append({'name': 'Matrix.extract_questions', 'params': params,
+                    'seconds': await measure(matrix.extract_questions, repeat)})
+
+    rnd = random.Random(options_count)
+    selections = [[rnd.choice(options) for _, options in questions] for _ in range(SCORING_CALLS)]
+
+    async def score_all():
+        for selected in selections:
+            await matrix.calculate_points(selected)
+
+    results.append({'name': 'Matrix.calculate_points', 'params': {**params, 'answers_per_call': len(questions)},
+                    'seconds': await measure(score_all, repeat, per_call=SCORING_CALLS)})
+
+    results.append({'name': 'requests.replace_questions_with_options',
+                    'params': {**params, 'questions': len(questions)},
+                    'seconds': await measure(lambda: replace_questions_with_options(matrix.questions), repeat)})
+    results.append({'name': 'requests.load_questions', 'params': {**params, 'questions': len(questions)},
+                    'seconds': await measure(load_questions, repeat)})
+
+
+async def bench_shablon(tmp_dir: str, bands_count: int, repeat: int, results: list):
+    params = {'bands': bands_count}
+    path = os.path.join(tmp_dir, f'shablon_{bands_count}.xlsx')
+    max_score = write_shablon_file(path, bands_count)
+
+    shablon = Shablon(path)
+
+    async def load():
+        await shablon.process_shablon_file()
+        await shablon.extract_shablon_data()
+
+    results.append({'name': 'Shablon.load', 'params': params, 'seconds': await measure(load, min(repeat, 3))})
+
+    rnd = random.Random(bands_count)
+    scores = [rnd.randint(-10, max_score + 10) for _ in range(LOOKUPS)]
+
+    async def lookup_all():
+        for score in scores:
+            await shablon.get_shablon(score)
+
+    results.append({'name': 'Shablon.get_shablon', 'params': params,
+                    'seconds': await measure(lookup_all, repeat, per_call=LOOKUPS)})
+
+    scores_array = np.asarray(scores)
+    results.append({'name': 'Shablon.get_shablon_ids', 'params': {**params, 'batch': LOOKUPS},
+                    'seconds': await measure(lambda: shablon.get_shablon_ids(scores_array), repeat)})
+
+
+async def run(matrix_scenarios, shablon_bands, repeat: int) -> dict:
+    await create_tables()
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for options_count, kind in matrix_scenarios:
+            logging.info(f"Матрица: {options_count} ответов, {kind}")
+            await bench_matrix(tmp_dir, options_count, kind, repeat, results)
+        for bands_count in shablon_bands:
+            logging.info(f"Шаблоны: {bands_count} интервалов")
+            await bench_shablon(tmp_dir, bands_count, repeat, results)
+    await engine.dispose()
+
+    return {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def parse_scenario(value: str):
+    options_count, kind = value.split(':')
+    if kind not in MATRIX_KINDS:
+        raise argparse.ArgumentTypeError(f"Тип матрицы должен быть одним из: {', '.join(MATRIX_KINDS)}")
+    return int(options_count), kind
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк подсчета баллов и загрузки вопросов.")
+    parser.add_argument('--output', default='quiz_benchmark.json', help="Файл для результатов (JSON).")
+    parser.add_argument('--repeat', type=int, default=5, help="Количество повторов каждого замера.")
+    parser.add_argument('--matrix', type=parse_scenario, nargs='*', default=DEFAULT_MATRIX_SCENARIOS,
+                        help="Сценарии матриц в виде КОЛИЧЕСТВО:sparse|dense, например 5000:dense.")
+    parser.add_argument('--bands', type=int, nargs='*', default=DEFAULT_SHABLON_BANDS,
+                        help="Количество интервалов в шаблонах.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    engine.echo = False  # логирование SQL искажает замеры
+    report = asyncio.run(run(args.matrix, args.bands, args.repeat))
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for result in report['results']:
+        print(f"{result['name']:<40} {json.dumps(result['params'], ensure_ascii=False):<60} "
+              f"{result['seconds']['median'] * 1e6:14.1f} мкс")
+    print(f"Результаты сохранены в {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+## -*- coding: utf-8 -*-
+
+"""
+Бенчмарк отчета по ответам пользователей: прежняя реализация (список словарей -> pandas.DataFrame ->
+openpyxl Workbook) против потоковой (session.stream -> XlsxStreamWriter в рабочем потоке) и потоковой
+выгрузки в CSV, CSV.GZ и Parquet (Parquet - если установлен pyarrow).
+
+Запуск из корня проекта:
+    python -m benchmarks.report_benchmark --rows 1000000 --output report_benchmark.json
+
+Синтетическая SQLite-база создается один раз, каждый вариант отчета строится в отдельном процессе,
+чтобы пиковый расход памяти (ru_maxrss) не зависел от предыдущего замера. Задержка цикла событий -
+максимальное опоздание таймера с периодом 10 мс во время построения отчета.
+ru_maxrss учитывает и страницы файла БД, отображенные в память (PRAGMA mmap_size профиля движка);
+для замера только памяти процесса: DB_PROFILE=dev.
+"""
+
+import os
+import tempfile
+
+# Общая файловая БД для родительского и дочерних процессов: задается до импорта app.database
+_db_file = os.environ.get("REPORT_BENCHMARK_DB") or os.path.join(tempfile.mkdtemp(), "report_benchmark.db")
+os.environ["REPORT_BENCHMARK_DB"] = _db_file
+os.environ["DB_TYPE"] = "sqlite"
+os.environ["SQLITE_FILE"] = _db_file
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+import openpyxl
+import pandas as pd
+import sqlalchemy
+from openpyxl import Workbook
+from openpyxl.utils.dataframe import dataframe_to_rows
+from sqlalchemy import insert, select
+
+from app.database import requests as requests_module
+from app.database.database import engine
+from app.database.models import Base, User, Question, AnswerOption, QuestionType, UserAnswerOptions, UserScore
+from app.database.requests import _report_date_range, get_user_answers_data, session_scope
+from app.utils.report_writer import PARQUET_AVAILABLE
+
+QUESTIONS_COUNT = 12
+OPTIONS_PER_QUESTION = 4
+INSERT_CHUNK = 50_000
+START_DATE = datetime(2025, 1, 1)
+PERIOD = ('01.01.2025', '31.12.2025')
+VARIANTS = ['legacy', 'streaming', 'csv', 'csv.gz', 'parquet']  # streaming - потоковый XLSX
+DEFAULT_VARIANTS = [variant for variant in VARIANTS if variant != 'parquet' or PARQUET_AVAILABLE]
+
+
+async def build_database(rows_count: int, seed: int = 0):
+    """Синтетическая база: ответ каждого пользователя на каждый вопрос в течение года, баллы у всех."""
+    rnd = random.Random(seed)
+    users_count = (rows_count + QUESTIONS_COUNT - 1) // QUESTIONS_COUNT
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(Question), [
+            {'id': q, 'question_text': f'Вопрос {q}: какой вариант вам ближе?', 'type': QuestionType.SINGLE_CHOICE}
+            for q in range(1, QUESTIONS_COUNT + 1)])
+        await conn.execute(insert(AnswerOption), [
+            {'id': (q - 1) * OPTIONS_PER_QUESTION + o, 'question_id': q, 'option_text': f'Вариант ответа {q}.{o}'}
+            for q in range(1, QUESTIONS_COUNT + 1) for o in range(1, OPTIONS_PER_QUESTION + 1)])
+        for start in range(1, users_count + 1, INSERT_CHUNK):
+            stop = min(start + INSERT_CHUNK, users_count + 1)
+            await conn.execute(insert(User), [{'id': u, 'telegram_id': 1_000_000 + u} for u in range(start, stop)])
+            await conn.execute(insert(UserScore), [{'user_id': u, 'score': rnd.randint(0, 100)}
+                                                   for u in range(start, stop)])
+
+        rows = []
+        for n in range(rows_count):
+            u, q = n // QUESTIONS_COUNT + 1, n % QUESTIONS_COUNT + 1
+            rows.append({'user_id': u, 'question_id': q,
+                         'answer_option_id': (q - 1) * OPTIONS_PER_QUESTION + rnd.randint(1, OPTIONS_PER_QUESTION),
+                         'created_at': START_DATE + timedelta(seconds=rnd.randrange(364 * 86400))})
+            if len(rows) >= INSERT_CHUNK:
+                await conn.execute(insert(UserAnswerOptions), rows)
+                rows = []
+        if rows:
+            await conn.execute(insert(UserAnswerOptions), rows)
+
+
+async def legacy_user_answers_data(start_date: str, end_date: str, reports_dir: str) -> str:
+    """Прежняя реализация get_user_answers_data (до потоковой записи)."""
+    start_date_dt, end_date_dt = _report_date_range(start_date, end_date)
+    async with session_scope() as session:
+        stmt = (
+            select(User.telegram_id, Question.question_text, AnswerOption.option_text,
+                   UserAnswerOptions.created_at, UserScore.score.label("user_score"))
+            .select_from(UserAnswerOptions)
+            .join(User, UserAnswerOptions.user_id == User.id)
+            .join(Question, UserAnswerOptions.question_id == Question.id)
+            .join(AnswerOption, UserAnswerOptions.answer_option_id == AnswerOption.id)
+            .outerjoin(UserScore, UserAnswerOptions.user_id == UserScore.user_id)
+            .filter(UserAnswerOptions.created_at >= start_date_dt, UserAnswerOptions.created_at <= end_date_dt)
+        )
+        result = await session.execute(stmt)
+        data = []
+        for telegram_id, question_text, option_text, created_at, score in result:
+            data.append({
+                "Telegram ID": telegram_id,
+                "Question Text": question_text,
+                "Answer Option Text": option_text,
+                "Answered At": created_at.strftime("%Y-%m-%d %H:%M:%S"),
+                "Score": score if score is not None else 0
+            })
+        df = pd.DataFrame(data)
+        wb = Workbook()
+        ws = wb.active
+        for r in dataframe_to_rows(df, index=False, header=True):
+            ws.append(r)
+        filepath = os.path.join(reports_dir, "legacy_user_answers.xlsx")
+        wb.save(filepath)
+        return filepath
+
+
+async def measure_loop_lag(stop: asyncio.Event, period: float = 0.01) -> float:
+    """Максимальное опоздание таймера (сек) до установки stop."""
+    lag = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(period)
+        lag = max(lag, time.perf_counter() - started - period)
+    return lag
+
+
+async def run_variant(variant: str, reports_dir: str) -> dict:
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop))
+    started = time.perf_counter()
+    if variant == 'legacy':
+        filepath = await legacy_user_answers_data(*PERIOD, reports_dir)
+    else:
+        requests_module.REPORTS_DIR = reports_dir
+        filepath = await get_user_answers_data(*PERIOD, report_format='xlsx' if variant == 'streaming' else variant)
+    seconds = time.perf_counter() - started
+    stop.set()
+    max_lag = await lag_task
+    await engine.dispose()
+    return {
+        'name': variant,
+        'seconds': seconds,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'max_loop_lag_ms': max_lag * 1e3,
+        'file_mb': os.path.getsize(filepath) / 2 ** 20 if filepath else None,
+    }
+
+
+def run_child(variant: str, reports_dir: str) -> dict:
+    """Строит отчет в отдельном процессе и возвращает его замеры."""
+    output = subprocess.run([sys.executable, '-m', 'benchmarks.report_benchmark', '--child', variant,
+                             '--reports-dir', reports_dir], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк XLSX-отчета по ответам пользователей.")
+    parser.add_argument('--output', default='report_benchmark.json', help="Файл для результатов (JSON).")
+    parser.add_argument('--rows', type=int, default=1_000_000, help="Количество ответов в базе.")
+    parser.add_argument('--variants', nargs='*', choices=VARIANTS, default=DEFAULT_VARIANTS, help="Варианты для замера.")
+    parser.add_argument('--child', choices=VARIANTS, help=argparse.SUPPRESS)
+    parser.add_argument('--reports-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    engine.echo = False  # логирование SQL искажает замеры
+    if args.child:
+        print(json.dumps(asyncio.run(run_variant(args.child, args.reports_dir))))
+        return
+
+    logging.basicConfig(level=logging.INFO)
+    tmp_dir = os.path.dirname(_db_file)
+    try:
+        started = time.perf_counter()
+        asyncio.run(build_database(args.rows))
+        build_seconds = time.perf_counter() - started
+        logging.info(f"База с {args.rows} ответами создана за {build_seconds:.1f} сек.")
+        results = []
+        for variant in args.variants:
+            logging.info(f"Отчет: {variant}")
+            results.append(run_child(variant, tmp_dir))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'openpyxl': openpyxl.__version__,
+            'rows': args.rows,
+            'build_seconds': build_seconds,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for result in report['results']:
+        print(f"{result['name']:<10} {result['seconds']:8.1f} сек  {result['peak_rss_mb']:8.0f} МБ  "
+              f"задержка цикла событий {result['max_loop_lag_ms']:8.0f} мс  файл {result['file_mb'] or 0:8.1f} МБ")
+    print(f"Результаты сохранены в {args.output}")
+
+
+if __name__ == '__main__':
+    main()
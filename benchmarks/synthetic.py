@@ -0,0 +1,68 @@
+## -*- coding: utf-8 -*-
+
+"""Генерация синтетических файлов матрицы вопросов и шаблонов ответов для бенчмарков."""
+
+import random
+
+from openpyxl import Workbook
+
+from app.utils.matrix import ANSWER_COLUMN, BASE_SCORE_COLUMN
+
+
+def matrix_questions(options_count: int, options_per_question: int = 4):
+    """Список вопросов [(текст вопроса, [варианты])] с общим числом вариантов options_count."""
+    questions = []
+    number = 0
+    while number < options_count:
+        q = len(questions) + 1
+        multiple = ' (несколько вариантов ответа)' if q % 5 == 0 else ''
+        count = min(options_per_question, options_count - number)
+        questions.append((f'Вопрос {q}?{multiple}', [f'Ответ {q}.{i + 1}' for i in range(count)]))
+        number += count
+    return questions
+
+
+def write_matrix_file(path: str, options_count: int, columns_count: int, density: float,
+                      options_per_question: int = 4, seed: int = 0):
+    """
+    Создает xlsx-файл матрицы в формате quiz_matrix.xlsx.
+
+    Args:
+        options_count: общее количество вариантов ответа (строк матрицы).
+        columns_count: количество корректирующих столбцов (первые columns_count ответов).
+        density: доля заполненных ячеек в корректирующих столбцах.
+
+    Returns:
+        Список вопросов [(текст вопроса, [варианты])].
+    """
+    rnd = random.Random(seed)
+    questions = matrix_questions(options_count, options_per_question)
+    answers = [option for _, options in questions for option in options]
+    columns = answers[:columns_count]
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(['Матрица баллов'])
+    ws.append(['№', ANSWER_COLUMN, BASE_SCORE_COLUMN] + columns)
+    number = 1
+    for question, options in questions:
+        ws.append([None, question, None])
+        for option in options:
+            corrections = [rnd.randint(-3, 3) if column != option and rnd.random() < density else None
+                           for column in columns]
+            ws.append([number, option, rnd.randint(0, 20)] + corrections)
+            number += 1
+    wb.save(path)
+    return questions
+
+
+def write_shablon_file(path: str, bands_count: int, band_width: int = 10):
+    """Создает xlsx-файл шаблонов с bands_count смежными интервалами баллов."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(['Баллы', 'Результат'])
+    for i in range(bands_count):
+        start = i * band_width
+        ws.append([f'{start}-{start + band_width - 1}', f'Результат {i + 1}'])
+    wb.save(path)
+    return bands_count * band_width
@@ -15,6 +15,12 @@ from app.handlers.admin_report import report_router
 from app.handlers.user_test import user_test_router
 from app.handlers.admin_db import db_router
 from app.database.database import create_tables
+from app.utils.quiz_cache import get_matrix
+from app.utils.question_catalog import get_question_catalog
+from app.utils.answer_buffer import answer_buffer
+from app.utils.encripter import shutdown_decrypt_executor
+from app.utils.jobs import TelegramJobNotifier, job_queue
+from app.utils.report_cache import report_prebuilder
 
 
 # from app.handlers.admin import admin_router
@@ -31,11 +37,36 @@ async def main():
     except Exception as e:
         logging.error(f"Ошибка при создании таблиц БД: {e}")
 
+    # Предварительная загрузка матрицы вопросов (из бинарного снимка, если он актуален)
+    try:
+        await get_matrix()
+    except Exception as e:
+        logging.error(f"Ошибка при загрузке матрицы вопросов: {e}")
+    try:
+        await get_question_catalog()
+    except Exception as e:
+        logging.error(f"Ошибка при загрузке каталога вопросов: {e}")
+
+    # Буфер ответов опроса: загрузка ответов, не сохраненных при прошлой остановке
+    try:
+        await answer_buffer.start()
+    except Exception as e:
+        logging.error(f"Ошибка при запуске буфера ответов: {e}")
+
     # Инициализация бота и хранилища состояний
     bot = Bot(token=BOT_TOKEN)
     storage = MemoryStorage()  # Можно использовать RedisStorage2, если нужна персистентность
     dp = Dispatcher(storage=storage)
 
+    # Очередь фоновых задач (отчеты, загрузка файлов, пересчет баллов): задачи, прерванные
+    # прошлой остановкой, выполняются заново
+    try:
+        await job_queue.start(TelegramJobNotifier(bot))
+    except Exception as e:
+        logging.error(f"Ошибка при запуске очереди фоновых задач: {e}")
+    # Ночная подготовка отчетов за вчера, последние 7 дней и текущий месяц
+    report_prebuilder.start(job_queue)
+
     # Регистрация middleware (нужно указать тип апдейта для middleware)
     dp.update.middleware(DBSessionMiddleware())
 
@@ -51,6 +82,16 @@ async def main():
     try:
         await dp.start_polling(bot, skip_updates=True)
     finally:
+        await report_prebuilder.stop()
+        # Остановка очереди задач: прерванные задачи будут выполнены после перезапуска
+        await job_queue.stop()
+        # Сохранение ответов из буфера (или выгрузка их в файл, если БД недоступна)
+        try:
+            await answer_buffer.stop()
+        except Exception as e:
+            logging.error(f"Ошибка при сохранении буфера ответов: {e}")
+        # Остановка процессов пакетной расшифровки (отчет по профилям)
+        shutdown_decrypt_executor()
         # Закрытие сессии бота
         try:
             await bot.session.close()
@@ -0,0 +1,64 @@
+## -*- coding: utf-8 -*-
+
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.database.models import Question, UserAnswerOptions
+from app.database.requests import (add_questions_with_options, add_user, bulk_save_answers, count_answers_by_day,
+                                   count_answers_by_question, count_rows, get_registered_users_length,
+                                   get_user_answers_data_length, has_rows, is_tables_empty, load_questions,
+                                   session_scope)
+
+QUESTIONS = [
+    {'question': 'Какая у вас цель?', 'question_type': 'single_choice', 'options': ['Покупка жилья', 'Пенсия']},
+    {'question': 'Что для вас важно?', 'question_type': 'multiple_choice', 'options': ['Надежность', 'Доходность']},
+]
+
+
+async def prepare():
+    await add_questions_with_options(QUESTIONS)
+    q1, q2 = await load_questions()
+    await add_user(100)
+    await add_user(200)
+    await bulk_save_answers([(100, q1['id'], q1['option_ids'][0]), (100, q2['id'], q2['option_ids'][0]),
+                             (100, q2['id'], q2['option_ids'][1]), (200, q1['id'], q1['option_ids'][1])])
+    async with session_scope() as session:
+        await session.execute(update(UserAnswerOptions).values(created_at=datetime(2025, 3, 1, 12)))
+        await session.execute(update(UserAnswerOptions).where(UserAnswerOptions.user_id == 2)
+                              .values(created_at=datetime(2025, 3, 3, 23, 59)))
+    return q1, q2
+
+
+def test_is_tables_empty(run_db):
+    assert run_db(is_tables_empty())
+    run_db(add_questions_with_options(QUESTIONS))
+    assert not run_db(is_tables_empty())
+    assert run_db(has_rows(Question, Question.question_text == 'Что для вас важно?'))
+    assert not run_db(has_rows(Question, Question.question_text == 'Нет такого'))
+
+
+def test_answer_counts(run_db):
+    q1, q2 = run_db(prepare())
+    assert run_db(count_rows(UserAnswerOptions)) == 4
+    assert run_db(get_user_answers_data_length('01.03.2025', '03.03.2025')) == 4
+    assert run_db(get_user_answers_data_length('01.03.2025', '02.03.2025')) == 3
+    assert run_db(get_user_answers_data_length('04.03.2025', '05.03.2025')) == 0
+    assert run_db(count_answers_by_day('01.03.2025', '31.03.2025')) == [('2025-03-01', 3), ('2025-03-03', 1)]
+    assert run_db(count_answers_by_question('01.03.2025', '31.03.2025')) == [
+        (q1['id'], 'Какая у вас цель?', 2), (q2['id'], 'Что для вас важно?', 2)]
+    assert run_db(get_registered_users_length('01.01.2000', '01.01.2000')) == 0
+
+
+def test_count_errors_are_not_zero(run_db, monkeypatch):
+    with pytest.raises(SQLAlchemyError):
+        run_db(count_rows(UserAnswerOptions, text('no_such_column = 1')))
+
+    async def broken_count(*args):
+        raise SQLAlchemyError('db is down')
+
+    monkeypatch.setattr('app.database.requests.count_rows', broken_count)
+    assert run_db(get_user_answers_data_length('01.03.2025', '03.03.2025')) is None
+    assert run_db(get_registered_users_length('01.03.2025', '03.03.2025')) is None
@@ -0,0 +1,175 @@
+## -*- coding: utf-8 -*-
+
+import json
+import os
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from app.database.models import UserAnswerOptions
+from app.database.requests import add_questions_with_options, add_user, load_questions, session_manager
+from app.database.unit_of_work import unit_of_work
+from app.utils import answer_buffer as answer_buffer_module
+from app.utils.answer_buffer import AnswerBuffer
+
+QUESTIONS = [
+    {'question': 'Какая у вас цель?', 'question_type': 'single_choice', 'options': ['Покупка жилья', 'Пенсия']},
+    {'question': 'Что для вас важно?', 'question_type': 'multiple_choice', 'options': ['Надежность', 'Доходность']},
+]
+
+
+async def prepare():
+    await add_questions_with_options(QUESTIONS)
+    await add_user(100)
+    await add_user(200)
+    return await load_questions()
+
+
+async def saved_answers():
+    async with session_manager() as session:
+        rows = await session.execute(select(UserAnswerOptions.user_id, UserAnswerOptions.question_id,
+                                            UserAnswerOptions.answer_option_id).order_by(UserAnswerOptions.id))
+        return [tuple(row) for row in rows]
+
+
+def test_flush_user_answers(run_db, tmp_path):
+    questions = run_db(prepare())
+    q1, q2 = questions
+    buffer = AnswerBuffer(spool_file=str(tmp_path / 'pending.jsonl'))
+
+    async def scenario():
+        buffer.add(100, q1['id'], [q1['option_ids'][1]])
+        buffer.add(200, q1['id'], [q1['option_ids'][0]])
+        buffer.add(100, q2['id'], q2['option_ids'])
+        buffer.add(300, q1['id'], [q1['option_ids'][0]])  # незарегистрированный пользователь
+        assert len(buffer) == 5
+        assert await buffer.flush(100)
+        first = await saved_answers()
+        assert await buffer.flush()
+        return first, await saved_answers()
+
+    first, everything = run_db(scenario())
+    assert first == [(1, q1['id'], q1['option_ids'][1]), (1, q2['id'], q2['option_ids'][0]),
+                     (1, q2['id'], q2['option_ids'][1])]
+    assert everything == first + [(2, q1['id'], q1['option_ids'][0])]
+    assert len(buffer) == 0
+
+
+def test_failed_flush_keeps_answers_and_spools_on_stop(run_db, tmp_path, monkeypatch):
+    questions = run_db(prepare())
+    q1 = questions[0]
+    spool_file = str(tmp_path / 'pending.jsonl')
+    buffer = AnswerBuffer(spool_file=spool_file)
+
+    async def unavailable(answers, known_user_ids=None):
+        raise ConnectionError("БД недоступна")
+
+    async def scenario():
+        await buffer.start()
+        buffer.add(100, q1['id'], [q1['option_ids'][0]])
+        buffer.add(200, q1['id'], [q1['option_ids'][1]])
+        assert not await buffer.flush(100)
+        assert len(buffer) == 2
+        await buffer.stop()
+
+    monkeypatch.setattr(answer_buffer_module, 'bulk_save_answers', unavailable)
+    run_db(scenario())
+    assert len(buffer) == 0
+    assert os.path.exists(spool_file)
+    assert run_db(saved_answers()) == []
+
+    monkeypatch.undo()
+    restarted = AnswerBuffer(spool_file=spool_file)
+
+    async def restart():
+        await restarted.start()
+        await restarted.stop()
+        return await saved_answers()
+
+    assert sorted(run_db(restart())) == [(1, q1['id'], q1['option_ids'][0]), (2, q1['id'], q1['option_ids'][1])]
+    assert not os.path.exists(spool_file)
+
+
+def test_discard_and_size_trigger(run_db, tmp_path):
+    questions = run_db(prepare())
+    q1 = questions[0]
+    buffer = AnswerBuffer(flush_size=2, spool_file=str(tmp_path / 'pending.jsonl'))
+
+    async def scenario():
+        buffer.add(100, q1['id'], [q1['option_ids'][0]])
+        await buffer.discard(100)
+        buffer.add(100, q1['id'], [q1['option_ids'][1]])
+        buffer.add(200, q1['id'], [q1['option_ids'][0]])  # переполнение - сохранение в фоне
+        await buffer.stop()
+        return await saved_answers()
+
+    assert sorted(run_db(scenario())) == [(1, q1['id'], q1['option_ids'][1]), (2, q1['id'], q1['option_ids'][0])]
+
+
+def test_flush_inside_update_survives_handler_error(run_db, tmp_path):
+    questions = run_db(prepare())
+    q1 = questions[0]
+    buffer = AnswerBuffer(spool_file=str(tmp_path / 'pending.jsonl'))
+
+    async def scenario():
+        buffer.add(100, q1['id'], [q1['option_ids'][0]])
+        try:
+            async with unit_of_work():
+                assert await buffer.flush(100)
+                raise RuntimeError("ошибка отправки сообщения")
+        except RuntimeError:
+            pass
+        return await saved_answers()
+
+    assert run_db(scenario()) == [(1, q1['id'], q1['option_ids'][0])]
+    assert len(buffer) == 0
+
+
+def test_spool_file_removed_after_late_flush(run_db, tmp_path, monkeypatch):
+    questions = run_db(prepare())
+    q1 = questions[0]
+    spool_file = tmp_path / 'pending.jsonl'
+    spool_file.write_text(json.dumps([100, q1['id'], q1['option_ids'][0]]) + '\n', encoding='utf-8')
+    buffer = AnswerBuffer(spool_file=str(spool_file))
+
+    async def unavailable(answers, known_user_ids=None):
+        raise ConnectionError("БД недоступна")
+
+    async def scenario():
+        with monkeypatch.context() as patch:
+            patch.setattr(answer_buffer_module, 'bulk_save_answers', unavailable)
+            await buffer.start()  # БД недоступна при запуске
+        assert spool_file.exists()
+        assert await buffer.flush()  # например, периодическое сохранение
+        exists_after_flush = spool_file.exists()
+        await buffer.stop()
+        return exists_after_flush, await saved_answers()
+
+    exists_after_flush, saved = run_db(scenario())
+    assert not exists_after_flush
+    assert not spool_file.exists()
+    assert saved == [(1, q1['id'], q1['option_ids'][0])]
+
+
+def test_rejected_answer_does_not_block_others(run_db, tmp_path, monkeypatch):
+    questions = run_db(prepare())
+    q1 = questions[0]
+    bad_option_id = 999
+    buffer = AnswerBuffer(spool_file=str(tmp_path / 'pending.jsonl'))
+    save = answer_buffer_module.bulk_save_answers
+
+    async def rejecting(answers, known_user_ids=None):
+        # как внешний ключ PostgreSQL/MySQL на удаленный вариант ответа
+        if any(option_id == bad_option_id for _, _, option_id in answers):
+            raise IntegrityError("INSERT", {}, Exception("foreign key violation"))
+        return await save(answers, known_user_ids)
+
+    async def scenario():
+        buffer.add(100, q1['id'], [bad_option_id])
+        buffer.add(200, q1['id'], [q1['option_ids'][1]])
+        assert await buffer.flush()
+        return await saved_answers()
+
+    monkeypatch.setattr(answer_buffer_module, 'bulk_save_answers', rejecting)
+    assert run_db(scenario()) == [(2, q1['id'], q1['option_ids'][1])]
+    assert len(buffer) == 0
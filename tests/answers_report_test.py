@@ -0,0 +1,137 @@
+## -*- coding: utf-8 -*-
+
+import asyncio
+import csv
+import gzip
+import os
+import zipfile
+from datetime import datetime
+
+import pytest
+from openpyxl import load_workbook
+from sqlalchemy import update
+
+from app.database import requests as requests_module
+from app.database.models import UserAnswerOptions
+from app.database.requests import (add_questions_with_options, add_user, bulk_save_answers, get_user_answers_data,
+                                   load_questions, session_scope, upsert_user_score_by_telegram_id)
+from app.utils.report_writer import XlsxStreamWriter, split_for_telegram
+
+QUESTIONS = [
+    {'question': 'Какая у вас цель?', 'question_type': 'single_choice', 'options': ['Покупка жилья', 'Пенсия']},
+    {'question': 'Что для вас важно?', 'question_type': 'multiple_choice', 'options': ['Надежность', 'Доходность']},
+]
+
+
+def read_rows(filepath):
+    return [list(row) for row in load_workbook(filepath, read_only=True).active.iter_rows(values_only=True)]
+
+
+async def prepare():
+    await add_questions_with_options(QUESTIONS)
+    q1, q2 = await load_questions()
+    await add_user(100)
+    await add_user(200)
+    await bulk_save_answers([(100, q1['id'], q1['option_ids'][0]), (100, q2['id'], q2['option_ids'][0]),
+                             (100, q2['id'], q2['option_ids'][1]), (200, q1['id'], q1['option_ids'][1])])
+    await upsert_user_score_by_telegram_id(100, 17)
+    async with session_scope() as session:
+        await session.execute(update(UserAnswerOptions).values(created_at=datetime(2025, 3, 1, 12)))
+        await session.execute(update(UserAnswerOptions).where(UserAnswerOptions.user_id == 2)
+                              .values(created_at=datetime(2025, 3, 5, 8, 30)))
+
+
+def test_user_answers_report_streams_in_chunks(run_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(requests_module, 'REPORTS_DIR', str(tmp_path / 'reports'))
+    run_db(prepare())
+
+    filepath = run_db(get_user_answers_data('01.03.2025', '05.03.2025', chunk_size=2))
+    assert filepath == str(tmp_path / 'reports' / 'user_answers_20250301_20250306.xlsx')
+    assert read_rows(filepath) == [
+        ['Telegram ID', 'Question Text', 'Answer Option Text', 'Answered At', 'Score'],
+        [100, 'Какая у вас цель?', 'Покупка жилья', datetime(2025, 3, 1, 12), 17],
+        [100, 'Что для вас важно?', 'Надежность', datetime(2025, 3, 1, 12), 17],
+        [100, 'Что для вас важно?', 'Доходность', datetime(2025, 3, 1, 12), 17],
+        [200, 'Какая у вас цель?', 'Пенсия', datetime(2025, 3, 5, 8, 30), 0],
+    ]
+
+    filepath = run_db(get_user_answers_data('01.03.2025', '04.03.2025'))
+    assert len(read_rows(filepath)) == 4
+
+
+def test_stream_writer_skips_save_on_error(tmp_path):
+    filepath = str(tmp_path / 'broken.xlsx')
+
+    async def scenario():
+        async with XlsxStreamWriter(filepath, ['a', 'b']) as writer:
+            await writer.write([(1, 2), (3, 4)])
+            raise RuntimeError("ошибка чтения")
+
+    try:
+        asyncio.run(scenario())
+    except RuntimeError:
+        pass
+    assert not (tmp_path / 'broken.xlsx').exists()
+
+    async def complete():
+        async with XlsxStreamWriter(filepath, ['a', 'b'], title='Data') as writer:
+            await writer.write([(1, 2)])
+            await writer.write([(3, 4)])
+        return writer.rows_written
+
+    assert asyncio.run(complete()) == 2
+    assert read_rows(filepath) == [['a', 'b'], [1, 2], [3, 4]]
+
+
+def test_user_answers_report_csv_and_gzip(run_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(requests_module, 'REPORTS_DIR', str(tmp_path))
+    run_db(prepare())
+
+    filepath = run_db(get_user_answers_data('01.03.2025', '05.03.2025', chunk_size=2, report_format='csv'))
+    assert filepath == str(tmp_path / 'user_answers_20250301_20250306.csv')
+    with open(filepath, encoding='utf-8', newline='') as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ['Telegram ID', 'Question Text', 'Answer Option Text', 'Answered At', 'Score']
+    assert rows[1] == ['100', 'Какая у вас цель?', 'Покупка жилья', '2025-03-01 12:00:00', '17']
+    assert rows[-1] == ['200', 'Какая у вас цель?', 'Пенсия', '2025-03-05 08:30:00', '0']
+
+    gz_path = run_db(get_user_answers_data('01.03.2025', '05.03.2025', report_format='csv.gz'))
+    assert gz_path.endswith('.csv.gz')
+    with gzip.open(gz_path, 'rt', encoding='utf-8', newline='') as f:
+        assert list(csv.reader(f)) == rows
+    assert sorted(os.listdir(tmp_path)) == ['user_answers_20250301_20250306.csv', 'user_answers_20250301_20250306.csv.gz']
+    assert run_db(get_user_answers_data('01.03.2025', '05.03.2025', report_format='pdf')) is None
+
+
+def test_user_answers_report_parquet(run_db, tmp_path, monkeypatch):
+    pq = pytest.importorskip('pyarrow.parquet')
+    monkeypatch.setattr(requests_module, 'REPORTS_DIR', str(tmp_path))
+    run_db(prepare())
+
+    filepath = run_db(get_user_answers_data('01.03.2025', '05.03.2025', chunk_size=2, report_format='parquet'))
+    table = pq.read_table(filepath)
+    assert table.column_names == ['Telegram ID', 'Question Text', 'Answer Option Text', 'Answered At', 'Score']
+    assert table.column('Score').to_pylist() == [17, 17, 17, 0]
+    assert table.column('Answered At').to_pylist()[-1] == datetime(2025, 3, 5, 8, 30)
+
+
+def test_split_for_telegram(tmp_path):
+    small = tmp_path / 'small.xlsx'
+    small.write_bytes(b'x' * 10)
+    assert split_for_telegram(str(small), limit=10) == [str(small)]
+
+    # Несжатый CSV упаковывается в ZIP
+    report = tmp_path / 'report.csv'
+    report.write_text('Telegram ID,Score\n' + '100,17\n' * 1000, encoding='utf-8')
+    (archive,) = split_for_telegram(str(report), limit=1000)
+    assert archive == str(report) + '.zip'
+    with zipfile.ZipFile(archive) as zf:
+        assert zf.read('report.csv') == report.read_bytes()
+
+    # Сжатый формат делится на части, которые собираются обратно
+    data = os.urandom(2500)
+    big = tmp_path / 'big.parquet'
+    big.write_bytes(data)
+    parts = split_for_telegram(str(big), limit=1000)
+    assert [os.path.basename(part) for part in parts] == ['big.parquet.001', 'big.parquet.002', 'big.parquet.003']
+    assert b''.join(open(part, 'rb').read() for part in parts) == data
@@ -0,0 +1,69 @@
+## -*- coding: utf-8 -*-
+
+import asyncio
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import event
+
+# База данных для тестов: задается до импорта app.database, где создается движок
+os.environ["DB_TYPE"] = "sqlite"
+os.environ["SQLITE_FILE"] = os.path.join(tempfile.mkdtemp(), "test_bot.db")
+
+
+@pytest.fixture
+def run_db():
+    """
+    Пересоздает таблицы в тестовой БД и возвращает функцию run(coro),
+    которая выполняет корутину в новом цикле событий и закрывает соединения движка.
+    """
+    from app.database.database import engine
+    from app.database.models import Base
+    from app.utils.identity_cache import identity_cache
+
+    def run(coro):
+        async def wrapper():
+            try:
+                return await coro
+            finally:
+                await engine.dispose()
+        return asyncio.run(wrapper())
+
+    async def reset():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+
+    run(reset())
+    identity_cache.invalidate()  # id пользователей из прошлой БД
+    return run
+
+
+TRANSACTION_STATEMENTS = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE")
+
+
+@pytest.fixture
+def count_queries():
+    """
+    Возвращает функцию start(): она начинает запись SQL-запросов движка и возвращает список,
+    в который они попадают. Управление транзакциями (BEGIN, SAVEPOINT, ...) не записывается.
+    Слушатели событий снимаются в конце теста.
+    """
+    from app.database.database import engine
+    listeners = []
+
+    def start():
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if not statement.lstrip().upper().startswith(TRANSACTION_STATEMENTS):
+                statements.append(statement)
+
+        event.listen(engine.sync_engine, 'before_cursor_execute', record)
+        listeners.append(record)
+        return statements
+
+    yield start
+    for record in listeners:
+        event.remove(engine.sync_engine, 'before_cursor_execute', record)
@@ -0,0 +1,116 @@
+## -*- coding: utf-8 -*-
+
+import asyncio
+
+from sqlalchemy import event
+
+from app.database.database import engine
+from app.database.models import User, UserProfile, UserScore
+from app.database.requests import add_user, get_user_answers, get_user_id_by_telegram_id, has_rows
+from app.middlewares.db_session import DBSessionMiddleware
+
+
+def handle_update(run_db, handler):
+    """Обрабатывает апдейт через DBSessionMiddleware; возвращает (взятия соединения из пула, COMMIT, результат, uow)."""
+    checkouts, commits = [], []
+
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        checkouts.append(connection_record)
+
+    def on_commit(conn):
+        commits.append(conn)
+
+    async def scenario():
+        data = {}
+        result = await DBSessionMiddleware()(handler, None, data)
+        return result, data["uow"]
+
+    event.listen(engine.sync_engine, "checkout", on_checkout)
+    event.listen(engine.sync_engine, "commit", on_commit)
+    try:
+        result, uow = run_db(scenario())
+    finally:
+        event.remove(engine.sync_engine, "checkout", on_checkout)
+        event.remove(engine.sync_engine, "commit", on_commit)
+    return len(checkouts), len(commits), result, uow
+
+
+def test_one_checkout_per_update(run_db):
+    async def handler(event, data):
+        assert not data["uow"].acquired
+        assert await add_user(100)
+        user_id = await get_user_id_by_telegram_id(100)
+        return user_id, await get_user_answers(100)
+
+    checkouts, commits, result, uow = handle_update(run_db, handler)
+    assert checkouts == 1
+    assert result == (1, [])
+    assert uow.acquired is False  # соединение возвращено в пул
+    assert run_db(has_rows(User, User.telegram_id == 100))  # запись зафиксирована
+
+
+def test_no_checkout_without_queries(run_db):
+    async def handler(event, data):
+        return "ok"
+
+    checkouts, commits, result, uow = handle_update(run_db, handler)
+    assert (checkouts, commits, result) == (0, 0, "ok")
+
+
+def test_tasks_started_by_handler_use_own_sessions(run_db):
+    async def handler(event, data):
+        await add_user(100)
+        await add_user(200)
+        await data["uow"].commit()  # задачи читают в своих сессиях только зафиксированные изменения
+        # gather запускает задачи, которые не могут делить сессию апдейта
+        return await asyncio.gather(get_user_id_by_telegram_id(100), get_user_id_by_telegram_id(200))
+
+    checkouts, commits, result, uow = handle_update(run_db, handler)
+    assert result == [1, 2]
+    assert checkouts == 3
+
+
+def test_profile_and_score_in_one_commit(run_db):
+    async def handler(event, data):
+        uow = data["uow"]
+        await uow.profiles.upsert(100, 'Иван Петров', 'ivan@example.com', '+4917612345678', 'Berlin', 'student')
+        assert await uow.scores.upsert(100, 42)
+        assert not await uow.scores.upsert(999, 1)  # незарегистрированный пользователь
+        return await uow.answers.option_ids(100)
+
+    checkouts, commits, result, uow = handle_update(run_db, handler)
+    assert (checkouts, commits, result) == (1, 1, [])
+    assert run_db(has_rows(UserProfile, UserProfile.city == 'Berlin'))
+    assert run_db(has_rows(UserScore, UserScore.score == 42))
+
+
+def test_failed_handler_rolls_back_update(run_db):
+    async def handler(event, data):
+        uow = data["uow"]
+        await uow.profiles.upsert(100, 'Иван Петров', 'ivan@example.com', '+4917612345678', 'Berlin', 'student')
+        await uow.scores.upsert(100, 42)
+        raise ValueError("ошибка обработчика")
+
+    try:
+        handle_update(run_db, handler)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("исключение обработчика должно пробрасываться")
+    assert not run_db(has_rows(User, User.telegram_id == 100))
+    assert not run_db(has_rows(UserScore))
+
+
+def test_failed_helper_keeps_update_changes(run_db):
+    async def handler(event, data):
+        uow = data["uow"]
+        await uow.profiles.upsert(100, 'Иван Петров', 'ivan@example.com', '+4917612345678', 'Berlin', 'student')
+        # повторная регистрация нарушает уникальность telegram_id: откатывается только точка сохранения
+        assert not await add_user(100)
+        assert await uow.scores.upsert(100, 42)
+        return await get_user_id_by_telegram_id(100)
+
+    checkouts, commits, result, uow = handle_update(run_db, handler)
+    assert (checkouts, commits, result) == (1, 1, 1)
+    assert run_db(has_rows(UserProfile, UserProfile.city == 'Berlin'))
+    assert run_db(has_rows(UserScore, UserScore.score == 42))
@@ -0,0 +1,68 @@
+## -*- coding: utf-8 -*-
+
+import asyncio
+
+import pytest
+from sqlalchemy import text
+
+from app.database.database import ENGINE_PROFILES, create_engine_for_profile
+
+
+def sqlite_url(tmp_path):
+    return f"sqlite+aiosqlite:///{tmp_path / 'profile.db'}"
+
+
+async def pragmas(engine):
+    try:
+        async with engine.connect() as conn:
+            return [(await conn.execute(text(f"PRAGMA {name}"))).scalar()
+                    for name in ("journal_mode", "synchronous", "busy_timeout", "mmap_size")]
+    finally:
+        await engine.dispose()
+
+
+def test_sqlite_pragmas_and_pool(tmp_path):
+    engine = create_engine_for_profile(sqlite_url(tmp_path), "prod")
+    assert engine.echo is False
+    assert engine.pool.size() == ENGINE_PROFILES["prod"]["pool_size"]
+    # synchronous: 1 = NORMAL
+    assert asyncio.run(pragmas(engine)) == ["wal", 1, 10000, 256 * 1024 * 1024]
+
+    assert create_engine_for_profile(sqlite_url(tmp_path), "dev").echo is True
+
+
+def test_unknown_profile(tmp_path):
+    with pytest.raises(ValueError):
+        create_engine_for_profile(sqlite_url(tmp_path), "staging")
+
+
+def flaky_engine(tmp_path, monkeypatch, failures: int):
+    """Движок, у которого первые failures подключений завершаются временной ошибкой."""
+    monkeypatch.setitem(ENGINE_PROFILES, "test", {**ENGINE_PROFILES["prod"], "connect_retries": 2,
+                                                  "connect_backoff": 0.01})
+    engine = create_engine_for_profile(sqlite_url(tmp_path), "test")
+    dialect = engine.sync_engine.dialect
+    connect = dialect.connect
+    attempts = []
+
+    def flaky_connect(*args, **kwargs):
+        attempts.append(1)
+        if len(attempts) <= failures:
+            raise dialect.loaded_dbapi.OperationalError("database is temporarily unavailable")
+        return connect(*args, **kwargs)
+
+    monkeypatch.setattr(dialect, "connect", flaky_connect)
+    return engine, attempts
+
+
+def test_connect_retry_with_backoff(tmp_path, monkeypatch):
+    engine, attempts = flaky_engine(tmp_path, monkeypatch, failures=2)
+    assert asyncio.run(pragmas(engine))[0] == "wal"
+    assert len(attempts) == 3
+
+
+def test_connect_gives_up_after_retries(tmp_path, monkeypatch):
+    engine, attempts = flaky_engine(tmp_path, monkeypatch, failures=5)
+    with pytest.raises(Exception, match="temporarily unavailable"):
+        asyncio.run(pragmas(engine))
+    assert len(attempts) == 3
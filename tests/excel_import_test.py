@@ -0,0 +1,87 @@
+## -*- coding: utf-8 -*-
+
+import asyncio
+import os
+from io import BytesIO
+
+import pytest
+from openpyxl import Workbook
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.database.requests import load_questions
+from app.handlers.admin import import_excel_file
+from matrix_engine_test import QUESTIONS, write_matrix_file
+
+
+class FakeContext:
+    """JobContext без очереди: ход выполнения копится в списке, блокирующая работа - в потоке."""
+
+    def __init__(self):
+        self.messages = []
+
+    async def progress(self, text, force=False):
+        self.messages.append(text)
+
+    async def run_blocking(self, func, *args):
+        return await asyncio.to_thread(func, *args)
+
+
+def excel_bytes(rows):
+    wb = Workbook()
+    ws = wb.active
+    for row in rows:
+        ws.append(row)
+    buffer = BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('rows', [
+    [['Score', 'Text'], ['0-50', 'Низкий']],  # нет столбцов Баллы/Результат (KeyError)
+    [['Баллы', 'Результат'], [10, 'Низкий']],  # число вместо интервала (AttributeError)
+    [['Баллы', 'Результат'], ['0-50', 'Низкий'], ['40-100', 'Высокий']],  # пересечение (ValueError)
+])
+def test_malformed_shablon_is_rejected(tmp_path, monkeypatch, rows):
+    monkeypatch.chdir(tmp_path)
+    result = asyncio.run(import_excel_file(FakeContext(), excel_bytes(rows), 'shablon'))
+    assert result.text.startswith('Файл шаблонов отклонен')
+    assert os.listdir(tmp_path / 'quiz_data') == []  # временный файл удален, рабочий не создан
+
+
+def test_valid_shablon_is_saved(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rows = [['Баллы', 'Результат'], ['0-50', 'Низкий'], ['51-100', 'Высокий']]
+    result = asyncio.run(import_excel_file(FakeContext(), excel_bytes(rows), 'shablon'))
+    assert 'успешно' in result.text
+    assert os.listdir(tmp_path / 'quiz_data') == ['quiz_shablon.xlsx']
+
+
+def matrix_bytes(tmp_path):
+    path = tmp_path / 'source_matrix.xlsx'
+    write_matrix_file(path, QUESTIONS, seed=5)
+    return path.read_bytes()
+
+
+def test_matrix_is_imported_before_file_swap(tmp_path, monkeypatch, run_db):
+    data = matrix_bytes(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    result = run_db(import_excel_file(FakeContext(), data, 'matrix'))
+    assert 'успешно' in result.text
+    assert sorted(os.listdir(tmp_path / 'quiz_data')) == ['quiz_matrix.snapshot', 'quiz_matrix.xlsx']
+    assert [q['question'] for q in run_db(load_questions())] == [question for question, _ in QUESTIONS]
+
+
+def test_failed_matrix_import_keeps_working_file(tmp_path, monkeypatch, run_db):
+    data = matrix_bytes(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('quiz_data')
+    (tmp_path / 'quiz_data' / 'quiz_matrix.xlsx').write_bytes(b'old')
+
+    async def broken_replace(questions):
+        raise SQLAlchemyError('БД недоступна')
+
+    monkeypatch.setattr('app.handlers.admin.replace_questions_with_options', broken_replace)
+    with pytest.raises(SQLAlchemyError):
+        run_db(import_excel_file(FakeContext(), data, 'matrix'))
+    assert os.listdir(tmp_path / 'quiz_data') == ['quiz_matrix.xlsx']
+    assert (tmp_path / 'quiz_data' / 'quiz_matrix.xlsx').read_bytes() == b'old'
@@ -0,0 +1,84 @@
+## -*- coding: utf-8 -*-
+
+import asyncio
+
+from sqlalchemy import func, select
+
+from app.database.models import User
+from app.database.requests import add_user, get_or_create_user_id, session_manager
+from app.database.unit_of_work import unit_of_work
+from app.utils.identity_cache import UserIdentityCache, get_user_id, identity_cache
+
+
+async def users_count():
+    async with session_manager() as session:
+        return await session.scalar(select(func.count()).select_from(User))
+
+
+def test_get_or_create_user_id(run_db):
+    async def scenario():
+        await add_user(100)
+        existing = await get_or_create_user_id(100)
+        created = await get_or_create_user_id(200)
+        # одновременная регистрация одного пользователя не падает на уникальности telegram_id
+        concurrent = await asyncio.gather(*(get_or_create_user_id(300) for _ in range(10)))
+        return existing, created, concurrent, await users_count()
+
+    existing, created, concurrent, count = run_db(scenario())
+    assert existing == 1
+    assert created == 2
+    assert len(set(concurrent)) == 1 and concurrent[0] is not None
+    assert count == 3
+
+
+def test_start_costs_at_most_one_query(run_db, count_queries):
+    statements = count_queries()
+    first = run_db(get_user_id(500, create=True))
+    assert len(statements) == 1 and statements[0].startswith('INSERT')
+
+    statements.clear()
+    assert run_db(get_user_id(500, create=True)) == first
+    assert run_db(get_user_id(500)) == first
+    assert statements == []
+    assert identity_cache.hits == 2
+
+
+def test_unregistered_user_is_not_cached(run_db):
+    assert run_db(get_user_id(700)) is None
+    run_db(add_user(700))
+    assert run_db(get_user_id(700)) == 1
+
+
+def test_lru_and_ttl():
+    cache = UserIdentityCache(maxsize=2)
+    cache.put(1, 10)
+    cache.put(2, 20)
+    assert cache.get(1) == 10
+    cache.put(3, 30)  # вытесняет 2
+    assert cache.get(2) is None
+    assert cache.get_many([1, 2, 3]) == {1: 10, 3: 30}
+    assert cache.stats() == {"size": 2, "hits": 3, "misses": 2, "hit_rate": 0.6}
+
+    expired = UserIdentityCache(ttl=0)
+    expired.put(1, 10)
+    assert expired.get(1) is None
+    assert len(expired) == 0
+
+
+def test_user_created_in_failed_update_is_not_cached(run_db):
+    async def scenario():
+        try:
+            async with unit_of_work():
+                assert await get_user_id(800, create=True) == 1
+                assert identity_cache.get(800) is None  # до фиксации апдейта
+                raise RuntimeError("ошибка обработчика")
+        except RuntimeError:
+            pass
+        async with unit_of_work():
+            created = await get_user_id(900, create=True)
+        return created, await users_count()
+
+    created, count = run_db(scenario())
+    assert identity_cache.get(800) is None
+    assert identity_cache.get(900) == created
+    assert count == 1
@@ -0,0 +1,140 @@
+## -*- coding: utf-8 -*-
+
+import asyncio
+
+import pytest
+
+from app.database.models import JobStatus
+from app.database.requests import get_job
+from app.database.unit_of_work import unit_of_work
+from app.utils.jobs import JOB_HANDLERS, JobNotifier, JobQueue, JobResult, job_handler
+
+
+class RecordingNotifier(JobNotifier):
+    def __init__(self):
+        self.events = []
+
+    async def started(self, job, title):
+        self.events.append(('started', job.id, job.attempts))
+
+    async def progress(self, job, title, text):
+        self.events.append(('progress', job.id, text))
+
+    async def finished(self, job, title, result):
+        self.events.append(('finished', job.id, job.status, result))
+
+
+@pytest.fixture
+def test_jobs():
+    release = {}
+
+    @job_handler("test_echo", "Тест")
+    async def echo_job(ctx, value):
+        await ctx.progress(f"обработка {value}", force=True)
+        doubled = await ctx.run_blocking(lambda: value * 2)
+        return JobResult(f"результат {doubled}")
+
+    @job_handler("test_fail", "Тест с ошибкой")
+    async def fail_job(ctx):
+        raise ValueError("файл поврежден")
+
+    @job_handler("test_wait", "Долгий тест")
+    async def wait_job(ctx, name):
+        event = release.setdefault(name, asyncio.Event())
+        await event.wait()
+        return JobResult(name)
+
+    yield release
+    for kind in ("test_echo", "test_fail", "test_wait"):
+        JOB_HANDLERS.pop(kind, None)
+
+
+def test_jobs_run_in_background(run_db, test_jobs):
+    notifier = RecordingNotifier()
+    queue = JobQueue(workers=2, notifier=notifier)
+
+    async def scenario():
+        await queue.start()
+        ok = await queue.submit("test_echo", {"value": 21}, chat_id=1)
+        failed = await queue.submit("test_fail", chat_id=1)
+        await queue.join()
+        await queue.stop()
+        return await get_job(ok), await get_job(failed)
+
+    ok, failed = run_db(scenario())
+    assert (ok.status, ok.progress, ok.attempts) == (JobStatus.DONE, "обработка 21", 1)
+    assert (failed.status, failed.error) == (JobStatus.FAILED, "файл поврежден")
+    assert ('finished', ok.id, JobStatus.DONE, JobResult("результат 42")) in notifier.events
+    assert ('progress', ok.id, "обработка 21") in notifier.events
+    with pytest.raises(ValueError):
+        run_db(queue.submit("no_such_job"))
+
+
+def test_cancel_running_and_queued_jobs(run_db, test_jobs):
+    queue = JobQueue(workers=1)
+
+    async def scenario():
+        await queue.start()
+        running = await queue.submit("test_wait", {"name": "first"})
+        queued = await queue.submit("test_wait", {"name": "second"})
+        while running not in queue._running:
+            await asyncio.sleep(0.01)
+        assert await queue.cancel(queued)
+        assert await queue.cancel(running)
+        await queue.join()
+        assert not await queue.cancel(running)
+        await queue.stop()
+        return await get_job(running), await get_job(queued)
+
+    running, queued = run_db(scenario())
+    assert running.status == JobStatus.CANCELLED
+    assert (queued.status, queued.attempts) == (JobStatus.CANCELLED, 0)
+    assert "second" not in test_jobs  # отмененная задача не запускалась
+
+
+def test_interrupted_jobs_recovered_on_restart(run_db, test_jobs):
+    async def first_run():
+        queue = JobQueue(workers=1)
+        await queue.start()
+        job_id = await queue.submit("test_wait", {"name": "restart"})
+        while job_id not in queue._running:
+            await asyncio.sleep(0.01)
+        await queue.stop()  # остановка бота во время выполнения
+        return job_id, await get_job(job_id)
+
+    job_id, job = run_db(first_run())
+    assert job.status == JobStatus.RUNNING
+
+    notifier = RecordingNotifier()
+
+    async def second_run():
+        test_jobs["restart"] = asyncio.Event()
+        test_jobs["restart"].set()
+        queue = JobQueue(workers=1, notifier=notifier)
+        recovered = await queue.start()
+        await queue.join()
+        await queue.stop()
+        return recovered, await get_job(job_id)
+
+    recovered, job = run_db(second_run())
+    assert recovered == 1
+    assert (job.status, job.attempts) == (JobStatus.DONE, 2)
+    assert notifier.events[0] == ('started', job_id, 2)
+
+
+def test_job_submitted_inside_update_is_visible_to_workers(run_db, test_jobs):
+    queue = JobQueue(workers=1, notifier=RecordingNotifier())
+
+    async def scenario():
+        await queue.start()
+        async with unit_of_work():
+            job_id = await queue.submit("test_echo", {"value": 1}, chat_id=1)
+            # задача в отдельной сессии видит только зафиксированные записи, как и обработчик очереди
+            visible = await asyncio.create_task(get_job(job_id))
+        await queue.join()
+        await queue.stop()
+        return visible, await get_job(job_id)
+
+    visible, job = run_db(scenario())
+    assert visible is not None
+    assert job.status == JobStatus.DONE
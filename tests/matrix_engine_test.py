@@ -0,0 +1,130 @@
+## -*- coding: utf-8 -*-
+
+import asyncio
+import random
+
+from openpyxl import Workbook
+
+from app.utils.matrix import Matrix, ANSWER_COLUMN, BASE_SCORE_COLUMN
+
+
+def write_matrix_file(path, questions, seed=0, fractional=False):
+    """
+    Создает тестовый Excel-файл матрицы в формате quiz_matrix.xlsx.
+
+    questions: список кортежей (текст вопроса, [варианты ответов]).
+    """
+    rnd = random.Random(seed)
+    answers = [option for _, options in questions for option in options]
+
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['Матрица баллов'])
+    ws.append(['№', ANSWER_COLUMN, BASE_SCORE_COLUMN] + answers)
+    number = 1
+    for question, options in questions:
+        ws.append([None, question, None] + [None] * len(answers))
+        for option in options:
+            base = rnd.randint(-5, 20) + (rnd.choice([0, 0.5, 0.25]) if fractional else 0)
+            corrections = []
+            for other in answers:
+                if other != option and rnd.random() < 0.3:
+                    corrections.append(rnd.randint(-3, 3) + (0.1 if fractional else 0))
+                else:
+                    corrections.append(None)
+            ws.append([number, f' {option} ', base] + corrections)
+            number += 1
+    wb.save(path)
+    return answers
+
+
+QUESTIONS = [
+    ('Какая у вас цель?', ['Покупка жилья', 'Рост капитала', 'Пенсия']),
+    ('Ваш возраст?', ['До 35 лет', 'От 35 до 45 лет', 'Старше 45 лет']),
+    ('Сколько у вас детей?', ['Нет детей', '1 ребенок', '2 ребенка', '3 и более']),
+    ('Что для вас важно? (несколько вариантов ответа)', ['Надежность', 'Доходность', 'Ликвидность']),
+]
+
+
+def load_matrix(path):
+    matrix = Matrix(str(path))
+    asyncio.run(matrix.process_matrix_file(matrix.excel_file))
+    return matrix
+
+
+def test_compiled_scores_match_pandas(tmp_path):
+    path = tmp_path / 'quiz_matrix.xlsx'
+    answers = write_matrix_file(path, QUESTIONS, seed=1)
+    matrix = load_matrix(path)
+
+    rnd = random.Random(2)
+    for _ in range(200):
+        selected = rnd.sample(answers, rnd.randint(0, len(answers)))
+        expected = asyncio.run(matrix.calculate_points_pandas(selected))
+        assert asyncio.run(matrix.calculate_points(selected)) == expected
+
+
+def test_compiled_scores_match_pandas_fractional(tmp_path):
+    path = tmp_path / 'quiz_matrix.xlsx'
+    answers = write_matrix_file(path, QUESTIONS, seed=3, fractional=True)
+    matrix = load_matrix(path)
+
+    rnd = random.Random(4)
+    for _ in range(200):
+        selected = rnd.sample(answers, rnd.randint(1, len(answers)))
+        expected = asyncio.run(matrix.calculate_points_pandas(selected))
+        assert abs(asyncio.run(matrix.calculate_points(selected)) - expected) < 1e-9
+
+
+def test_unknown_and_repeated_answers(tmp_path):
+    path = tmp_path / 'quiz_matrix.xlsx'
+    write_matrix_file(path, QUESTIONS, seed=5)
+    matrix = load_matrix(path)
+
+    for selected in (['Неизвестный ответ'], ['Пенсия', 'Пенсия', '2 ребенка'], [], ['Надежность', 'Нет ответа']):
+        assert asyncio.run(matrix.calculate_points(selected)) == asyncio.run(matrix.calculate_points_pandas(selected))
+
+
+def test_incremental_score_matches_full_score(tmp_path):
+    path = tmp_path / 'quiz_matrix.xlsx'
+    write_matrix_file(path, QUESTIONS, seed=6)
+    model = load_matrix(path).model
+
+    rnd = random.Random(7)
+    for _ in range(50):
+        given, running = [], 0
+        for _, options in QUESTIONS:
+            new_answers = rnd.sample(options, rnd.randint(1, 2))
+            running += model.score_increment(given, new_answers)
+            given = given + new_answers
+            assert running == model.score(given)
+
+
+def test_score_by_option_ids(tmp_path):
+    questions = QUESTIONS + [('Есть ли у вас кредиты?', ['Да', 'Нет']), ('Есть ли у вас страховка?', ['Да', 'Нет'])]
+    path = tmp_path / 'quiz_matrix.xlsx'
+    write_matrix_file(path, questions, seed=8)
+    model = load_matrix(path).model
+
+    option_ids, next_id = {}, 100
+    for question, options in questions:
+        for option in options:
+            option_ids[(question, option)] = next_id
+            next_id += 1
+    bound = model.bind_option_ids([(option_id, question, option) for (question, option), option_id in option_ids.items()])
+    assert bound == len(option_ids)
+
+    # Для уникальных текстов подсчет по идентификаторам совпадает с подсчетом по текстам
+    rnd = random.Random(9)
+    for _ in range(50):
+        selected = [(question, rnd.choice(options)) for question, options in QUESTIONS]
+        ids = [option_ids[key] for key in selected]
+        assert model.score_ids(ids) == model.score([option for _, option in selected])
+        assert model.score_ids_batch([ids])[0] == model.score_ids(ids)
+
+    # Одинаковые тексты в разных вопросах соответствуют разным строкам матрицы
+    first = option_ids[('Есть ли у вас кредиты?', 'Да')]
+    second = option_ids[('Есть ли у вас страховка?', 'Да')]
+    assert model.option_index[first] != model.option_index[second]
+    assert model.score_ids([first]) == model.score(['Да'])
+    assert model.score_ids([second]) == model.base_scores[model.option_index[second]]
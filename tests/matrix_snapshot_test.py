@@ -0,0 +1,47 @@
+## -*- coding: utf-8 -*-
+
+import asyncio
+import os
+import random
+
+import numpy as np
+
+from app.utils.matrix import Matrix
+from app.utils.matrix_snapshot import snapshot_path
+from matrix_engine_test import QUESTIONS, write_matrix_file
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / 'quiz_matrix.xlsx')
+    answers = write_matrix_file(path, QUESTIONS, seed=7, fractional=True)
+
+    source = Matrix(path)
+    assert not asyncio.run(source.load_snapshot())
+    asyncio.run(source.process_matrix_file(path))
+    asyncio.run(source.save_snapshot())
+    assert os.path.exists(snapshot_path(path))
+
+    restored = Matrix(path)
+    assert asyncio.run(restored.load_snapshot())
+    assert restored.df is None
+    assert restored.model.answers == source.model.answers
+    assert restored.model.columns == source.model.columns
+    np.testing.assert_array_equal(restored.model.corrections, source.model.corrections)
+
+    rnd = random.Random(8)
+    for _ in range(50):
+        selected = rnd.sample(answers, rnd.randint(1, len(answers)))
+        assert asyncio.run(restored.calculate_points(selected)) == asyncio.run(source.calculate_points(selected))
+
+
+def test_stale_snapshot_is_ignored(tmp_path):
+    path = str(tmp_path / 'quiz_matrix.xlsx')
+    write_matrix_file(path, QUESTIONS, seed=7)
+    matrix = Matrix(path)
+    asyncio.run(matrix.process_matrix_file(path))
+    asyncio.run(matrix.save_snapshot())
+
+    write_matrix_file(path, QUESTIONS[:2], seed=9)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert not asyncio.run(Matrix(path).load_snapshot())
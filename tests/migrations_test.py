@@ -0,0 +1,78 @@
+## -*- coding: utf-8 -*-
+
+from sqlalchemy import inspect, insert, select, text
+
+from app.database.database import create_tables, engine
+from app.database.migrations import MIGRATIONS, run_migrations, schema_version
+from app.database.models import Base, User, UserScore
+
+HOT_PATH_INDEXES = {
+    'user_answer_options': {'ix_user_answer_options_user_id', 'ix_user_answer_options_created_at'},
+    'user_profiles': {'ix_user_profiles_user_id'},
+    'answer_options': {'ix_answer_options_question_id'},
+    'users': {'ix_users_created_at'},
+    'user_score': {'uq_user_score_user_id'},
+}
+
+
+def schema_indexes(conn):
+    inspector = inspect(conn)
+    return {table: {index['name'] for index in inspector.get_indexes(table)} for table in HOT_PATH_INDEXES}
+
+
+async def make_legacy_database():
+    """База в состоянии до миграций: таблицы без индексов и user_profiles.updated_at, дубликаты баллов."""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                await conn.run_sync(index.drop)
+        await conn.run_sync(schema_version.drop)
+        await conn.execute(text("ALTER TABLE user_profiles DROP COLUMN updated_at"))
+        await conn.execute(insert(User), [{'telegram_id': 100}, {'telegram_id': 200}])
+        await conn.execute(insert(UserScore), [{'user_id': 1, 'score': 5}, {'user_id': 1, 'score': 7},
+                                               {'user_id': 2, 'score': 3}])
+
+
+async def current_indexes():
+    async with engine.connect() as conn:
+        return await conn.run_sync(schema_indexes)
+
+
+async def migrate():
+    before = await current_indexes()
+    version = await run_migrations(engine)
+    again = await run_migrations(engine)
+    indexes = await current_indexes()
+    async with engine.connect() as conn:
+        scores = (await conn.execute(select(UserScore.user_id, UserScore.score).order_by(UserScore.user_id))).all()
+        applied = (await conn.scalars(select(schema_version.c.version))).all()
+        profile_columns = await conn.run_sync(
+            lambda sync_conn: {column['name'] for column in inspect(sync_conn).get_columns('user_profiles')})
+    return before, version, again, indexes, scores, applied, profile_columns
+
+
+def test_migrations_upgrade_legacy_database(run_db):
+    run_db(make_legacy_database())
+    before, version, again, indexes, scores, applied, profile_columns = run_db(migrate())
+
+    assert all(not (before[table] & names) for table, names in HOT_PATH_INDEXES.items())
+    assert version == again == MIGRATIONS[-1].version
+    assert all(names <= indexes[table] for table, names in HOT_PATH_INDEXES.items())
+    assert scores == [(1, 7), (2, 3)]  # остается последняя запись
+    assert applied == [migration.version for migration in MIGRATIONS]
+    assert 'updated_at' in profile_columns
+
+
+def test_fresh_database_is_migrated(run_db):
+    async def fresh():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await create_tables()
+        async with engine.connect() as conn:
+            return await conn.run_sync(schema_indexes), (await conn.scalars(select(schema_version.c.version))).all()
+
+    indexes, applied = run_db(fresh())
+    assert all(names <= indexes[table] for table, names in HOT_PATH_INDEXES.items())
+    assert applied == [migration.version for migration in MIGRATIONS]
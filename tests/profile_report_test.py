@@ -0,0 +1,54 @@
+## -*- coding: utf-8 -*-
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from openpyxl import load_workbook
+from sqlalchemy import update
+
+from app.config import ENCRIPTION_KEY
+from app.database import requests as requests_module
+from app.database.models import User
+from app.database.requests import add_new_user_profile, add_user, generate_user_profile_report, session_scope
+from app.utils.encripter import decrypt_columns, encrypt_message
+
+
+def read_rows(filepath):
+    return [list(row) for row in load_workbook(filepath, read_only=True).active.iter_rows(values_only=True)]
+
+
+async def prepare():
+    await add_new_user_profile(100, 'Иван Петров', 'ivan@example.com', '+4917612345678', 'Berlin', 'student')
+    await add_user(200)  # без профиля
+    await add_new_user_profile(300, 'Anna Schmidt', 'anna@example.com', '+4915112345678', 'München', 'worker')
+    async with session_scope() as session:
+        await session.execute(update(User).values(created_at=datetime(2025, 3, 1, 12)))
+        await session.execute(update(User).where(User.telegram_id == 300).values(created_at=datetime(2025, 4, 1, 10)))
+
+
+def test_decrypt_columns():
+    async def encrypt(values):
+        return [await encrypt_message(value, ENCRIPTION_KEY) for value in values]
+
+    row = [1] + asyncio.run(encrypt(['Иван', 'ivan@example.com'])) + [None]
+    assert decrypt_columns([row], (1, 2, 3), ENCRIPTION_KEY) == [[1, 'Иван', 'ivan@example.com', '']]
+
+
+def test_profile_report_pages_and_process_pool(run_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(requests_module, 'REPORTS_DIR', str(tmp_path))
+    run_db(prepare())
+
+    with ProcessPoolExecutor(2) as executor:
+        filepath = run_db(generate_user_profile_report('01.03.2025', '01.04.2025', page_size=1, executor=executor))
+    assert filepath == str(tmp_path / 'user_profiles_20250301_20250402.xlsx')
+    assert read_rows(filepath) == [
+        ['User ID', 'Telegram ID', 'Full Name', 'Email', 'Phone Number', 'City', 'Status in Germany',
+         'Registration Date'],
+        [1, 100, 'Иван Петров', 'ivan@example.com', '+4917612345678', 'Berlin', 'student', datetime(2025, 3, 1, 12)],
+        [2, 200, None, None, None, None, None, datetime(2025, 3, 1, 12)],  # пустые строки - пустые ячейки
+        [3, 300, 'Anna Schmidt', 'anna@example.com', '+4915112345678', 'München', 'worker', datetime(2025, 4, 1, 10)],
+    ]
+
+    filepath = run_db(generate_user_profile_report('01.03.2025', '31.03.2025'))
+    assert [row[1] for row in read_rows(filepath)[1:]] == [100, 200]
@@ -0,0 +1,41 @@
+## -*- coding: utf-8 -*-
+
+from app.database.requests import add_questions_with_options, load_questions
+from app.utils.question_catalog import get_question_catalog, bump_catalog_version
+
+QUESTIONS = [
+    {'question': 'Какая у вас цель?', 'question_type': 'single_choice', 'options': ['Покупка жилья', 'Пенсия']},
+    {'question': 'Что для вас важно? (несколько вариантов ответа)', 'question_type': 'multiple_choice',
+     'options': ['Надежность', 'Доходность', 'Ликвидность']},
+    {'question': 'Без вариантов?', 'question_type': 'single_choice', 'options': []},
+]
+
+
+def test_load_questions_single_query(run_db, count_queries):
+    run_db(add_questions_with_options(QUESTIONS))
+    statements = count_queries()
+    questions = run_db(load_questions())
+
+    assert len(statements) == 1
+    assert [q['question'] for q in questions] == [q['question'] for q in QUESTIONS]
+    assert [q['options'] for q in questions] == [q['options'] for q in QUESTIONS]
+    assert all(len(q['option_ids']) == len(q['options']) for q in questions)
+
+
+def test_catalog_is_cached_until_version_bump(run_db, count_queries):
+    bump_catalog_version()
+    run_db(add_questions_with_options(QUESTIONS[:2]))
+
+    catalog = run_db(get_question_catalog())
+    assert [q.text for q in catalog.questions] == [q['question'] for q in QUESTIONS[:2]]
+    assert [q.is_multiple_choice for q in catalog.questions] == [False, True]
+
+    statements = count_queries()
+    assert run_db(get_question_catalog()) is catalog
+    assert statements == []
+
+    run_db(add_questions_with_options(QUESTIONS[2:]))
+    bump_catalog_version()
+    reloaded = run_db(get_question_catalog())
+    assert reloaded.version > catalog.version
+    assert len(reloaded.questions) == 3
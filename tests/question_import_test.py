@@ -0,0 +1,36 @@
+## -*- coding: utf-8 -*-
+
+import pytest
+
+from app.database.requests import add_questions_with_options, load_questions, replace_questions_with_options
+
+OLD_QUESTIONS = [
+    {'question': 'Старый вопрос?', 'question_type': 'single_choice', 'options': ['Да', 'Нет']},
+]
+QUESTIONS = [
+    {'question': f'Вопрос {i}?', 'question_type': 'multiple_choice' if i % 5 == 0 else 'single_choice',
+     'options': [f'Ответ {i}.{j}' for j in range(4)]}
+    for i in range(1, 61)
+]
+
+
+def test_replace_questions_in_few_statements(run_db, count_queries):
+    run_db(add_questions_with_options(OLD_QUESTIONS))
+    statements = count_queries()
+    run_db(replace_questions_with_options(QUESTIONS))
+
+    # чтение прежних id, INSERT вопросов и вариантов, перенос ответов и 3 DELETE - без запросов на каждый вопрос
+    assert len(statements) <= 10
+    questions = run_db(load_questions())
+    assert [q['question'] for q in questions] == [q['question'] for q in QUESTIONS]
+    assert [q['options'] for q in questions] == [q['options'] for q in QUESTIONS]
+    assert [q['type'].value for q in questions] == [q['question_type'] for q in QUESTIONS]
+
+
+def test_failed_replace_keeps_old_questions(run_db):
+    run_db(add_questions_with_options(OLD_QUESTIONS))
+    broken = QUESTIONS[:3] + [{'question': 'Сломанный?', 'question_type': 'unknown', 'options': ['A']}]
+    with pytest.raises(ValueError):
+        run_db(replace_questions_with_options(broken))
+    questions = run_db(load_questions())
+    assert [(q['question'], q['options']) for q in questions] == [('Старый вопрос?', ['Да', 'Нет'])]
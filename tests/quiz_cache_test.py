@@ -0,0 +1,48 @@
+## -*- coding: utf-8 -*-
+
+import asyncio
+import os
+
+from app.utils.quiz_cache import QuizDataCache
+from matrix_engine_test import QUESTIONS, write_matrix_file
+
+
+def test_matrix_is_cached_until_file_changes(tmp_path):
+    path = str(tmp_path / 'quiz_matrix.xlsx')
+    write_matrix_file(path, QUESTIONS, seed=1)
+    cache = QuizDataCache()
+
+    first = asyncio.run(cache.get_matrix(path))
+    assert asyncio.run(cache.get_matrix(path)) is first
+
+    write_matrix_file(path, QUESTIONS[:2], seed=2)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    second = asyncio.run(cache.get_matrix(path))
+    assert second is not first
+
+    cache.invalidate('matrix')
+    assert asyncio.run(cache.get_matrix(path)) is not second
+
+
+def test_file_replaced_during_load_is_reloaded(tmp_path):
+    path = str(tmp_path / 'quiz_shablon.xlsx')
+    with open(path, 'w') as f:
+        f.write('v1')
+    cache = QuizDataCache()
+    loads = []
+
+    async def loader(p):
+        with open(p) as f:
+            content = f.read()
+        loads.append(content)
+        if len(loads) == 1:
+            # Файл заменяют, пока загружается прежнее содержимое
+            with open(p, 'w') as f:
+                f.write('version 2')
+        return content
+
+    assert asyncio.run(cache._get('shablon', path, loader)) == 'v1'
+    assert asyncio.run(cache._get('shablon', path, loader)) == 'version 2'
+    assert asyncio.run(cache._get('shablon', path, loader)) == 'version 2'
+    assert loads == ['v1', 'version 2']
@@ -0,0 +1,61 @@
+## -*- coding: utf-8 -*-
+
+from app.database.models import QuestionType
+from app.keyboards.user_keyboards import QuizKeyboardCache, create_keyboard, selected_mask
+from app.utils.question_catalog import CatalogQuestion
+
+SINGLE = CatalogQuestion(1, 'Какая у вас цель?', QuestionType.SINGLE_CHOICE, ('Покупка жилья', 'Пенсия'), (1, 2))
+MULTIPLE = CatalogQuestion(2, 'Что для вас важно?', QuestionType.MULTIPLE_CHOICE,
+                           ('Надежность', 'Доходность', 'Ликвидность'), (3, 4, 5))
+
+
+def test_selected_mask():
+    assert selected_mask([]) == 0
+    assert selected_mask({'0', '2'}) == 0b101
+
+
+def test_keyboards_match_create_keyboard():
+    cache = QuizKeyboardCache()
+    cache.prebuild(1, [SINGLE, MULTIPLE])
+
+    assert cache.get(1, SINGLE) == create_keyboard(SINGLE.options)
+    assert cache.get(1, SINGLE, {'1'}) == create_keyboard(SINGLE.options)  # single choice не отмечается
+    assert cache.get(1, MULTIPLE) == create_keyboard(MULTIPLE.options, True)
+    assert cache.get(1, MULTIPLE, {'0', '2'}) == create_keyboard(MULTIPLE.options, True, {'0', '2'})
+
+
+def test_keyboards_are_reused():
+    cache = QuizKeyboardCache()
+    cache.prebuild(1, [SINGLE, MULTIPLE])
+    assert len(cache) == 2
+
+    unselected = cache.get(1, MULTIPLE)
+    toggled = cache.get(1, MULTIPLE, {'1'})
+    assert cache.get(1, MULTIPLE, set()) is unselected
+    assert cache.get(1, MULTIPLE, ['1']) is toggled
+    assert len(cache) == 3
+
+
+def test_lru_eviction_and_version_change():
+    cache = QuizKeyboardCache(maxsize=2)
+    cache.prebuild(1, [MULTIPLE])
+
+    first = cache.get(1, MULTIPLE, {'0'})
+    cache.get(1, MULTIPLE, {'1'})
+    assert cache.get(1, MULTIPLE, {'0'}) is first  # '0' становится самым свежим
+    cache.get(1, MULTIPLE, {'2'})  # вытесняет '1'
+    assert cache.get(1, MULTIPLE, {'0'}) is first
+    assert len(cache) == 3
+
+    assert cache.get(2, MULTIPLE, {'0'}) is not first
+    assert len(cache) == 1
+
+
+def test_stale_version_keeps_current_keyboards():
+    cache = QuizKeyboardCache()
+    cache.prebuild(2, [SINGLE, MULTIPLE])
+    current = cache.get(2, MULTIPLE)
+
+    assert cache.get(1, MULTIPLE, {'0'}) == create_keyboard(MULTIPLE.options, True, {'0'})
+    assert cache.get(2, MULTIPLE) is current
+    assert len(cache) == 2
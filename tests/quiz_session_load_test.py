@@ -0,0 +1,144 @@
+## -*- coding: utf-8 -*-
+
+"""
+Нагрузочный тест опроса: тысячи пользователей одновременно проходят опрос
+через Dispatcher.feed_update, ответы Telegram API подменяются фиктивной сессией бота.
+Количество пользователей задается переменной окружения QUIZ_LOAD_USERS.
+"""
+
+import asyncio
+import itertools
+import os
+from collections import defaultdict
+from datetime import datetime
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import AnswerCallbackQuery, SendMessage
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+from sqlalchemy import func, select
+
+from app.database.database import engine
+from app.database.models import UserAnswerOptions
+from app.database.requests import add_questions_with_options, add_user, session_manager
+from app.handlers.user_test import user_test_router
+from app.utils.question_catalog import bump_catalog_version, get_question_catalog
+
+USERS = int(os.getenv("QUIZ_LOAD_USERS", "2000"))
+
+QUESTIONS = [
+    {'question': 'Какая у вас цель?', 'question_type': 'single_choice', 'options': ['Покупка жилья', 'Пенсия']},
+    {'question': 'Что для вас важно? (несколько вариантов ответа)', 'question_type': 'multiple_choice',
+     'options': ['Надежность', 'Доходность', 'Ликвидность']},
+    {'question': 'Ваш возраст?', 'question_type': 'single_choice', 'options': ['до 30', '30-50', 'старше 50']},
+]
+
+
+class FakeSession(BaseSession):
+    """Сессия бота без сети: запоминает отправленные сообщения по чатам."""
+
+    def __init__(self):
+        super().__init__()
+        self.sent = defaultdict(list)
+        self.message_ids = itertools.count(1)
+
+    async def make_request(self, bot, method, timeout=None):
+        await asyncio.sleep(0)  # переключение задач, как при реальном сетевом запросе
+        if isinstance(method, AnswerCallbackQuery):
+            return True
+        self.sent[method.chat_id].append(getattr(method, 'text', None))
+        if isinstance(method, SendMessage):
+            return Message(message_id=next(self.message_ids), date=datetime.now(),
+                           chat=Chat(id=method.chat_id, type='private'), text=method.text)
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+def callback_update(update_id: int, user_id: int, data: str) -> Update:
+    user = User(id=user_id, is_bot=False, first_name=f'user{user_id}')
+    message = Message(message_id=1, date=datetime.now(), chat=Chat(id=user_id, type='private'), text='-')
+    return Update(update_id=update_id, callback_query=CallbackQuery(
+        id=str(update_id), from_user=user, chat_instance=str(user_id), message=message, data=data))
+
+
+def user_clicks(user_id: int):
+    """Ответы пользователя: вариант первого вопроса, отметки второго и вариант третьего."""
+    first, third = user_id % 2, user_id % 3
+    toggles = [str(user_id % 3), str((user_id + 1) % 3)]
+    return ['start_test', f'option_{first}'] + [f'option_{key}' for key in toggles] + ['done', f'option_{third}']
+
+
+def expected_messages(user_id: int):
+    first, third = user_id % 2, user_id % 3
+    marked = sorted({user_id % 3, (user_id + 1) % 3})
+    return [
+        '1. Какая у вас цель?',
+        f"Вы выбрали: {QUESTIONS[0]['options'][first]}",
+        '2. Что для вас важно? (несколько вариантов ответа)',
+        None, None,  # обновления клавиатуры при отметке вариантов
+        marked,
+        '3. Ваш возраст?',
+        f"Вы выбрали: {QUESTIONS[2]['options'][third]}",
+        'Поздравляю, ваши первые результаты готовы!',
+    ]
+
+
+async def run_quiz_for_all_users(users_count: int, registered_count: int):
+    await add_questions_with_options(QUESTIONS)
+    bump_catalog_version()
+    await get_question_catalog()  # как при запуске бота
+    user_ids = list(range(1, users_count + 1))
+    for user_id in user_ids[:registered_count]:
+        await add_user(user_id)
+
+    session = FakeSession()
+    bot = Bot(token='42:TEST', session=session)
+    dp = Dispatcher(storage=MemoryStorage())
+    dp.include_router(user_test_router)
+    update_ids = itertools.count(1)
+
+    async def take_quiz(user_id: int):
+        for data in user_clicks(user_id):
+            await dp.feed_update(bot, callback_update(next(update_ids), user_id, data))
+
+    try:
+        await asyncio.gather(*(take_quiz(user_id) for user_id in user_ids))
+        async with session_manager() as db:
+            rows = await db.execute(select(UserAnswerOptions.user_id, func.count())
+                                    .group_by(UserAnswerOptions.user_id))
+            saved = dict(rows.all())
+    finally:
+        dp.sub_routers.remove(user_test_router)
+        user_test_router._parent_router = None
+    return session.sent, saved
+
+
+def check_messages(sent, users_count: int):
+    for user_id in range(1, users_count + 1):
+        messages = sent[user_id][:len(expected_messages(user_id))]
+        expected = expected_messages(user_id)
+        marked = expected.pop(5)
+        chosen = messages.pop(5)
+        assert messages == expected, user_id
+        assert sorted(QUESTIONS[1]['options'].index(name) for name in chosen.split(': \n')[1].split(', \n')) == marked
+
+
+def test_concurrent_quiz_sessions(run_db):
+    engine.echo = False
+    sent, saved = run_db(run_quiz_for_all_users(USERS, USERS))
+    check_messages(sent, USERS)
+    # По одному варианту на вопросы 1 и 3 и два варианта на вопрос 2, сохранены одним INSERT в конце опроса
+    assert saved == {user_id: 4 for user_id in range(1, USERS + 1)}
+
+
+def test_unregistered_users_take_quiz(run_db):
+    engine.echo = False
+    sent, saved = run_db(run_quiz_for_all_users(20, 10))
+    check_messages(sent, 20)
+    assert saved == {user_id: 4 for user_id in range(1, 11)}
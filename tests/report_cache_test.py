@@ -0,0 +1,170 @@
+## -*- coding: utf-8 -*-
+
+import asyncio
+import os
+from datetime import date, datetime
+
+from aiogram.exceptions import TelegramBadRequest
+from sqlalchemy import update
+
+from app.database import requests as requests_module
+from app.database.models import UserAnswerOptions
+from app.database.requests import (add_new_user_profile, add_questions_with_options, add_user, bulk_save_answers,
+                                   list_cached_reports, load_questions, save_cached_report, session_scope,
+                                   upsert_user_score_by_telegram_id)
+from app.utils import report_cache
+from app.utils.jobs import send_document
+from app.utils.report_cache import (ReportPrebuilder, clear_report_cache, evict_reports, find_cached_report,
+                                    get_report, remember_report_file_id, report_documents, standard_report_ranges)
+
+QUESTIONS = [{'question': 'Какая у вас цель?', 'question_type': 'single_choice', 'options': ['Покупка жилья', 'Пенсия']}]
+PERIOD = ('01.03.2025', '31.03.2025')
+
+
+async def prepare():
+    await add_questions_with_options(QUESTIONS)
+    (question,) = await load_questions()
+    for telegram_id in (100, 200):
+        await add_user(telegram_id)
+    await bulk_save_answers([(100, question['id'], question['option_ids'][0])])
+    async with session_scope() as session:
+        await session.execute(update(UserAnswerOptions).values(created_at=datetime(2025, 3, 1, 12)))
+    return question
+
+
+async def add_answer(question):
+    await bulk_save_answers([(200, question['id'], question['option_ids'][1])])
+    async with session_scope() as session:
+        await session.execute(update(UserAnswerOptions).values(created_at=datetime(2025, 3, 2, 12)))
+
+
+def test_report_cache_reuses_file_until_data_changes(run_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(requests_module, 'REPORTS_DIR', str(tmp_path))
+    question = run_db(prepare())
+
+    first = run_db(get_report('answers', *PERIOD))
+    assert not first.hit and os.path.exists(first.file_path)
+    run_db(remember_report_file_id(first.entry_id, 'file-1'))
+    again = run_db(get_report('answers', '1.3.2025', '31.03.2025'))
+    assert (again.hit, again.file_path, again.file_id) == (True, first.file_path, 'file-1')
+    assert run_db(find_cached_report('answers', *PERIOD)).file_id == 'file-1'
+
+    # Новый ответ и пересчет баллов меняют отметку данных: файл строится заново
+    run_db(add_answer(question))
+    assert run_db(find_cached_report('answers', *PERIOD)) is None
+    rebuilt = run_db(get_report('answers', *PERIOD))
+    assert (rebuilt.hit, rebuilt.file_id) == (False, None)
+    run_db(upsert_user_score_by_telegram_id(100, 42))
+    assert run_db(find_cached_report('answers', *PERIOD)) is None
+
+    # Одновременные запросы ждут одного построения
+    async def concurrent():
+        return await asyncio.gather(*(get_report('answers', *PERIOD) for _ in range(3)))
+
+    assert sorted(report.hit for report in run_db(concurrent())) == [False, True, True]
+    assert len(run_db(list_cached_reports())) == 1
+    assert report_cache._build_locks == {}
+
+    # Баллы пользователя без ответов за период отчет не затрагивают
+    run_db(add_user(300))
+    run_db(upsert_user_score_by_telegram_id(300, 7))
+    assert run_db(find_cached_report('answers', *PERIOD)) is not None
+
+
+def test_profile_report_cache_tracks_profile_updates(run_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(requests_module, 'REPORTS_DIR', str(tmp_path))
+
+    async def scenario():
+        await add_user(100)
+        await add_new_user_profile(100, 'Анна', 'anna@example.com', '+49', 'Berlin', 'student')
+        today = date.today().strftime('%d.%m.%Y')
+        built = await get_report('profile', today, today)
+        cached = await find_cached_report('profile', today, today)
+        await add_new_user_profile(100, 'Анна', 'anna@example.com', '+49', 'Hamburg', 'worker')
+        return built, cached, await find_cached_report('profile', today, today)
+
+    built, cached, after_update = run_db(scenario())
+    assert not built.hit and cached.hit and after_update is None
+
+
+def test_evict_reports_keeps_disk_budget(run_db, tmp_path):
+    async def scenario():
+        ids = []
+        for day in range(1, 5):
+            path = tmp_path / f'report_{day}.xlsx'
+            path.write_bytes(b'x' * 100)
+            ids.append(await save_cached_report('answers', date(2025, 3, day), date(2025, 3, day), 'w', str(path), 100))
+        os.remove(tmp_path / 'report_2.xlsx')
+        evicted = await evict_reports(max_bytes=250, keep=ids[0])
+        return ids, evicted, [entry.id for entry in await list_cached_reports()]
+
+    ids, evicted, remaining = run_db(scenario())
+    assert evicted == 2  # запись без файла и самый старый файл, кроме keep
+    assert remaining == [ids[0], ids[3]]
+    assert sorted(os.listdir(tmp_path)) == ['report_1.xlsx', 'report_4.xlsx']
+
+
+def test_parts_for_telegram_are_built_with_cached_report(run_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(requests_module, 'REPORTS_DIR', str(tmp_path))
+    monkeypatch.setattr(report_cache, 'TELEGRAM_DOCUMENT_LIMIT', 100)
+    run_db(prepare())
+    report = run_db(get_report('answers', *PERIOD, report_format='xlsx'))
+    parts = sorted(str(path) for path in tmp_path.glob('*.[0-9][0-9][0-9]'))
+    assert len(parts) > 1
+
+    (entry,) = run_db(list_cached_reports())
+    assert entry.file_size == os.path.getsize(report.file_path) + sum(os.path.getsize(part) for part in parts)
+
+    # Отправка берет готовые части, не деля файл заново
+    monkeypatch.setattr(report_cache, 'split_for_telegram', None)
+    assert run_db(report_documents(run_db(find_cached_report('answers', *PERIOD, 'xlsx')))) == parts
+
+
+def test_clear_report_cache(run_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(requests_module, 'REPORTS_DIR', str(tmp_path))
+    run_db(prepare())
+    report = run_db(get_report('answers', *PERIOD))
+
+    assert run_db(clear_report_cache()) == 1
+    assert not os.path.exists(report.file_path)
+    assert run_db(list_cached_reports()) == []
+    assert not run_db(get_report('answers', *PERIOD)).hit
+
+
+def test_standard_ranges_and_schedule():
+    assert standard_report_ranges(date(2026, 10, 18)) == [
+        ('17.10.2026', '17.10.2026'), ('11.10.2026', '17.10.2026'), ('01.10.2026', '17.10.2026')]
+    assert standard_report_ranges(date(2026, 11, 1))[2] == ('01.10.2026', '31.10.2026')
+    prebuilder = ReportPrebuilder(hour=3)
+    assert prebuilder.seconds_until_next_run(datetime(2026, 10, 18, 2, 30)) == 30 * 60
+    assert prebuilder.seconds_until_next_run(datetime(2026, 10, 18, 3, 0)) == 24 * 3600
+    assert set(report_cache.REPORT_GENERATORS) == {'answers', 'profile'}
+
+
+class FakeDocument:
+    def __init__(self, file_id):
+        self.file_id = file_id
+
+
+class FakeBot:
+    def __init__(self, valid_file_ids=()):
+        self.valid_file_ids = set(valid_file_ids)
+        self.sent = []
+
+    async def send_document(self, chat_id, document):
+        if isinstance(document, str):
+            if document not in self.valid_file_ids:
+                raise TelegramBadRequest(method=None, message="wrong file identifier")
+            self.sent.append(('file_id', document))
+        else:
+            self.sent.append(('upload', document.path))
+        return type('Message', (), {'document': FakeDocument('uploaded')})
+
+
+def test_send_document_prefers_file_id(tmp_path):
+    path = str(tmp_path / 'report.xlsx')
+    bot = FakeBot(valid_file_ids={'known'})
+    assert asyncio.run(send_document(bot, 1, path, 'known')) == 'known'
+    assert asyncio.run(send_document(bot, 1, path, 'expired')) == 'uploaded'
+    assert asyncio.run(send_document(bot, 1, path)) == 'uploaded'
+    assert bot.sent == [('file_id', 'known'), ('upload', path), ('upload', path)]
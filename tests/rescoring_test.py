@@ -0,0 +1,130 @@
+## -*- coding: utf-8 -*-
+
+import random
+
+from sqlalchemy import select
+
+from app.database.database import async_session_maker
+from app.database.models import UserScore, UserAnswerOptions, AnswerOption, User, Question, QuestionType
+from app.database.requests import (add_questions_with_options, get_user_answers, load_answer_option_keys, load_questions,
+                                   replace_questions_with_options)
+from app.utils.rescoring import rescore_all_users
+from matrix_engine_test import QUESTIONS, write_matrix_file, load_matrix
+
+
+async def fill_answers(users_count, seed):
+    """Создает пользователей со случайными ответами, возвращает {user_id: [тексты ответов]}."""
+    rnd = random.Random(seed)
+    questions = await load_questions()
+    answers = {}
+    async with async_session_maker() as session:
+        option_ids = {}
+        for option in (await session.scalars(select(AnswerOption))).all():
+            option_ids[(option.question_id, option.option_text)] = option.id
+        for n in range(users_count):
+            user = User(telegram_id=1000 + n)
+            session.add(user)
+            await session.flush()
+            answers[user.id] = []
+            for question in questions:
+                option_text = rnd.choice(question["options"])
+                session.add(UserAnswerOptions(user_id=user.id, question_id=question["id"],
+                                              answer_option_id=option_ids[(question["id"], option_text)]))
+                answers[user.id].append(option_text)
+        await session.commit()
+    return answers
+
+
+async def stored_scores():
+    async with async_session_maker() as session:
+        return dict((await session.execute(select(UserScore.user_id, UserScore.score))).all())
+
+
+def test_rescore_all_users(tmp_path, run_db):
+    path = str(tmp_path / 'quiz_matrix.xlsx')
+    write_matrix_file(path, QUESTIONS, seed=11)
+    matrix = load_matrix(path)
+    run_db(matrix.extract_questions())
+    run_db(add_questions_with_options(matrix.questions))
+    answers = run_db(fill_answers(25, seed=12))
+    matrix.model.bind_option_ids(run_db(load_answer_option_keys()))
+
+    progress = []
+
+    async def on_progress(processed, total, elapsed):
+        progress.append((processed, total))
+
+    result = run_db(rescore_all_users(matrix.model, batch_size=10, progress_callback=on_progress))
+    assert result["processed"] == 25
+    assert progress == [(10, 25), (20, 25), (25, 25)]
+
+    expected = {user_id: matrix.model.score(selected) for user_id, selected in answers.items()}
+    assert run_db(stored_scores()) == expected
+
+    # Повторный пересчет по другой матрице обновляет существующие записи
+    write_matrix_file(path, QUESTIONS, seed=13)
+    matrix = load_matrix(path)
+    matrix.model.bind_option_ids(run_db(load_answer_option_keys()))
+    run_db(rescore_all_users(matrix.model, batch_size=7))
+    expected = {user_id: matrix.model.score(selected) for user_id, selected in answers.items()}
+    assert run_db(stored_scores()) == expected
+
+
+def test_rescore_after_matrix_reupload(tmp_path, run_db):
+    path = str(tmp_path / 'quiz_matrix.xlsx')
+    write_matrix_file(path, QUESTIONS, seed=21)
+    matrix = load_matrix(path)
+    run_db(matrix.extract_questions())
+    run_db(replace_questions_with_options(matrix.questions))
+    answers = run_db(fill_answers(10, seed=22))
+
+    # Вопросы переставлены, один вопрос и вариант "Пенсия" удалены, добавлен новый вариант
+    changed = [QUESTIONS[1], ('Какая у вас цель?', ['Покупка жилья', 'Рост капитала', 'Образование детей']),
+               QUESTIONS[3]]
+    write_matrix_file(path, changed, seed=23)
+    matrix = load_matrix(path)
+    run_db(matrix.extract_questions())
+    run_db(replace_questions_with_options(matrix.questions))
+    matrix.model.bind_option_ids(run_db(load_answer_option_keys()))
+
+    result = run_db(rescore_all_users(matrix.model, batch_size=4))
+    kept_options = {option for _, options in changed for option in options}
+    kept = {user_id: [option for option in selected if option in kept_options] for user_id, selected in answers.items()}
+    assert result["processed"] == sum(1 for selected in kept.values() if selected)
+    expected = {user_id: matrix.model.score(selected) for user_id, selected in kept.items() if selected}
+    assert run_db(stored_scores()) == expected
+
+    # Ответы пользователя ссылаются на варианты новой матрицы
+    user_answers = run_db(get_user_answers(1000))
+    assert sorted(text for _, _, text in user_answers) == sorted(kept[min(answers)])
+
+
+async def add_unbound_answer(user_id):
+    """Добавляет пользователю ответ на вариант, которого нет в матрице."""
+    async with async_session_maker() as session:
+        question = Question(question_text='Вопрос не из матрицы?', type=QuestionType.SINGLE_CHOICE)
+        session.add(question)
+        await session.flush()
+        option = AnswerOption(question_id=question.id, option_text='Вариант не из матрицы')
+        session.add(option)
+        await session.flush()
+        session.add(UserAnswerOptions(user_id=user_id, question_id=question.id, answer_option_id=option.id))
+        await session.commit()
+
+
+def test_rescore_skips_users_with_unbound_answers(tmp_path, run_db):
+    path = str(tmp_path / 'quiz_matrix.xlsx')
+    write_matrix_file(path, QUESTIONS, seed=31)
+    matrix = load_matrix(path)
+    run_db(matrix.extract_questions())
+    run_db(add_questions_with_options(matrix.questions))
+    answers = run_db(fill_answers(6, seed=32))
+    unbound_user = min(answers)
+    run_db(add_unbound_answer(unbound_user))
+    matrix.model.bind_option_ids(run_db(load_answer_option_keys()))
+
+    result = run_db(rescore_all_users(matrix.model, batch_size=4))
+    assert result["processed"] == 5
+    assert result["skipped"] == 1
+    expected = {user_id: matrix.model.score(selected) for user_id, selected in answers.items() if user_id != unbound_user}
+    assert run_db(stored_scores()) == expected
@@ -0,0 +1,61 @@
+## -*- coding: utf-8 -*-
+
+import asyncio
+
+import pytest
+from openpyxl import Workbook
+
+from app.utils.shablon import Shablon
+
+
+def write_shablon_file(path, bands):
+    """Создает тестовый Excel-файл шаблонов: bands - список пар (интервал, результат)."""
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['Баллы', 'Результат'])
+    for interval, result in bands:
+        ws.append([interval, result])
+    wb.save(path)
+
+
+def load_shablon(path):
+    shablon = Shablon(str(path))
+    asyncio.run(shablon.process_shablon_file())
+    asyncio.run(shablon.extract_shablon_data())
+    return shablon
+
+
+def test_lookup_on_band_edges(tmp_path):
+    path = tmp_path / 'quiz_shablon.xlsx'
+    write_shablon_file(path, [('51 - 100', 'Средний'), ('0-50', 'Низкий'), ('101-150', 'Высокий')])
+    shablon = load_shablon(path)
+
+    assert [res['score_start'] for res in shablon.data] == [0, 51, 101]
+    for score, expected in [(0, 'Низкий'), (50, 'Низкий'), (50.5, None), (51, 'Средний'),
+                            (100, 'Средний'), (150, 'Высокий'), (-1, None), (151, None)]:
+        assert asyncio.run(shablon.get_shablon(score)) == expected
+
+    ids = asyncio.run(shablon.get_shablon_ids([-1, 0, 50, 50.5, 51, 150, 151, float('nan')]))
+    assert ids.tolist() == [-1, 0, 0, -1, 1, 2, -1, -1]
+
+
+def test_shared_edges_belong_to_next_band(tmp_path):
+    path = tmp_path / 'quiz_shablon.xlsx'
+    write_shablon_file(path, [('0-50', 'Низкий'), ('50-100', 'Высокий')])
+    shablon = load_shablon(path)
+
+    assert asyncio.run(shablon.get_shablon(50)) == 'Высокий'
+    assert asyncio.run(shablon.get_shablon(100)) == 'Высокий'
+    assert asyncio.run(shablon.get_shablon_ids([49.5, 50, 100])).tolist() == [0, 1, 1]
+
+
+@pytest.mark.parametrize('bands', [
+    [('0-50', 'Низкий'), ('40-100', 'Высокий')],
+    [('0-50', 'Низкий'), ('60-100', 'Высокий')],
+    [('50-0', 'Низкий')],
+])
+def test_invalid_bands_are_rejected(tmp_path, bands):
+    path = tmp_path / 'quiz_shablon.xlsx'
+    write_shablon_file(path, bands)
+    with pytest.raises(ValueError):
+        load_shablon(path)
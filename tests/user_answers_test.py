@@ -0,0 +1,45 @@
+## -*- coding: utf-8 -*-
+
+from app.database.requests import (add_questions_with_options, add_user, bulk_save_answers, get_user_answers,
+                                   get_users_answers, load_questions)
+
+QUESTIONS = [
+    {'question': 'Какая у вас цель?', 'question_type': 'single_choice', 'options': ['Покупка жилья', 'Пенсия']},
+    {'question': 'Что для вас важно?', 'question_type': 'multiple_choice',
+     'options': ['Надежность', 'Доходность', 'Ликвидность']},
+]
+
+
+async def prepare():
+    await add_questions_with_options(QUESTIONS)
+    q1, q2 = await load_questions()
+    for telegram_id in (100, 200, 300):
+        await add_user(telegram_id)
+    # ответы сохраняются не по порядку вопросов
+    await bulk_save_answers([
+        (100, q2['id'], q2['option_ids'][2]), (100, q2['id'], q2['option_ids'][0]),
+        (100, q1['id'], q1['option_ids'][1]),
+        (200, q1['id'], q1['option_ids'][0]),
+    ])
+    return q1, q2
+
+
+def test_user_answers_single_query(run_db, count_queries):
+    q1, q2 = run_db(prepare())
+    statements = count_queries()
+
+    answers = run_db(get_user_answers(100))
+    assert len(statements) == 1
+    assert answers == [
+        (q1['id'], q1['option_ids'][1], 'Пенсия'),
+        (q2['id'], q2['option_ids'][2], 'Ликвидность'),
+        (q2['id'], q2['option_ids'][0], 'Надежность'),
+    ]
+    assert run_db(get_user_answers(300)) == []
+    assert run_db(get_user_answers(999)) == []
+
+
+def test_users_answers_batch(run_db):
+    run_db(prepare())
+    single = {telegram_id: run_db(get_user_answers(telegram_id)) for telegram_id in (100, 200)}
+    assert run_db(get_users_answers([100, 200, 300, 999, 100], batch_size=2)) == single